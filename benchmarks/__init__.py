@@ -0,0 +1,27 @@
+"""
+Benchmarks for pytss.
+
+Run them from the top of the source tree with
+
+    python -m benchmarks run -o results.json
+
+By default they run against the software TPM (PYTSS_BACKEND=soft) with no
+emulated latency, so the figures measure the Python side of the library.
+--backend libtspi runs them against a real TSS, and --trace records that run
+so it can later be repeated with --backend replay --trace. Every benchmark
+makes a fixed number of calls, so a recorded run replays exactly.
+
+Results are written as JSON. Keep baselines under benchmarks/baselines and
+compare a run against one with
+
+    python -m benchmarks compare benchmarks/baselines/soft.json results.json
+
+which lists every benchmark whose median moved by more than the noise
+threshold and exits with status 1 if any got slower. The baseline shipped
+in benchmarks/baselines/soft.json records the machine it was taken on in
+its meta section; regenerate it with the run command above before
+comparing on different hardware. The meta section also lists the
+benchmarks that were skipped and why. The shipped baseline was taken
+without M2Crypto, so it has no figures for the M2Crypto verification
+paths.
+"""
@@ -0,0 +1,82 @@
+"""
+Command line entry point: python -m benchmarks {run,compare,list}
+"""
+
+import argparse
+import os
+import sys
+
+from benchmarks import harness
+
+
+def _run(args):
+    os.environ['PYTSS_BACKEND'] = args.backend
+    if args.backend == 'soft':
+        os.environ.setdefault('PYTSS_SOFT_LATENCY', '0')
+    if args.trace is not None:
+        if args.backend == 'replay':
+            os.environ['PYTSS_REPLAY'] = args.trace
+        else:
+            os.environ['PYTSS_RECORD'] = args.trace
+    elif args.backend == 'replay':
+        sys.exit('--backend replay needs --trace')
+
+    # Registers the benchmarks, and must come after the backend is chosen
+    import benchmarks.cases
+    results = harness.run(args.filter, args.repeat, args.backend)
+    if args.output is not None:
+        harness.save(results, args.output)
+
+
+def _compare(args):
+    rows = harness.compare(harness.load(args.baseline),
+                           harness.load(args.current), args.threshold)
+    if not harness.report(rows):
+        sys.exit(1)
+
+
+def _list(args):
+    import benchmarks.cases
+    for bench in harness.benchmarks(args.filter):
+        print('%-32s %s' % (bench.name, bench.group or ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('-o', '--output', help='write the results to this file')
+    run.add_argument('-k', '--filter',
+                     help='only run benchmarks whose name contains this')
+    run.add_argument('--repeat', type=int,
+                     help='override the number of rounds')
+    run.add_argument('--backend', default='soft',
+                     choices=('soft', 'libtspi', 'replay'),
+                     help='the tss_lib backend, soft by default')
+    run.add_argument('--trace',
+                     help='record the Tspi_ calls to this trace, or replay '
+                          'them from it with --backend replay')
+    run.set_defaults(func=_run)
+
+    compare = commands.add_parser('compare',
+                                  help='compare results against a baseline')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float,
+                         default=harness.DEFAULT_THRESHOLD,
+                         help='relative change treated as noise, %.2f by '
+                              'default' % harness.DEFAULT_THRESHOLD)
+    compare.set_defaults(func=_compare)
+
+    listing = commands.add_parser('list', help='list the benchmarks')
+    listing.add_argument('-k', '--filter')
+    listing.set_defaults(func=_list)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+The benchmarks
+
+TSS objects are shared through a single Session created on first use, so
+that every run issues the same sequence of Tspi_ calls.
+"""
+
+import os
+import subprocess
+import sys
+import uuid
+
+from benchmarks.harness import SkipBenchmark, benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WELL_KNOWN_SECRET = bytearray(20)
+SRK_UUID = uuid.UUID('{00000000-0000-0000-0000-000000000001}')
+QUOTE_PCRS = [0, 1, 2, 3, 4, 5, 6, 7]
+
+
+def _attestationutils(m2crypto=False):
+    try:
+        import pytss.attestationutils
+        # Only imported by the functions that use it
+        if m2crypto:
+            import M2Crypto
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    return pytss.attestationutils
+
+
+class Session(object):
+    """A connected context with an SRK, an AIK and a quote"""
+
+    _instance = None
+
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        import pytss
+        from pytss.tspi_defines import (TSS_KEY_SIZE_2048,
+                                        TSS_KEY_TYPE_IDENTITY,
+                                        TSS_KEY_TYPE_LEGACY,
+                                        TSS_PCRS_STRUCT_INFO,
+                                        TSS_POLICY_USAGE, TSS_PS_TYPE_SYSTEM,
+                                        TSS_SECRET_MODE_SHA1)
+
+        self.context = pytss.TspiContext()
+        self.context.connect()
+        self.tpm = self.context.get_tpm_object()
+
+        self.srk = self.context.load_key_by_uuid(TSS_PS_TYPE_SYSTEM,
+                                                 SRK_UUID)
+        policy = self.srk.get_policy_object(TSS_POLICY_USAGE)
+        policy.set_secret(TSS_SECRET_MODE_SHA1, WELL_KNOWN_SECRET)
+        tpmpolicy = self.context.create_policy(TSS_POLICY_USAGE)
+        tpmpolicy.assign(self.tpm)
+        tpmpolicy.set_secret(TSS_SECRET_MODE_SHA1, WELL_KNOWN_SECRET)
+
+        pcakey = self.context.create_rsa_key(TSS_KEY_TYPE_LEGACY |
+                                             TSS_KEY_SIZE_2048)
+        pcakey.set_modulus(bytearray([0xff] * 256))
+        aik = self.context.create_rsa_key(TSS_KEY_TYPE_IDENTITY |
+                                          TSS_KEY_SIZE_2048)
+        self.tpm.collate_identity_request(self.srk, pcakey, aik)
+        self.aikpub = aik.get_pubkeyblob()
+        self.aik = self.context.load_key_by_blob(self.srk, aik.get_keyblob())
+
+        self.pcrs = self.context.create_pcrs(TSS_PCRS_STRUCT_INFO)
+        self.pcrs.set_pcrs(QUOTE_PCRS)
+        self.quote = self.tpm.get_quote(self.aik, self.pcrs, b'benchmark')
+        self.pcrvalues = self.pcrs.get_pcrs()
+        self.sealed = self.srk.seal(bytearray(64))
+
+
+def _import_time(module):
+    code = ('import time; start = time.perf_counter(); import %s; '
+            'print(time.perf_counter() - start)' % module)
+    env = dict(os.environ)
+    # Never let the child overwrite a trace being recorded
+    env.pop('PYTSS_RECORD', None)
+
+    def measure(round):
+        out = subprocess.check_output([sys.executable, '-c', code],
+                                      cwd=ROOT, env=env)
+        return float(out.decode().strip().splitlines()[-1])
+    measure.rounds = True
+    return measure
+
+
+@benchmark(repeat=10, group='import')
+def import_pytss():
+    return _import_time('pytss')
+
+
+@benchmark(repeat=10, group='import')
+def import_attestationutils():
+    env = dict(os.environ)
+    env.pop('PYTSS_RECORD', None)
+    try:
+        subprocess.check_output([sys.executable, '-c',
+                                 'import pytss.attestationutils'],
+                                cwd=ROOT, env=env, stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        raise SkipBenchmark(e.output.decode().strip().splitlines()[-1])
+    return _import_time('pytss.attestationutils')
+
+
+@benchmark(number=1000, group='marshalling')
+def c_byte_array_256():
+    from pytss import _c_byte_array
+    data = bytearray(os.urandom(256))
+    return lambda: _c_byte_array(data)
+
+
+@benchmark(number=100, group='marshalling')
+def c_byte_array_4096():
+    from pytss import _c_byte_array
+    data = bytearray(os.urandom(4096))
+    return lambda: _c_byte_array(data)
+
+
+@benchmark(number=100, group='marshalling')
+def get_pubkeyblob():
+    session = Session.get()
+    return session.aik.get_pubkeyblob
+
+
+@benchmark(number=50, group='tss')
+def get_pcrs():
+    session = Session.get()
+    return session.pcrs.get_pcrs
+
+
+@benchmark(number=20, group='tss')
+def seal():
+    session = Session.get()
+    data = bytearray(64)
+    return lambda: session.srk.seal(data)
+
+
+@benchmark(number=20, group='tss')
+def unseal():
+    session = Session.get()
+    return lambda: session.srk.unseal(session.sealed)
+
+
+@benchmark(number=20, group='tss')
+def get_quote():
+    session = Session.get()
+    return lambda: session.tpm.get_quote(session.aik, session.pcrs,
+                                         b'benchmark')
+
+
+@benchmark(number=100, group='attestation')
+def quote_verify():
+    attestationutils = _attestationutils(m2crypto=True)
+    session = Session.get()
+    data, validation = session.quote
+    return lambda: attestationutils.quote_verify(data, validation,
+                                                 session.aik,
+                                                 session.pcrvalues)
+
+
+@benchmark(number=20, group='attestation')
+def generate_challenge():
+    attestationutils = _attestationutils(m2crypto=True)
+    session = Session.get()
+    ekcert = attestationutils.get_ekcert(session.context)
+    secret = bytearray(16)
+    return lambda: attestationutils.generate_challenge(
+        session.context, ekcert, session.aikpub, secret)
+
+
+@benchmark(number=20, group='attestation')
+def verify_ek():
+    attestationutils = _attestationutils(m2crypto=True)
+    session = Session.get()
+    ekcert = attestationutils.get_ekcert(session.context)
+    return lambda: attestationutils.verify_ek(session.context, ekcert)
+
+
+@benchmark(number=1000, group='padding')
+def mgf1():
+    attestationutils = _attestationutils()
+    seed = bytearray(20)
+    return lambda: attestationutils.mgf1(seed, 235)
+
+
+@benchmark(number=200, group='padding')
+def tpm_oaep():
+    attestationutils = _attestationutils()
+    plaintext = bytearray(36)
+    return lambda: attestationutils.tpm_oaep(plaintext, 256)
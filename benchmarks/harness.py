@@ -0,0 +1,241 @@
+"""
+Timing, storage and comparison of benchmark results
+"""
+
+import datetime
+import json
+import platform
+import sys
+import time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+DEFAULT_THRESHOLD = 0.10
+
+_registry = []
+
+
+class SkipBenchmark(Exception):
+    """Raised by a benchmark's setup when it cannot run here"""
+
+
+class Benchmark(object):
+    def __init__(self, name, setup, number, repeat, group):
+        self.name = name
+        self.setup = setup
+        self.number = number
+        self.repeat = repeat
+        self.group = group
+
+
+def benchmark(number=100, repeat=5, group=None):
+    """
+    Register a benchmark
+
+    The decorated function performs any setup and returns a callable taking
+    no arguments, which is timed number times in each of repeat rounds. It
+    may instead return a callable taking the round number and returning the
+    measured time per call in seconds, for benchmarks timed out of process.
+
+    :param number: The number of calls per round
+    :param repeat: The number of rounds
+    :param group: An optional group name for listing
+    """
+    def register(setup):
+        _registry.append(Benchmark(setup.__name__, setup, number, repeat,
+                                   group))
+        return setup
+
+    return register
+
+
+def benchmarks(pattern=None):
+    """
+    List the registered benchmarks
+
+    :param pattern: Only return benchmarks whose name contains pattern
+    """
+    return [b for b in _registry if pattern is None or pattern in b.name]
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def summarize(times):
+    """
+    Summarise the per-call time of each round
+
+    :param times: A list of per-call times in seconds
+
+    :returns: A dict of summary statistics
+    """
+    mean = sum(times) / len(times)
+    variance = sum((t - mean) ** 2 for t in times) / len(times)
+    return {
+        'times': times,
+        'min': min(times),
+        'max': max(times),
+        'mean': mean,
+        'median': _median(times),
+        'stdev': variance ** 0.5,
+    }
+
+
+def run_benchmark(bench, repeat=None):
+    """
+    Time a single benchmark
+
+    :param bench: The Benchmark to run
+    :param repeat: Override the number of rounds
+
+    :returns: A dict of results, or of the reason it was skipped
+    """
+    try:
+        func = bench.setup()
+    except SkipBenchmark as e:
+        return {'skipped': str(e)}
+
+    timed_out_of_process = getattr(func, 'rounds', False)
+    times = []
+    for i in range(repeat or bench.repeat):
+        if timed_out_of_process:
+            times.append(func(i))
+            continue
+        start = _clock()
+        for _ in range(bench.number):
+            func()
+        times.append((_clock() - start) / bench.number)
+
+    result = summarize(times)
+    result['number'] = 1 if timed_out_of_process else bench.number
+    return result
+
+
+def metadata(backend):
+    import pytss.__about__ as about
+    return {
+        'date': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_implementation() + ' ' +
+        platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'backend': backend,
+        'pytss': about.__version__,
+    }
+
+
+def run(pattern=None, repeat=None, backend=None, out=sys.stdout):
+    """
+    Run the registered benchmarks
+
+    :param pattern: Only run benchmarks whose name contains pattern
+    :param repeat: Override the number of rounds of every benchmark
+    :param backend: The backend name to record in the results
+    :param out: A file to report progress to
+
+    :returns: A dict of metadata and results, as stored in JSON
+    """
+    results = {}
+    for bench in benchmarks(pattern):
+        result = run_benchmark(bench, repeat)
+        results[bench.name] = result
+        if 'skipped' in result:
+            out.write('%-32s skipped: %s\n' % (bench.name, result['skipped']))
+        else:
+            out.write('%-32s %12s  +- %s\n' % (
+                bench.name, format_time(result['median']),
+                format_time(result['stdev'])))
+        out.flush()
+    meta = metadata(backend)
+    # Make skipped cases visible without reading every result
+    meta['skipped'] = dict((name, result['skipped'])
+                           for name, result in results.items()
+                           if 'skipped' in result)
+    return {'meta': meta, 'results': results}
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds >= 1.0 / scale:
+            return '%.3f %s' % (seconds * scale, unit)
+    return '%.1f ns' % (seconds * 1e9)
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two sets of results
+
+    A benchmark counts as changed when its median moved by more than
+    threshold relative to the baseline, and by more than the spread of
+    either run, so noisy benchmarks need a larger move to be flagged.
+
+    :param baseline: Results as returned by run or load
+    :param current: Results to compare against the baseline
+    :param threshold: The relative change treated as noise
+
+    :returns: A list of (name, baseline median, current median, ratio,
+        status) tuples, where status is 'slower', 'faster', 'same',
+        'new', 'missing' or 'skipped'
+    """
+    old = baseline['results']
+    new = current['results']
+    rows = []
+    for name in sorted(set(old) | set(new)):
+        before = old.get(name)
+        after = new.get(name)
+        if before is None:
+            rows.append((name, None, None, None, 'new'))
+            continue
+        if after is None:
+            rows.append((name, None, None, None, 'missing'))
+            continue
+        if 'skipped' in before or 'skipped' in after:
+            rows.append((name, None, None, None, 'skipped'))
+            continue
+        ratio = after['median'] / before['median']
+        noise = max(threshold,
+                    before['stdev'] / before['median'],
+                    after['stdev'] / after['median'])
+        if ratio > 1 + noise:
+            status = 'slower'
+        elif ratio < 1 - noise:
+            status = 'faster'
+        else:
+            status = 'same'
+        rows.append((name, before['median'], after['median'], ratio, status))
+    return rows
+
+
+def report(rows, out=sys.stdout):
+    """
+    Print the output of compare as a table
+
+    :returns: True if no benchmark got slower
+    """
+    out.write('%-32s %12s %12s %8s  %s\n' %
+              ('benchmark', 'baseline', 'current', 'ratio', 'status'))
+    for name, before, after, ratio, status in rows:
+        if ratio is None:
+            out.write('%-32s %12s %12s %8s  %s\n' %
+                      (name, '-', '-', '-', status))
+        else:
+            out.write('%-32s %12s %12s %7.2fx  %s\n' %
+                      (name, format_time(before), format_time(after), ratio,
+                       status))
+    return not any(row[4] == 'slower' for row in rows)
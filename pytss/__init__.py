@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
 
+# The number of PCRs on a PC Client TPM 1.2. This is set before the
+# imports below, as the soft backend loaded by pytss.interface uses it.
+NUM_PCRS = 24
+
 from pytss.interface import tss_lib, ffi
+from pytss.eventlog import PcrEvent
+from pytss.profiler import profiled
+from pytss.scheduler import hold, scheduled, INTERACTIVE, NORMAL
+from pytss.structs import TpmCurrentTicks, TpmSignInfo
+import pytss.envelope
 import pytss.tspi_exceptions
 import hashlib
+import struct
 
 
 def uuid_to_tss_uuid(uuid):
@@ -86,6 +96,10 @@ class TspiObject(object):
         tss_lib.Tspi_Context_FreeMemory(self.context, blob[0])
         return ret
 
+    def close(self):
+        """Release the TSS object and any memory the TSS holds for it"""
+        tss_lib.Tspi_Context_CloseObject(self.context, self.get_handle())
+
     def get_policy_object(self, poltype):
         """
         Get a policy object assigned to the object
@@ -105,6 +119,8 @@ class TspiNV(TspiObject):
         super(TspiNV, self).__init__(context, 'TSS_HNVSTORE *',
                                      tss_lib.TSS_OBJECT_TYPE_NV, flags)
 
+    @scheduled(NORMAL)
+    @profiled
     def read_value(self, offset, length):
         """
         Read a value from TPM NVRAM
@@ -173,6 +189,8 @@ class TspiPCRs(TspiObject):
             tss_lib.Tspi_PcrComposite_SelectPcrIndex(self.handle[0], pcr)
             self.pcrs[pcr] = ""
 
+    @scheduled(NORMAL)
+    @profiled
     def get_pcrs(self):
         """
         Get the digest value of the PCRs referred to by this object
@@ -211,6 +229,7 @@ class TspiHash(TspiObject):
         tss_lib.Tspi_Hash_VerifySignature(self.get_handle(), key.get_handle(),
                                      len(signature), _c_byte_array(signature))
 
+    @scheduled(INTERACTIVE)
     def sign(self, key):
         """
         Sign this hash with the specified key and return a signature
@@ -223,6 +242,38 @@ class TspiHash(TspiObject):
         tss_lib.Tspi_Hash_Sign(self.get_handle(), key.get_handle(), csig_size, csig_data)
         return ffi.buffer(csig_data[0], csig_size[0])
 
+    @scheduled(INTERACTIVE)
+    @profiled
+    def tickstamp(self, key, nonce=None):
+        """
+        Have the TPM sign this hash together with its current tick count
+
+        :param key: A TspiKey instance corresponding to a loaded signing or
+            identity key
+        :param nonce: An optional anti-replay nonce, hashed with SHA1 as
+            get_quote does with its challenge
+
+        :returns: A tuple of the TpmCurrentTicks, the TPM_SIGN_INFO data
+            that was signed and the signature
+        """
+        valid = ffi.new('TSS_VALIDATION *')
+        replay = ffi.new('BYTE[]', 20)
+        if nonce:
+            ffi.memmove(replay, hashlib.sha1(bytes(nonce)).digest(), 20)
+        valid[0].ulExternalDataLength = 20
+        valid[0].rgbExternalData = replay
+
+        tss_lib.Tspi_Hash_TickStampBlob(self.get_handle(), key.get_handle(),
+                                        valid)
+
+        data = bytearray(valid[0].rgbData[0:valid[0].ulDataLength])
+        validation = bytearray(valid[0].rgbValidationData
+                               [0:valid[0].ulValidationDataLength])
+        tss_lib.Tspi_Context_FreeMemory(self.context, valid[0].rgbData)
+        tss_lib.Tspi_Context_FreeMemory(self.context,
+                                        valid[0].rgbValidationData)
+        return (TpmSignInfo(data).ticks, data, validation)
+
 
 class TspiKey(TspiObject):
     def __init__(self, context, flags, handle=None):
@@ -236,7 +287,8 @@ class TspiKey(TspiObject):
             tss_lib.Tspi_Key_UnloadKey(self.get_handle())
         # The key may have been implicitly unloaded as part of a previous
         # operation
-        except tspi_exceptions.TSS_E_INVALID_HANDLE:
+        except (tspi_exceptions.TSS_E_INVALID_HANDLE,
+                tspi_exceptions.TSS_E_KEY_NOT_LOADED):
             pass
 
     def set_modulus(self, n):
@@ -275,7 +327,52 @@ class TspiKey(TspiObject):
         return self.get_attribute_data(tss_lib.TSS_TSPATTRIB_RSAKEY_INFO,
                                        tss_lib.TSS_TSPATTRIB_KEYINFO_RSA_MODULUS)
 
+    @classmethod
+    def create(cls, parent, flags, pcrs=None):
+        """
+        Create a key object and generate a new key for it in the TPM
+
+        Key generation can take several seconds on TPM 1.2 hardware. See
+        pytss.keypool for generating keys ahead of time.
 
+        :param parent: A loaded TspiKey to wrap the new key with
+        :param flags: The TSS_KEY_ flags describing the key
+        :param pcrs: A TspiPCRs to bind the key's use to, if any
+
+        :returns: A TspiKey holding the wrapped key, which must be loaded
+            before it is used
+        """
+        key = cls(parent.context, flags)
+        key.generate(parent, pcrs)
+        return key
+
+    @scheduled(NORMAL)
+    @profiled
+    def generate(self, parent, pcrs=None):
+        """
+        Generate a new key in the TPM, wrapped by a parent storage key
+
+        :param parent: A loaded TspiKey to wrap the new key with
+        :param pcrs: A TspiPCRs to bind the key's use to, if any
+        """
+        if pcrs is not None:
+            pcr_composite = pcrs.get_handle()
+        else:
+            pcr_composite = 0
+        tss_lib.Tspi_Key_CreateKey(self.get_handle(), parent.get_handle(),
+                                   pcr_composite)
+
+    @scheduled(NORMAL)
+    def load(self, parent):
+        """
+        Load the key into the TPM
+
+        :param parent: The loaded TspiKey that wraps this key
+        """
+        tss_lib.Tspi_Key_LoadKey(self.get_handle(), parent.get_handle())
+
+    @scheduled(NORMAL)
+    @profiled
     def seal(self, data, pcrs=None):
         """
         Seal data to the local TPM using this key
@@ -306,6 +403,8 @@ class TspiKey(TspiObject):
                                     tss_lib.TSS_TSPATTRIB_ENCDATABLOB_BLOB)
         return bytearray(blob)
 
+    @scheduled(INTERACTIVE)
+    @profiled
     def unseal(self, data):
         """
         Unseal data from the local TPM using this key
@@ -330,6 +429,154 @@ class TspiKey(TspiObject):
         tss_lib.Tspi_Context_FreeMemory(self.context, blob[0])
         return ret
 
+    def seal_many(self, items, pcrs=None):
+        """
+        Seal a sequence of secrets to the same PCRs using this key
+
+        A single PCR composite and ENCDATA object are shared by every seal
+        operation, and each result is copied out before the next secret is
+        sealed, so this is suitable for sealing large numbers of secrets.
+
+        :param items: An iterable of data to seal
+        :param pcrs: A list of PCRs to seal the data to
+
+        :returns: A generator of bytearrays of encrypted data, in order
+        """
+        pcrobj = None
+        pcr_composite = 0
+        if pcrs is not None:
+            pcrobj = TspiPCRs(self.context, tss_lib.TSS_PCRS_STRUCT_INFO)
+            pcrobj.set_pcrs(pcrs)
+            pcr_composite = pcrobj.get_handle()
+
+        encdata = TspiObject(self.context, 'TSS_HENCDATA *',
+                             tss_lib.TSS_OBJECT_TYPE_ENCDATA,
+                             tss_lib.TSS_ENCDATA_SEAL)
+        try:
+            for data in items:
+                # Queue for the TPM per secret, never across a yield
+                with hold(self.context, NORMAL):
+                    tss_lib.Tspi_Data_Seal(encdata.get_handle(),
+                                           self.get_handle(), len(data),
+                                           _c_byte_array(data), pcr_composite)
+                yield encdata.get_attribute_data(
+                    tss_lib.TSS_TSPATTRIB_ENCDATA_BLOB,
+                    tss_lib.TSS_TSPATTRIB_ENCDATABLOB_BLOB)
+        finally:
+            encdata.close()
+            if pcrobj is not None:
+                pcrobj.close()
+
+    def bind(self, data, hybrid=False):
+        """
+        Encrypt data to this key so that only its TPM can decrypt it
+
+        :param data: The data to bind
+        :param hybrid: Encrypt the data with a fresh AES key and bind only
+            that key, allowing data larger than the RSA key
+
+        :returns: a bytearray of the encrypted data
+        """
+        if hybrid:
+            return bytearray(pytss.envelope.hybrid_encrypt(self.bind, data))
+
+        encdata = TspiObject(self.context, 'TSS_HENCDATA *',
+                             tss_lib.TSS_OBJECT_TYPE_ENCDATA,
+                             tss_lib.TSS_ENCDATA_BIND)
+        tss_lib.Tspi_Data_Bind(encdata.get_handle(), self.get_handle(),
+                               len(data), _c_byte_array(data))
+        blob = encdata.get_attribute_data(
+            tss_lib.TSS_TSPATTRIB_ENCDATA_BLOB,
+            tss_lib.TSS_TSPATTRIB_ENCDATABLOB_BLOB)
+        encdata.close()
+        return blob
+
+    @scheduled(INTERACTIVE)
+    def unbind(self, data, hybrid=False):
+        """
+        Decrypt data bound to this key, which must be loaded
+
+        :param data: The data to unbind
+        :param hybrid: The data was bound in hybrid mode
+
+        :returns: a bytearray of the unencrypted data
+        """
+        if hybrid:
+            return bytearray(pytss.envelope.hybrid_decrypt(self.unbind, data))
+
+        encdata = TspiObject(self.context, 'TSS_HENCDATA *',
+                             tss_lib.TSS_OBJECT_TYPE_ENCDATA,
+                             tss_lib.TSS_ENCDATA_BIND)
+        encdata.set_attribute_data(tss_lib.TSS_TSPATTRIB_ENCDATA_BLOB,
+                                   tss_lib.TSS_TSPATTRIB_ENCDATABLOB_BLOB,
+                                   data)
+
+        bloblen = ffi.new('UINT32 *')
+        blob = ffi.new('BYTE **')
+        tss_lib.Tspi_Data_Unbind(encdata.get_handle(), self.get_handle(),
+                                 bloblen, blob)
+        ret = bytearray(blob[0][0:bloblen[0]])
+        tss_lib.Tspi_Context_FreeMemory(self.context, blob[0])
+        encdata.close()
+        return ret
+
+    def seal_stream(self, src, dst, pcrs=None,
+                    chunk_size=pytss.envelope.DEFAULT_CHUNK_SIZE):
+        """
+        Seal a payload of any size to the local TPM using this key
+
+        Only a fresh AES key is sealed by the TPM; the payload itself is
+        streamed through AES-GCM in chunks. See pytss.envelope for the
+        format, which also allows individual chunks to be decrypted.
+
+        :param src: A file-like object to read the payload from
+        :param dst: A file-like object to write the envelope to
+        :param pcrs: A list of PCRs to seal the payload key to
+        :param chunk_size: The number of payload bytes per chunk
+
+        :returns: The number of payload bytes sealed
+        """
+        return pytss.envelope.seal_stream(self, src, dst, pcrs, chunk_size)
+
+    def unseal_stream(self, src, dst):
+        """
+        Unseal an envelope written by seal_stream using this key
+
+        :param src: A seekable file-like object containing the envelope
+        :param dst: A file-like object to write the payload to
+
+        :returns: The number of payload bytes written
+        """
+        return pytss.envelope.unseal_stream(self, src, dst)
+
+    def unseal_many(self, blobs):
+        """
+        Unseal a sequence of sealed blobs using this key
+
+        :param blobs: An iterable of blobs returned by seal or seal_many
+
+        :returns: A generator of bytearrays of unencrypted data, in order
+        """
+        encdata = TspiObject(self.context, 'TSS_HENCDATA *',
+                             tss_lib.TSS_OBJECT_TYPE_ENCDATA,
+                             tss_lib.TSS_ENCDATA_SEAL)
+        bloblen = ffi.new('UINT32 *')
+        blob = ffi.new('BYTE **')
+        try:
+            for data in blobs:
+                tss_lib.Tspi_SetAttribData(
+                    encdata.get_handle(), tss_lib.TSS_TSPATTRIB_ENCDATA_BLOB,
+                    tss_lib.TSS_TSPATTRIB_ENCDATABLOB_BLOB, len(data),
+                    _c_byte_array(data))
+                with hold(self.context, INTERACTIVE):
+                    tss_lib.Tspi_Data_Unseal(encdata.get_handle(),
+                                             self.get_handle(), bloblen, blob)
+                ret = bytearray(blob[0][0:bloblen[0]])
+                tss_lib.Tspi_Context_FreeMemory(self.context, blob[0])
+                yield ret
+        finally:
+            encdata.close()
+
 
 class TspiTPM(TspiObject):
     def __init__(self, context):
@@ -337,7 +584,10 @@ class TspiTPM(TspiObject):
         tss_lib.Tspi_Context_GetTpmObject(context, tpm)
         self.handle = tpm
         self.context = context
+        self._capabilities = None
+        self._counter = None
 
+    @scheduled(NORMAL)
     def collate_identity_request(self, srk, pubkey, aik):
         """
         Generate everything required to authenticate the TPM to a third party
@@ -359,6 +609,7 @@ class TspiTPM(TspiObject):
         tss_lib.Tspi_Context_FreeMemory(self.context, blob[0])
         return ret
 
+    @scheduled(NORMAL)
     def get_capability(self, cap, sub):
         """
         Get information on the capabilities of the TPM
@@ -371,14 +622,26 @@ class TspiTPM(TspiObject):
         resp = ffi.new('BYTE **')
         resplen = ffi.new('UINT32 *')
         csub = ffi.new('BYTE []', len(sub))
-        for i in range(len(sub)):
-            csub[i] = sub[i]
-        tss_lib.Tspi_TPM_Getcapability(self.handle[0], cap, len(sub), csub,
-                                   resplen, resp)
+        ffi.memmove(csub, bytes(sub), len(sub))
+        tss_lib.Tspi_TPM_GetCapability(self.handle[0], cap, len(sub), csub,
+                                       resplen, resp)
         ret = bytearray(resp[0][0:resplen[0]])
         tss_lib.Tspi_Context_FreeMemory(self.context, resp[0])
         return ret
 
+    @property
+    def capabilities(self):
+        """
+        The decoded capabilities of the TPM, as a TpmCapabilities. Static
+        capabilities are only queried once per TspiTPM.
+        """
+        if self._capabilities is None:
+            from pytss.capabilities import TpmCapabilities
+            self._capabilities = TpmCapabilities(self)
+        return self._capabilities
+
+    @scheduled(INTERACTIVE)
+    @profiled
     def get_quote(self, aik, pcrs, challenge):
         """
         retrieve a signed set of PCR values
@@ -412,6 +675,29 @@ class TspiTPM(TspiObject):
         tss_lib.Tspi_Context_FreeMemory(self.context, valid[0].rgbValidationData)
         return (data, validation)
 
+    def get_quote_multi(self, aik, pcrs, nonces):
+        """
+        Retrieve one signed set of PCR values answering several challenges
+
+        The quote's external data is the SHA-1 of the root of a Merkle tree
+        over the nonces, just as get_quote uses the SHA-1 of its challenge.
+        Each nonce gets an inclusion proof tying it to that root, to be
+        checked with attestationutils.quote_verify.
+
+        :param aik: A TspiObject representing the Attestation Identity Key
+        :param pcrs: A TspiPCRs representing the PCRs to be quoted
+        :param nonces: The challenges to answer
+
+        :returns: A tuple containing the quote data, the validation block
+            and a list of the MerkleProof of each nonce, in order
+        """
+        from pytss.merkle import MerkleTree
+        tree = MerkleTree(nonces)
+        data, validation = self.get_quote(aik, pcrs, tree.root)
+        return (data, validation, tree.proofs())
+
+    @scheduled(NORMAL)
+    @profiled
     def activate_identity(self, aik, asymblob, symblob):
         """
         Decrypt the challenge provided by the attestation host
@@ -437,6 +723,7 @@ class TspiTPM(TspiObject):
         tss_lib.Tspi_Context_FreeMemory(self.context, cred[0])
         return ret
 
+    @scheduled(NORMAL)
     def get_pub_endorsement_key(self):
         keyblob = ffi.new('TSS_HKEY *')
         modulus = ffi.new('UINT32 *')
@@ -446,6 +733,7 @@ class TspiTPM(TspiObject):
         key = TspiKey(self.context, None, handle=keyblob)
         return key
 
+    @scheduled(NORMAL)
     def take_ownership(self, srk):
         """
         Take ownership of the TPM
@@ -454,6 +742,7 @@ class TspiTPM(TspiObject):
         """
         tss_lib.Tspi_TPM_TakeOwnership(self.get_handle(), srk.get_handle(), 0)
 
+    @scheduled(NORMAL)
     def extend_pcr(self, pcr, data, event):
         """
         Extend a PCR
@@ -476,14 +765,145 @@ class TspiTPM(TspiObject):
         tss_lib.Tspi_Context_FreeMemory(self.context, blob[0])
         return ret
 
+    @scheduled(NORMAL)
+    def get_random(self, length):
+        """
+        Obtain random bytes from the TPM's random number generator
+
+        :param length: The number of bytes to return
+
+        :returns: A bytearray containing the random data
+        """
+        blob = ffi.new('BYTE **')
+        tss_lib.Tspi_TPM_GetRandom(self.get_handle(), length, blob)
+        ret = bytearray(blob[0][0:length])
+        tss_lib.Tspi_Context_FreeMemory(self.context, blob[0])
+        return ret
+
+    def read_counter(self, refresh=False):
+        """
+        Read the TPM's active monotonic counter
+
+        The value is cached on this TspiTPM, and so for the lifetime of its
+        context. Call invalidate_counter, or pass refresh, once the counter
+        may have been incremented. Only a read that reaches the TPM waits
+        for the scheduler.
+
+        :param refresh: Read the counter from the TPM even if it is cached
+
+        :returns: The counter value
+        """
+        if self._counter is None or refresh:
+            self._counter = self._read_counter()
+        return self._counter
+
+    @scheduled(NORMAL)
+    def _read_counter(self):
+        value = ffi.new('UINT32 *')
+        tss_lib.Tspi_TPM_ReadCounter(self.get_handle(), value)
+        return value[0]
+
+    def invalidate_counter(self):
+        """Forget the cached monotonic counter value"""
+        self._counter = None
+
+    @scheduled(NORMAL)
+    def read_ticks(self):
+        """
+        Read the TPM's tick counter
+
+        :returns: A TpmCurrentTicks
+        """
+        ticks = ffi.new('TPM_CURRENT_TICKS *')
+        tss_lib.Tspi_TPM_ReadCurrentTicks(self.get_handle(), ticks)
+        blob = bytearray(struct.pack('!HQH', ticks.tag, ticks.currentTicks,
+                                     ticks.tickRate))
+        blob += ffi.buffer(ticks.tickNonce.nonce, 20)[:]
+        return TpmCurrentTicks(blob)
+
+    @scheduled(NORMAL)
+    def read_pcr(self, pcr):
+        """
+        Read the current value of a PCR
+
+        :param pcr: The PCR to read
+
+        :returns: A bytearray containing the PCR value
+        """
+        bloblen = ffi.new('UINT32 *')
+        blob = ffi.new('BYTE **')
+        tss_lib.Tspi_TPM_PcrRead(self.get_handle(), pcr, bloblen, blob)
+        ret = bytearray(blob[0][0:bloblen[0]])
+        tss_lib.Tspi_Context_FreeMemory(self.context, blob[0])
+        return ret
+
+    def iter_events(self, pcr=None, start=0, batch=64):
+        """
+        Iterate over the measurement event log
+
+        Events are fetched from the TSS daemon in batches and the TSS memory
+        backing each batch is released before its records are yielded.
+
+        :param pcr: The PCR whose events to return, or None for every PCR
+        :param start: The number of the first event to return within each PCR
+        :param batch: The number of events to request per call
+
+        :returns: A generator of PcrEvent records
+        """
+        if pcr is None:
+            pcrs = range(NUM_PCRS)
+        else:
+            pcrs = [pcr]
+
+        for index in pcrs:
+            number = start
+            while True:
+                count = ffi.new('UINT32 *')
+                events = ffi.new('TSS_PCR_EVENT **')
+                count[0] = batch
+                try:
+                    tss_lib.Tspi_TPM_GetEvents(self.get_handle(), index,
+                                               number, count, events)
+                except tspi_exceptions.TSS_E_BAD_PARAMETER:
+                    # start lies beyond the end of this PCR's log
+                    break
+
+                records = []
+                for i in range(count[0]):
+                    event = events[0][i]
+                    records.append(PcrEvent(
+                        event.ulPcrIndex, number + i, event.eventType,
+                        bytes(ffi.buffer(event.rgbPcrValue,
+                                         event.ulPcrValueLength)),
+                        bytes(ffi.buffer(event.rgbEvent,
+                                         event.ulEventLength))))
+                    if event.rgbPcrValue != ffi.NULL:
+                        tss_lib.Tspi_Context_FreeMemory(self.context,
+                                                        event.rgbPcrValue)
+                    if event.rgbEvent != ffi.NULL:
+                        tss_lib.Tspi_Context_FreeMemory(self.context,
+                                                        event.rgbEvent)
+                if count[0]:
+                    tss_lib.Tspi_Context_FreeMemory(self.context, events[0])
+
+                for record in records:
+                    yield record
+
+                number += count[0]
+                if count[0] < batch:
+                    break
+
 class TspiContext(object):
     def __init__(self):
         self.context = ffi.new('TSS_HCONTEXT *')
         tss_lib.Tspi_Context_Create(self.context)
         self.context = self.context[0]
         self.tpm = None
+        self.scheduler = None
 
     def __del__(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
         tss_lib.Tspi_Context_Close(self.context)
 
     def connect(self, host=None):
@@ -493,10 +913,10 @@ class TspiContext(object):
         :param host: The host to connect to, if not localhost
         """
         if host is not None:
-            chost = ffi.new('uint16_t[]', len(host) + 1)
-            for i in range(len(host)):
-                chost[i] = bytearray(host)[i]
-            chost[len(host)] = 0
+            if isinstance(host, bytes):
+                host = host.decode('ascii')
+            # TSS_UNICODE, NUL terminated
+            chost = ffi.new('uint16_t[]', [ord(c) for c in host] + [0])
             tss_lib.Tspi_Context_Connect(self.context, chost)
         else:
             tss_lib.Tspi_Context_Connect(self.context, ffi.NULL)
@@ -547,6 +967,7 @@ class TspiContext(object):
         obj = TspiKey(self.context, flags)
         return obj
 
+    @scheduled(NORMAL)
     def load_key_by_uuid(self, storagetype, uuid):
         """
         Load a key that's been registered in persistent storage
@@ -563,6 +984,8 @@ class TspiContext(object):
         key = TspiKey(self.context, None, handle=tss_key)
         return key
 
+    @scheduled(NORMAL)
+    @profiled
     def load_key_by_blob(self, srk, blob):
         """
         Load a key from a TSS key blob
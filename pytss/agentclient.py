@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Client for the local attestation daemon, pytss.agentd.
+
+AgentClient mirrors the TspiTPM methods the daemon serves, so a process can
+switch from its own TspiContext to the shared daemon with few changes. It
+only needs the daemon's socket, not a TSS context of its own.
+
+The protocol is a sequence of frames over a Unix stream socket. Each frame
+is a header of a version byte, an operation or status byte and a UINT32
+body length, followed by the body. The client sends one request and reads
+its response before sending the next.
+"""
+
+import os
+import socket
+import struct
+
+VERSION = 1
+
+OP_GET_PCRS = 1
+OP_QUOTE = 2
+OP_RANDOM = 3
+
+STATUS_OK = 0
+STATUS_TSS_ERROR = 1
+STATUS_ERROR = 2
+
+HEADER = struct.Struct('!BBI')
+MAX_BODY = 1 << 20
+
+DEFAULT_SOCKET = '/run/pytss/agentd.sock'
+
+
+class AgentError(Exception):
+    """The daemon could not handle a request"""
+
+
+def socket_path(path=None):
+    """Return the socket path, by default from PYTSS_AGENT_SOCKET"""
+    if path is not None:
+        return path
+    return os.environ.get('PYTSS_AGENT_SOCKET', DEFAULT_SOCKET)
+
+
+def _recv_exact(sock, length):
+    buf = bytearray()
+    while len(buf) < length:
+        chunk = sock.recv(length - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
+
+
+def send_frame(sock, code, body=b''):
+    """Send a frame with the given operation or status"""
+    sock.sendall(HEADER.pack(VERSION, code, len(body)) + bytes(body))
+
+
+def recv_frame(sock):
+    """
+    Receive a frame
+
+    :returns: A tuple of the operation or status and the body, or None if
+        the peer closed the connection
+    """
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    version, code, length = HEADER.unpack(bytes(header))
+    if version != VERSION:
+        raise AgentError("Unsupported protocol version %d" % version)
+    if length > MAX_BODY:
+        raise AgentError("Frame too large")
+    body = _recv_exact(sock, length)
+    if body is None:
+        raise AgentError("Connection closed mid-frame")
+    return (code, body)
+
+
+def pcr_mask(pcrs):
+    """Encode a list of PCR indices as a bit mask"""
+    mask = 0
+    for pcr in pcrs:
+        if not 0 <= pcr < 32:
+            raise ValueError("PCR %d out of range" % pcr)
+        mask |= 1 << pcr
+    return mask
+
+
+def mask_pcrs(mask):
+    """Decode a bit mask into a sorted list of PCR indices"""
+    return [pcr for pcr in range(32) if mask & (1 << pcr)]
+
+
+class AgentClient(object):
+    def __init__(self, path=None, timeout=None):
+        """
+        Connect to the attestation daemon
+
+        :param path: The daemon's socket, by default $PYTSS_AGENT_SOCKET or
+            DEFAULT_SOCKET
+        :param timeout: An optional socket timeout in seconds
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(socket_path(path))
+        except Exception:
+            self.sock.close()
+            raise
+
+    def close(self):
+        """Close the connection to the daemon"""
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _call(self, op, body):
+        send_frame(self.sock, op, body)
+        frame = recv_frame(self.sock)
+        if frame is None:
+            raise AgentError("The daemon closed the connection")
+        status, body = frame
+        if status == STATUS_OK:
+            return body
+        if status == STATUS_TSS_ERROR:
+            from pytss.interface import check_result
+            check_result(struct.unpack('!I', bytes(body))[0])
+        raise AgentError(body.decode('utf-8', 'replace'))
+
+    def read_pcr(self, pcr):
+        """
+        Read the current value of a PCR
+
+        :param pcr: The PCR to read
+
+        :returns: A bytearray containing the PCR value
+        """
+        return self.get_pcrs([pcr])[pcr]
+
+    def get_pcrs(self, pcrs):
+        """
+        Read the current values of several PCRs
+
+        :param pcrs: A list of integer PCRs, or a TspiPCRs
+
+        :returns: a dictionary of PCR/value pairs
+        """
+        pcrs = mask_pcrs(pcr_mask(getattr(pcrs, 'pcrs', pcrs)))
+        body = self._call(OP_GET_PCRS, struct.pack('!I', pcr_mask(pcrs)))
+        if len(body) != 20 * len(pcrs):
+            raise AgentError("Malformed PCR response")
+        return dict((pcr, body[20 * i:20 * (i + 1)])
+                    for i, pcr in enumerate(pcrs))
+
+    def get_quote(self, aik, pcrs, challenge):
+        """
+        retrieve a signed set of PCR values
+
+        The daemon may answer several clients' challenges with one quote,
+        in which case the challenge comes with an inclusion proof. Pass the
+        challenge and proof to attestationutils.quote_verify.
+
+        :param aik: The TSS key blob of the Attestation Identity Key, or a
+            TspiKey
+        :param pcrs: A list of integer PCRs to be quoted, or a TspiPCRs
+        :param challenge: The challenge to use
+
+        :returns: A tuple containing the quote data, the validation block
+            and the challenge's MerkleProof, or None if the quote answered
+            this challenge alone
+        """
+        if hasattr(aik, 'get_keyblob'):
+            aik = aik.get_keyblob()
+        mask = pcr_mask(getattr(pcrs, 'pcrs', pcrs))
+        body = self._call(OP_QUOTE,
+                          struct.pack('!IH', mask, len(aik)) + bytes(aik) +
+                          bytes(challenge or b''))
+        try:
+            datalen, validlen = struct.unpack_from('!HH', bytes(body))
+        except struct.error:
+            raise AgentError("Malformed quote response")
+        offset = 4 + datalen + validlen
+        if len(body) < offset:
+            raise AgentError("Malformed quote response")
+        data = body[4:4 + datalen]
+        validation = body[4 + datalen:offset]
+        proof = None
+        if len(body) > offset:
+            from pytss.merkle import decode_proof
+            proof = decode_proof(body[offset:])
+        return (data, validation, proof)
+
+    def get_random(self, length):
+        """
+        Obtain random bytes from the TPM's random number generator
+
+        :param length: The number of bytes to return
+
+        :returns: A bytearray containing the random data
+        """
+        body = self._call(OP_RANDOM, struct.pack('!I', length))
+        if len(body) != length:
+            raise AgentError("Malformed random response")
+        return body
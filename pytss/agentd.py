@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Local attestation daemon.
+
+Run with
+
+    python -m pytss.agentd [--socket PATH]
+
+The daemon owns a single connected TspiContext and serves PCR reads,
+quotes and random numbers to local processes over a Unix socket, using the
+protocol described in pytss.agentclient. One worker thread makes every TSS
+call. Requests that arrive while it is busy are coalesced:
+
+- identical PCR reads are answered by one read
+- quotes of the same PCRs with the same AIK are answered by a single
+  TspiTPM.get_quote_multi over all their challenges
+- random number requests are served from one TPM_GetRandom
+
+The SRK is expected to use the well known secret, as in attestationutils.
+"""
+
+import argparse
+import collections
+import hashlib
+import os
+import queue
+import socketserver
+import struct
+import threading
+import time
+
+from pytss import agentclient
+from pytss.agentclient import (OP_GET_PCRS, OP_QUOTE, OP_RANDOM,
+                               STATUS_ERROR, STATUS_OK, STATUS_TSS_ERROR)
+from pytss.interface import result_code
+
+# The number of AIKs kept loaded between requests
+AIK_CACHE_SIZE = 8
+
+# The largest random number request the daemon serves
+MAX_RANDOM = 4096
+
+
+class _Request(object):
+    def __init__(self, op, key, arg):
+        self.op = op
+        self.key = key
+        self.arg = arg
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class Coalescer(object):
+    def __init__(self, context, window=0.0):
+        """
+        Serve requests from one TSS context, merging concurrent ones
+
+        :param context: A connected TspiContext, used only by the worker
+            thread from now on
+        :param window: Seconds to wait after the first request of a batch
+            for others to join it
+        """
+        self.context = context
+        self.tpm = context.get_tpm_object()
+        self.window = window
+        self.srk = None
+        self.aiks = collections.OrderedDict()
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, op, key, arg):
+        """
+        Queue a request and wait for its result
+
+        :param op: The agentclient OP_ code
+        :param key: Requests with the same op and key are coalesced
+        :param arg: The request's own argument
+
+        :returns: The result of the request
+        """
+        request = _Request(op, key, arg)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def close(self):
+        """Stop the worker thread once the queued requests are served"""
+        self.requests.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            first = self.requests.get()
+            if first is None:
+                return
+            if self.window:
+                time.sleep(self.window)
+            batch = [first]
+            stop = False
+            while True:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+
+            groups = collections.OrderedDict()
+            for request in batch:
+                groups.setdefault((request.op, request.key), []).append(
+                    request)
+            for (op, key), requests in groups.items():
+                try:
+                    results = self._serve(op, key, requests)
+                except Exception as e:
+                    for request in requests:
+                        request.finish(error=e)
+                    continue
+                for request, result in zip(requests, results):
+                    request.finish(result)
+            if stop:
+                return
+
+    def _serve(self, op, key, requests):
+        if op == OP_GET_PCRS:
+            values = b''.join(bytes(self.tpm.read_pcr(pcr))
+                              for pcr in agentclient.mask_pcrs(key))
+            return [values] * len(requests)
+        if op == OP_QUOTE:
+            return self._quote(key, [request.arg for request in requests])
+        if op == OP_RANDOM:
+            data = bytearray()
+            total = sum(request.arg for request in requests)
+            while len(data) < total:
+                data += self.tpm.get_random(min(1024, total - len(data)))
+            results = []
+            offset = 0
+            for request in requests:
+                results.append(data[offset:offset + request.arg])
+                offset += request.arg
+            return results
+        raise ValueError("Unknown operation %d" % op)
+
+    def _load_aik(self, blob):
+        digest = hashlib.sha1(blob).digest()
+        aik = self.aiks.pop(digest, None)
+        if aik is None:
+            if self.srk is None:
+                from pytss.attestationutils import (srk_uuid,
+                                                    well_known_secret)
+                from pytss.tspi_defines import (TSS_POLICY_USAGE,
+                                                TSS_PS_TYPE_SYSTEM,
+                                                TSS_SECRET_MODE_SHA1)
+                srk = self.context.load_key_by_uuid(TSS_PS_TYPE_SYSTEM,
+                                                    srk_uuid)
+                policy = srk.get_policy_object(TSS_POLICY_USAGE)
+                policy.set_secret(TSS_SECRET_MODE_SHA1, well_known_secret)
+                self.srk = srk
+            aik = self.context.load_key_by_blob(self.srk, bytearray(blob))
+            while len(self.aiks) >= AIK_CACHE_SIZE:
+                self.aiks.popitem(last=False)
+        self.aiks[digest] = aik
+        return aik
+
+    def _quote(self, key, nonces):
+        from pytss.merkle import encode_proof
+        from pytss.tspi_defines import TSS_PCRS_STRUCT_INFO
+        blob, mask = key
+        aik = self._load_aik(blob)
+        pcrs = self.context.create_pcrs(TSS_PCRS_STRUCT_INFO)
+        try:
+            pcrs.set_pcrs(agentclient.mask_pcrs(mask))
+            if len(nonces) == 1:
+                data, validation = self.tpm.get_quote(aik, pcrs, nonces[0])
+                proofs = [b'']
+            else:
+                data, validation, proofs = self.tpm.get_quote_multi(
+                    aik, pcrs, nonces)
+                proofs = [encode_proof(proof) for proof in proofs]
+        finally:
+            pcrs.close()
+        head = (struct.pack('!HH', len(data), len(validation)) +
+                bytes(data) + bytes(validation))
+        return [head + proof for proof in proofs]
+
+
+def parse_request(op, body):
+    """
+    Decode a request body
+
+    :returns: A tuple of the coalescing key and the request's own argument
+    """
+    body = bytes(body)
+    if op == OP_GET_PCRS:
+        if len(body) != 4:
+            raise ValueError("Malformed PCR request")
+        return (struct.unpack('!I', body)[0], None)
+    if op == OP_QUOTE:
+        if len(body) < 6:
+            raise ValueError("Malformed quote request")
+        mask, aiklen = struct.unpack_from('!IH', body)
+        if len(body) < 6 + aiklen:
+            raise ValueError("Malformed quote request")
+        return ((body[6:6 + aiklen], mask), body[6 + aiklen:])
+    if op == OP_RANDOM:
+        if len(body) != 4:
+            raise ValueError("Malformed random request")
+        length = struct.unpack('!I', body)[0]
+        if length > MAX_RANDOM:
+            raise ValueError("At most %d random bytes per request" %
+                             MAX_RANDOM)
+        return (None, length)
+    raise ValueError("Unknown operation %d" % op)
+
+
+class AgentHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                frame = agentclient.recv_frame(self.request)
+                if frame is None:
+                    return
+                op, body = frame
+                key, arg = parse_request(op, body)
+            except (agentclient.AgentError, ValueError) as e:
+                agentclient.send_frame(self.request, STATUS_ERROR,
+                                       str(e).encode('utf-8'))
+                return
+
+            try:
+                result = self.server.coalescer.submit(op, key, arg)
+            except Exception as e:
+                code = result_code(e)
+                if code is None:
+                    agentclient.send_frame(self.request, STATUS_ERROR,
+                                           str(e).encode('utf-8'))
+                else:
+                    agentclient.send_frame(self.request, STATUS_TSS_ERROR,
+                                           struct.pack('!I', code))
+                continue
+            agentclient.send_frame(self.request, STATUS_OK, result)
+
+
+class AgentServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, coalescer, mode=0o660):
+        """
+        Listen for clients on a Unix socket
+
+        :param path: The socket path, replaced if it already exists
+        :param coalescer: The Coalescer to send requests to
+        :param mode: The permissions of the socket
+        """
+        self.coalescer = coalescer
+        if os.path.exists(path):
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, AgentHandler)
+        os.chmod(path, mode)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pytss.agentd')
+    parser.add_argument('--socket', default=agentclient.socket_path(),
+                        help='the socket to listen on, %(default)s by '
+                             'default')
+    parser.add_argument('--mode', type=lambda s: int(s, 8), default=0o660,
+                        help='the permissions of the socket, in octal')
+    parser.add_argument('--host',
+                        help='the TSS daemon to connect to, if not local')
+    parser.add_argument('--window', type=float, default=0.0,
+                        help='seconds to wait for more requests to join a '
+                             'batch')
+    args = parser.parse_args(argv)
+
+    import pytss
+    context = pytss.TspiContext()
+    context.connect(args.host)
+    coalescer = Coalescer(context, args.window)
+    server = AgentServer(args.socket, coalescer, args.mode)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        coalescer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Signing many records with one TPM signature.
+
+Each TspiHash.sign is an RSA operation in the TPM, limiting signing to a
+few records a second. BatchSigner instead builds a Merkle tree over a batch
+of records and has the TPM sign only its root. Every record gets an
+inclusion proof, and verify_record checks a record, its proof and the root
+signature against the signing key's public modulus without a TPM.
+"""
+
+import collections
+import hashlib
+
+from pytss import TspiHash
+from pytss.interface import tss_lib
+from pytss import merkle
+
+SignedBatch = collections.namedtuple('SignedBatch', 'root signature proofs')
+
+
+def root_digest(root):
+    """Return the SHA-1 digest that the TPM signs for a root"""
+    return hashlib.sha1(bytes(root)).digest()
+
+
+class BatchSigner(object):
+    def __init__(self, key, hash_name='sha256'):
+        """
+        Create a batch signer
+
+        :param key: A loaded signing TspiKey using
+            the TPM_SS_RSASSAPKCS1v15_SHA1 signature scheme
+        :param hash_name: The hash to build trees with, 'sha256' or 'sha1'
+        """
+        self.key = key
+        self.hash_name = hash_name
+
+    def sign_root(self, root):
+        """
+        Have the TPM sign a Merkle root
+
+        :param root: The root hash
+
+        :returns: A bytearray containing the signature
+        """
+        digest = TspiHash(self.key.context, tss_lib.TSS_HASH_SHA1)
+        try:
+            digest.update(root)
+            return bytearray(digest.sign(self.key))
+        finally:
+            digest.close()
+
+    def sign(self, records):
+        """
+        Sign a batch of records with a single TPM signature
+
+        :param records: A sequence of records, each a bytes-like object
+
+        :returns: A SignedBatch of the root, its signature and a MerkleProof
+            per record, in order
+        """
+        tree = merkle.MerkleTree(records, self.hash_name)
+        return SignedBatch(tree.root, self.sign_root(tree.root),
+                           tree.proofs())
+
+
+def verify_record(record, proof, root, signature, modulus, exponent=65537,
+                  hash_name='sha256'):
+    """
+    Check a record against a signed batch without a TPM
+
+    :param record: The record
+    :param proof: Its MerkleProof, or the proof encoded by
+        merkle.encode_proof
+    :param root: The root of the batch
+    :param signature: The TPM's signature of the root
+    :param modulus: The signing key's public modulus, as returned by
+        TspiKey.get_pubkey
+    :param exponent: The signing key's public exponent
+    :param hash_name: The only tree hash to accept proofs for, 'sha256' as
+        used by BatchSigner by default
+
+    :returns: True if the record was signed, False otherwise
+    """
+    from pytss.attestationutils import pkcs1_verify
+    if not isinstance(proof, merkle.MerkleProof):
+        try:
+            proof = merkle.decode_proof(proof)
+        except ValueError:
+            return False
+    # The prover picks the hash named in the proof, so pin it
+    if proof.hash_name != hash_name:
+        return False
+    if not merkle.verify_proof(record, proof, root):
+        return False
+    return pkcs1_verify(root_digest(root), signature, modulus, exponent)
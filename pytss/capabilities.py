@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Decoded and cached TPM capabilities.
+
+TpmCapabilities wraps TspiTPM.get_capability, decoding the commonly needed
+capabilities into Python values. Facts that cannot change while the TPM is
+running, such as the version, PCR count and buffer sizes, are queried once
+and remembered for the lifetime of the TspiTPM, and so of its context.
+Values that can change, such as the free key slots and the defined NV
+indices, are queried on every call.
+"""
+
+import collections
+import struct
+
+from pytss.interface import tss_lib
+
+# The non-data part of a TPM_NV_WriteValueAuth command: a 10 byte header,
+# index, offset and size, and a 45 byte authorisation session
+NV_COMMAND_OVERHEAD = 10 + 12 + 45
+
+# The non-data part of a TPM_NV_ReadValueAuth response: a 10 byte header,
+# the data size and a 41 byte authorisation session. TPM_CAP_PROP_INPUT_BUFFER
+# bounds responses as well as commands.
+NV_RESPONSE_OVERHEAD = 10 + 4 + 41
+
+TpmVersionInfo = collections.namedtuple(
+    'TpmVersionInfo',
+    'major minor rev_major rev_minor spec_level errata_rev vendor_id '
+    'vendor_specific')
+
+
+def decode_version_info(data):
+    """
+    Decode a TPM_CAP_VERSION_INFO structure
+
+    :param data: The structure, as returned for TSS_TPMCAP_VERSION_VAL
+
+    :returns: A TpmVersionInfo
+    """
+    data = bytes(data)
+    try:
+        tag, major, minor, rev_major, rev_minor, spec_level, errata_rev, \
+            vendor_id, vendor_size = struct.unpack_from('!HBBBBHB4sH', data)
+    except struct.error:
+        raise ValueError("Truncated TPM_CAP_VERSION_INFO")
+    if tag != 0x0030:
+        raise ValueError("Not a TPM_CAP_VERSION_INFO")
+    return TpmVersionInfo(major, minor, rev_major, rev_minor, spec_level,
+                          errata_rev, vendor_id, data[15:15 + vendor_size])
+
+
+def decode_nv_list(data):
+    """
+    Decode the list of defined NV indices
+
+    :param data: The list, as returned for TSS_TPMCAP_NV_LIST
+
+    :returns: A list of NV indices
+    """
+    data = bytes(data)
+    return list(struct.unpack('!%dI' % (len(data) // 4), data))
+
+
+class TpmCapabilities(object):
+    def __init__(self, tpm):
+        """
+        Create a capability view of a TPM
+
+        :param tpm: The TspiTPM to query
+        """
+        self.tpm = tpm
+        self._static = {}
+
+    def get_property(self, prop):
+        """
+        Query a TSS_TPMCAP_PROPERTY capability, which the TSS returns as a
+        UINT32 in host byte order
+
+        :param prop: The TSS_TPMCAP_PROP_ subcapability
+
+        :returns: The property as an integer
+        """
+        data = self.tpm.get_capability(tss_lib.TSS_TPMCAP_PROPERTY,
+                                       struct.pack('=I', prop))
+        if len(data) == 1:
+            return bytearray(data)[0]
+        return struct.unpack('=I', bytes(data[:4]))[0]
+
+    def _cached(self, key, fetch):
+        try:
+            return self._static[key]
+        except KeyError:
+            value = self._static[key] = fetch()
+            return value
+
+    def _cached_property(self, prop):
+        return self._cached(prop, lambda: self.get_property(prop))
+
+    @property
+    def version(self):
+        """The TPM version information, as a TpmVersionInfo"""
+        return self._cached('version', lambda: decode_version_info(
+            self.tpm.get_capability(tss_lib.TSS_TPMCAP_VERSION_VAL, b'')))
+
+    @property
+    def manufacturer(self):
+        """The four character vendor ID"""
+        return self._cached('manufacturer', lambda: struct.pack(
+            '!I', self.get_property(tss_lib.TSS_TPMCAP_PROP_MANUFACTURER)))
+
+    @property
+    def pcr_count(self):
+        """The number of PCRs"""
+        return self._cached_property(tss_lib.TSS_TPMCAP_PROP_PCR)
+
+    @property
+    def input_buffer_size(self):
+        """The largest command the TPM accepts, in bytes"""
+        return self._cached_property(tss_lib.TSS_TPMCAP_PROP_INPUTBUFFERSIZE)
+
+    @property
+    def nv_chunk_size(self):
+        """The most data a single NV read or write can transfer"""
+        return self.input_buffer_size - max(NV_COMMAND_OVERHEAD,
+                                            NV_RESPONSE_OVERHEAD)
+
+    @property
+    def key_slots(self):
+        """The number of keys the TPM can hold loaded at once"""
+        return self._cached_property(tss_lib.TSS_TPMCAP_PROP_MAXKEYS)
+
+    def free_key_slots(self):
+        """Return the number of keys that can currently still be loaded"""
+        return self.get_property(tss_lib.TSS_TPMCAP_PROP_SLOTS)
+
+    def nv_indices(self):
+        """Return the list of currently defined NV indices"""
+        return decode_nv_list(
+            self.tpm.get_capability(tss_lib.TSS_TPMCAP_NV_LIST, b''))
+
+    def snapshot(self):
+        """
+        Return every static capability
+
+        :returns: A dict of capability names to values
+        """
+        return {
+            'version': self.version,
+            'manufacturer': self.manufacturer,
+            'pcr_count': self.pcr_count,
+            'input_buffer_size': self.input_buffer_size,
+            'nv_chunk_size': self.nv_chunk_size,
+            'key_slots': self.key_slots,
+        }
+
+    def clear(self):
+        """Forget the cached capabilities"""
+        self._static = {}
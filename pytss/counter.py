@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Rollback protection with batched monotonic counter increments.
+
+A TPM monotonic counter proves that stored state is the newest version, but
+TPM 1.2 parts only allow an increment every few seconds and wear out after
+a limited number. BatchedCounter counts logical versions as a pair of the
+hardware counter value and a sub-counter persisted in a state file. Most
+bumps only advance the sub-counter. Every so many bumps, or on commit(),
+the hardware counter is incremented once and the sub-counter starts again.
+
+A state file rolled back to an earlier hardware value is detected by
+check(). Bumps since the last hardware increment are only protected by the
+state file, so commit() before relying on a version against an attacker
+who can replace the file.
+
+The Tspi API can read the active counter but not increment it, so the
+increment is a callable supplied by the caller, for example one that runs
+the platform's TCS-level tooling.
+"""
+
+import json
+import os
+import tempfile
+
+
+class CounterRollback(Exception):
+    """The state file does not match the TPM's monotonic counter"""
+
+
+class BatchedCounter(object):
+    def __init__(self, tpm, path, increment, every=16):
+        """
+        Open or create a batched counter
+
+        A new state file starts at the TPM's current counter value. An
+        existing one is checked against the TPM with check().
+
+        :param tpm: The TspiTPM whose active counter is used
+        :param path: The state file
+        :param increment: A callable that increments the TPM's active
+            counter
+        :param every: Increment the hardware counter once this many bumps
+            are pending
+        """
+        self.tpm = tpm
+        self.path = path
+        self.increment = increment
+        self.every = every
+        if os.path.exists(path):
+            with open(path) as fp:
+                state = json.load(fp)
+            if state.get('version') != 1:
+                raise ValueError("Unsupported counter state version")
+            self.hardware = state['hardware']
+            self.sub = state['sub']
+            self.incrementing = state['incrementing']
+            self.check()
+        else:
+            self.hardware = tpm.read_counter(refresh=True)
+            self.sub = 0
+            self.incrementing = False
+            self._save()
+
+    @property
+    def value(self):
+        """The current logical version, a (hardware, sub) tuple"""
+        return (self.hardware, self.sub)
+
+    def _save(self):
+        state = {
+            'version': 1,
+            'hardware': self.hardware,
+            'sub': self.sub,
+            'incrementing': self.incrementing,
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(state, fp)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.rename(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def check(self):
+        """
+        Check the state file against the TPM's counter
+
+        An increment interrupted before its result was saved is completed.
+
+        :returns: The current logical version
+        """
+        hardware = self.tpm.read_counter(refresh=True)
+        if self.incrementing and hardware == self.hardware + 1:
+            self.hardware = hardware
+            self.sub = 0
+            self.incrementing = False
+            self._save()
+        elif self.incrementing and hardware == self.hardware:
+            self.incrementing = False
+            self._save()
+        elif hardware != self.hardware:
+            raise CounterRollback("State is at counter %d but the TPM is at "
+                                  "%d" % (self.hardware, hardware))
+        return self.value
+
+    def bump(self):
+        """
+        Advance the logical version
+
+        :returns: The new logical version
+        """
+        self.sub += 1
+        if self.sub >= self.every:
+            return self.commit()
+        self._save()
+        return self.value
+
+    def commit(self):
+        """
+        Increment the hardware counter if any bumps are pending, so that
+        the current state can no longer be rolled back
+
+        :returns: The new logical version
+        """
+        if not self.sub:
+            return self.value
+        self.incrementing = True
+        self._save()
+        self.increment()
+        self.tpm.invalidate_counter()
+        hardware = self.tpm.read_counter()
+        if hardware != self.hardware + 1:
+            raise CounterRollback("Counter moved from %d to %d" %
+                                  (self.hardware, hardware))
+        self.hardware = hardware
+        self.sub = 0
+        self.incrementing = False
+        self._save()
+        return self.value
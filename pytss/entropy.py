@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Buffered TPM-sourced random numbers.
+
+Every Tspi_TPM_GetRandom call is a round trip to the TSS daemon and the
+TPM. TpmRandomPool fetches large blocks from the TPM in a background thread
+and hands out small requests, such as quote and challenge nonces, from a
+local buffer.
+"""
+
+import threading
+
+# TPM_GetRandom responses have to fit in the TPM's I/O buffer, which is
+# only guaranteed to be a little over 1KB on TPM 1.2 parts
+MAX_RANDOM_BLOCK = 1024
+
+# The first and longest waits between refill attempts after a failure
+ERROR_DELAY = 0.1
+MAX_ERROR_DELAY = 60.0
+
+
+class TpmRandomPool(object):
+    def __init__(self, tpm, block_size=MAX_RANDOM_BLOCK, capacity=None,
+                 low_water=None, lock=None):
+        """
+        Create a pool of TPM random bytes and start filling it
+
+        TSS contexts must not be used from two threads at once. Either give
+        the pool a TspiTPM from a context of its own, or pass the lock that
+        serialises every other user of the context.
+
+        :param tpm: The TspiTPM to draw random data from
+        :param block_size: The number of bytes to request per TPM call
+        :param capacity: The number of bytes to keep buffered, by default
+            four blocks
+        :param low_water: Refill once fewer than this many bytes remain, by
+            default half the capacity
+        :param lock: An optional lock held around every TPM call
+        """
+        self.tpm = tpm
+        self.block_size = min(block_size, MAX_RANDOM_BLOCK)
+        self.capacity = capacity or 4 * self.block_size
+        if low_water is None:
+            low_water = self.capacity // 2
+        self.low_water = low_water
+        self.lock = lock or threading.Lock()
+        self.buf = bytearray()
+        self.error = None
+        self.errors = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._fill)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _fetch(self, length):
+        with self.lock:
+            return self.tpm.get_random(length)
+
+    def _fill(self):
+        delay = ERROR_DELAY
+        while True:
+            with self.cond:
+                while (not self.closed and
+                       len(self.buf) >= self.low_water):
+                    self.cond.wait()
+
+            # Top the buffer up to capacity once it drops below low water
+            while True:
+                with self.cond:
+                    if self.closed:
+                        return
+                    wanted = min(self.block_size,
+                                 self.capacity - len(self.buf))
+                if wanted <= 0:
+                    break
+                try:
+                    block = self._fetch(wanted)
+                except Exception as e:
+                    # Keep the last error for inspection and back off. Reads
+                    # meanwhile go to the TPM themselves.
+                    with self.cond:
+                        self.error = e
+                        self.errors += 1
+                        if not self.closed:
+                            self.cond.wait(delay)
+                    delay = min(delay * 2, MAX_ERROR_DELAY)
+                    continue
+                delay = ERROR_DELAY
+                with self.cond:
+                    self.buf += block
+                    self.cond.notify_all()
+
+    def read(self, length):
+        """
+        Return random bytes from the pool
+
+        Requests that the buffer cannot satisfy are served directly from the
+        TPM rather than waiting for the background refill, so only those
+        see a TPM failure.
+
+        :param length: The number of bytes to return
+
+        :returns: A bytearray containing the random data
+        """
+        with self.cond:
+            if len(self.buf) >= length:
+                ret = self.buf[:length]
+                del self.buf[:length]
+                if len(self.buf) < self.low_water:
+                    self.cond.notify_all()
+                return ret
+            ret = self.buf
+            self.buf = bytearray()
+            self.cond.notify_all()
+
+        while len(ret) < length:
+            ret += self._fetch(min(self.block_size, length - len(ret)))
+        return ret
+
+    def close(self):
+        """Stop the background refill thread"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
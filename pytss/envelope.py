@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Envelope sealing of arbitrarily large payloads.
+
+Tspi_Data_Seal can only protect a few hundred bytes. To seal larger data a
+fresh AES-256 key is sealed with the TPM and the payload is streamed through
+AES-GCM in fixed-size chunks, so memory use does not depend on the payload
+size. Requires the cryptography package.
+
+An envelope is laid out as:
+
+    magic "PTSE" | version (1) | 3 bytes reserved | chunk size (4) |
+    sealed key length (4) | sealed key | chunk 0 | chunk 1 | ...
+
+Every chunk but the last holds exactly chunk size bytes of plaintext plus a
+16 byte GCM tag, so chunk i starts at a fixed offset and can be decrypted on
+its own. Chunk i is encrypted with the nonce 0^32 || i and authenticates the
+SHA256 of the header, its index and whether it is the final chunk, which
+catches reordered, spliced and truncated envelopes.
+
+hybrid_encrypt and hybrid_decrypt apply the same idea to bind and unbind:
+a fresh AES key is wrapped with the RSA key and the data is encrypted with
+AES-GCM in a single piece.
+"""
+
+import hashlib
+import os
+import struct
+
+MAGIC = b'PTSE'
+VERSION = 1
+DEFAULT_CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+
+_HEADER = struct.Struct('!4sB3xII')
+
+
+def _aesgcm(key):
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    return AESGCM(bytes(key))
+
+
+def _nonce(index):
+    return struct.pack('!IQ', 0, index)
+
+
+def _aad(header_digest, index, final):
+    return header_digest + struct.pack('!QB', index, 1 if final else 0)
+
+
+def _read_exact(src, length):
+    data = bytearray()
+    while len(data) < length:
+        block = src.read(length - len(data))
+        if not block:
+            break
+        data += block
+    return bytes(data)
+
+
+def seal_stream(key, src, dst, pcrs=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                rng=os.urandom):
+    """
+    Seal a stream to the local TPM
+
+    :param key: The TspiKey to seal the payload key with
+    :param src: A file-like object to read the payload from
+    :param dst: A file-like object to write the envelope to
+    :param pcrs: A list of PCRs to seal the payload key to
+    :param chunk_size: The number of plaintext bytes per chunk
+    :param rng: A function returning the requested number of random bytes
+
+    :returns: The number of payload bytes sealed
+    """
+    datakey = bytes(rng(32))
+    sealed = bytes(key.seal(bytearray(datakey), pcrs))
+
+    header = _HEADER.pack(MAGIC, VERSION, chunk_size, len(sealed)) + sealed
+    header_digest = hashlib.sha256(header).digest()
+    dst.write(header)
+
+    cipher = _aesgcm(datakey)
+    total = 0
+    index = 0
+    chunk = _read_exact(src, chunk_size)
+    while True:
+        following = _read_exact(src, chunk_size)
+        final = not following
+        dst.write(cipher.encrypt(_nonce(index), chunk,
+                                 _aad(header_digest, index, final)))
+        total += len(chunk)
+        if final:
+            return total
+        chunk = following
+        index += 1
+
+
+class EnvelopeReader(object):
+    def __init__(self, key, src):
+        """
+        Open a sealed envelope for reading
+
+        :param key: The TspiKey the payload key was sealed with
+        :param src: A seekable file-like object containing the envelope
+        """
+        self.src = src
+        fixed = _read_exact(src, _HEADER.size)
+        if len(fixed) < _HEADER.size:
+            raise ValueError("Truncated envelope header")
+        magic, version, self.chunk_size, sealedlen = _HEADER.unpack(fixed)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a sealed envelope")
+        sealed = _read_exact(src, sealedlen)
+        if len(sealed) < sealedlen:
+            raise ValueError("Truncated envelope header")
+
+        self.header_size = _HEADER.size + sealedlen
+        self.header_digest = hashlib.sha256(fixed + sealed).digest()
+        self.cipher = _aesgcm(key.unseal(bytearray(sealed)))
+
+        src.seek(0, os.SEEK_END)
+        body = src.tell() - self.header_size
+        stride = self.chunk_size + TAG_SIZE
+        self.chunk_count = max(1, (body + stride - 1) // stride)
+
+    def read_chunk(self, index):
+        """
+        Decrypt a single chunk
+
+        :param index: The chunk number
+
+        :returns: The plaintext of the chunk
+        """
+        if index < 0 or index >= self.chunk_count:
+            raise IndexError("Chunk index out of range")
+        stride = self.chunk_size + TAG_SIZE
+        self.src.seek(self.header_size + index * stride)
+        data = _read_exact(self.src, stride)
+        final = index == self.chunk_count - 1
+        return self.cipher.decrypt(_nonce(index), data,
+                                   _aad(self.header_digest, index, final))
+
+    def __iter__(self):
+        for index in range(self.chunk_count):
+            yield self.read_chunk(index)
+
+
+def unseal_stream(key, src, dst):
+    """
+    Unseal an envelope written by seal_stream
+
+    :param key: The TspiKey the payload key was sealed with
+    :param src: A seekable file-like object containing the envelope
+    :param dst: A file-like object to write the payload to
+
+    :returns: The number of payload bytes written
+    """
+    total = 0
+    for chunk in EnvelopeReader(key, src):
+        dst.write(chunk)
+        total += len(chunk)
+    return total
+
+
+HYBRID_MAGIC = b'PTSH'
+_HYBRID_HEADER = struct.Struct('!4sI')
+_NONCE_SIZE = 12
+
+
+def hybrid_encrypt(wrap, data, rng=os.urandom):
+    """
+    Encrypt data under a fresh AES-256 key and wrap that key asymmetrically
+
+    The result is laid out as magic "PTSH" | wrapped key length (4) |
+    wrapped key | nonce (12) | AES-GCM ciphertext and tag.
+
+    :param wrap: A function encrypting the 32 byte AES key, such as a bind
+        operation
+    :param data: The data to encrypt
+    :param rng: A function returning the requested number of random bytes
+
+    :returns: The encrypted blob
+    """
+    datakey = bytes(rng(32))
+    nonce = bytes(rng(_NONCE_SIZE))
+    wrapped = bytes(wrap(bytearray(datakey)))
+    header = _HYBRID_HEADER.pack(HYBRID_MAGIC, len(wrapped)) + wrapped
+    return header + nonce + _aesgcm(datakey).encrypt(nonce, bytes(data),
+                                                     header)
+
+
+def hybrid_decrypt(unwrap, blob):
+    """
+    Decrypt a blob produced by hybrid_encrypt
+
+    :param unwrap: A function recovering the AES key from the wrapped key,
+        such as an unbind operation
+    :param blob: The encrypted blob
+
+    :returns: The decrypted data
+    """
+    blob = bytes(blob)
+    if len(blob) < _HYBRID_HEADER.size:
+        raise ValueError("Truncated hybrid blob")
+    magic, wrappedlen = _HYBRID_HEADER.unpack_from(blob)
+    if magic != HYBRID_MAGIC:
+        raise ValueError("Not a hybrid blob")
+    offset = _HYBRID_HEADER.size + wrappedlen
+    if len(blob) < offset + _NONCE_SIZE + TAG_SIZE:
+        raise ValueError("Truncated hybrid blob")
+    wrapped = blob[_HYBRID_HEADER.size:offset]
+    nonce = blob[offset:offset + _NONCE_SIZE]
+    datakey = unwrap(bytearray(wrapped))
+    return _aesgcm(datakey).decrypt(nonce, blob[offset + _NONCE_SIZE:],
+                                    blob[:offset])
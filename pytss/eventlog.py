@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Measurement event log records and incremental PCR replay.
+
+TspiTPM.iter_events() yields PcrEvent records one at a time. PcrReplay
+folds such a stream into a running SHA1 digest per PCR, so a log of any
+length can be checked against the current PCR values while only ever
+holding one event and one digest per PCR in memory.
+
+Measurement logs only ever grow, so the state of a replay can be saved in a
+CheckpointStore once it has been validated. The next verification of the
+same machine resumes from the checkpoint and only replays the new events.
+"""
+
+import binascii
+import collections
+import hashlib
+import json
+import os
+import tempfile
+
+from pytss.structs import TpmQuoteInfo, pcr_composite
+
+PcrEvent = collections.namedtuple('PcrEvent',
+                                  ['pcr', 'number', 'event_type', 'digest',
+                                   'data'])
+
+PCR_RESET_VALUE = b'\x00' * 20
+
+
+class PcrReplay(object):
+    def __init__(self, initial=None):
+        """
+        Create a replay engine
+
+        :param initial: An optional dict mapping PCR indices to their value
+            at reset, for PCRs that do not start out as all zeroes
+        """
+        self.initial = dict(initial or {})
+        self.digests = {}
+        self.counts = {}
+
+    def extend(self, pcr, digest):
+        """
+        Extend the running digest of a PCR the way the TPM does
+
+        :param pcr: The PCR index
+        :param digest: The 20 byte measurement extended into the PCR
+
+        :returns: The new running digest
+        """
+        current = self.digests.get(pcr)
+        if current is None:
+            current = self.initial.get(pcr, PCR_RESET_VALUE)
+        m = hashlib.sha1()
+        m.update(bytes(current))
+        m.update(bytes(digest))
+        self.digests[pcr] = m.digest()
+        self.counts[pcr] = self.counts.get(pcr, 0) + 1
+        return self.digests[pcr]
+
+    def feed(self, events):
+        """
+        Consume a stream of events
+
+        :param events: An iterable of PcrEvent, such as the generator
+            returned by TspiTPM.iter_events()
+
+        :returns: The number of events consumed
+        """
+        consumed = 0
+        for event in events:
+            expected = self.counts.get(event.pcr, 0)
+            if event.number < expected:
+                # Already covered by a checkpoint
+                continue
+            if event.number > expected:
+                raise ValueError("Gap in event log for PCR %d at event %d" %
+                                 (event.pcr, expected))
+            self.extend(event.pcr, event.digest)
+            consumed += 1
+        return consumed
+
+    def catch_up(self, source, pcrs):
+        """
+        Replay only the events logged since this replay was last fed
+
+        :param source: An object providing iter_events(pcr=, start=), such
+            as a TspiTPM
+        :param pcrs: The PCR indices to bring up to date
+
+        :returns: The number of events consumed
+        """
+        consumed = 0
+        for pcr in pcrs:
+            consumed += self.feed(source.iter_events(
+                pcr=pcr, start=self.counts.get(pcr, 0)))
+        return consumed
+
+    def mismatches(self, pcrvalues):
+        """
+        Compare the replayed digests against PCR values read from a TPM
+
+        :param pcrvalues: A dict mapping PCR indices to their current value
+
+        :returns: A sorted list of PCR indices whose replayed digest differs
+        """
+        bad = []
+        for pcr in sorted(pcrvalues):
+            replayed = self.digests.get(pcr,
+                                        self.initial.get(pcr, PCR_RESET_VALUE))
+            if bytes(replayed) != bytes(pcrvalues[pcr]):
+                bad.append(pcr)
+        return bad
+
+    def verify(self, pcrvalues):
+        """
+        Check that the replayed log accounts for the given PCR values
+
+        :param pcrvalues: A dict mapping PCR indices to their current value
+
+        :returns: True if every PCR matches, False otherwise
+        """
+        return not self.mismatches(pcrvalues)
+
+    def composite_hash(self, pcrs):
+        """
+        Compute the TPM_PCR_COMPOSITE digest of the replayed values
+
+        :param pcrs: The PCR indices covered by the quote
+
+        :returns: The SHA1 digest a quote over the same PCRs should carry
+        """
+        values = {}
+        for pcr in pcrs:
+            values[pcr] = bytearray(self.digests.get(
+                pcr, self.initial.get(pcr, PCR_RESET_VALUE)))
+        m = hashlib.sha1()
+        m.update(pcr_composite(values))
+        return m.digest()
+
+    def matches_quote(self, data, pcrs):
+        """
+        Check that a quote was taken over the replayed PCR values. This does
+        not check the quote signature; see attestationutils.quote_verify.
+
+        :param data: The TPM_QUOTE_INFO returned by TspiTPM.get_quote()
+        :param pcrs: The PCR indices covered by the quote
+
+        :returns: True if the composite hash in the quote matches
+        """
+        return (self.composite_hash(pcrs) ==
+                TpmQuoteInfo(data).composite_hash.tobytes())
+
+    def checkpoint(self):
+        """
+        Serialise the replay state
+
+        :returns: A dict of per-PCR event counts and running digests
+        """
+        pcrs = {}
+        for pcr in self.digests:
+            pcrs[str(pcr)] = {
+                'count': self.counts[pcr],
+                'digest': binascii.hexlify(bytes(self.digests[pcr])).decode(),
+            }
+        return {'version': 1, 'pcrs': pcrs}
+
+    @classmethod
+    def from_checkpoint(cls, state, initial=None):
+        """
+        Resume a replay from a checkpoint
+
+        :param state: A dict previously returned by checkpoint()
+        :param initial: As for PcrReplay()
+
+        :returns: A PcrReplay
+        """
+        if state.get('version') != 1:
+            raise ValueError("Unsupported checkpoint version")
+        replay = cls(initial)
+        for pcr, entry in state['pcrs'].items():
+            replay.digests[int(pcr)] = binascii.unhexlify(entry['digest'])
+            replay.counts[int(pcr)] = entry['count']
+        return replay
+
+
+class CheckpointStore(object):
+    def __init__(self, directory):
+        """
+        Persist replay checkpoints, one file per machine
+
+        :param directory: The directory to keep checkpoints in
+        """
+        self.directory = directory
+
+    def _path(self, machine):
+        m = hashlib.sha1()
+        m.update(machine.encode('utf-8'))
+        return os.path.join(self.directory, m.hexdigest() + '.json')
+
+    def load(self, machine, initial=None):
+        """
+        Load the checkpoint for a machine
+
+        :param machine: A string identifying the machine
+        :param initial: As for PcrReplay()
+
+        :returns: A PcrReplay, or None if there is no usable checkpoint
+        """
+        try:
+            with open(self._path(machine)) as fp:
+                state = json.load(fp)
+            return PcrReplay.from_checkpoint(state, initial)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def save(self, machine, replay):
+        """
+        Atomically store the checkpoint for a machine. Only save a replay
+        once it has been validated against the TPM.
+
+        :param machine: A string identifying the machine
+        :param replay: The PcrReplay to store
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(replay.checkpoint(), fp)
+            os.rename(tmp, self._path(machine))
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def discard(self, machine):
+        """
+        Remove the checkpoint for a machine
+
+        :param machine: A string identifying the machine
+        """
+        try:
+            os.unlink(self._path(machine))
+        except OSError:
+            pass
+
+    def verify(self, machine, source, pcrvalues, initial=None):
+        """
+        Validate a machine's event log against its PCR values, replaying only
+        the events logged since the last successful verification
+
+        If the resumed replay does not match, the log may have been restarted
+        by a reboot, so the whole log is replayed once more from scratch.
+
+        :param machine: A string identifying the machine
+        :param source: An object providing iter_events(pcr=, start=)
+        :param pcrvalues: A dict mapping PCR indices to their current value
+        :param initial: As for PcrReplay()
+
+        :returns: True if the log accounts for every PCR value
+        """
+        replay = self.load(machine, initial)
+        if replay is not None:
+            try:
+                replay.catch_up(source, sorted(pcrvalues))
+            except ValueError:
+                replay = None
+            if replay is not None and replay.verify(pcrvalues):
+                self.save(machine, replay)
+                return True
+
+        replay = PcrReplay(initial)
+        replay.catch_up(source, sorted(pcrvalues))
+        if replay.verify(pcrvalues):
+            self.save(machine, replay)
+            return True
+
+        self.discard(machine)
+        return False
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Quote collection across many remote TSS daemons.
+
+TspiContext.connect(host) talks to a remote tcsd, but every call blocks
+until that host answers. FleetCollector keeps a context per host and
+quotes hundreds of hosts at once from a bounded pool of threads, yielding
+each host's result as soon as it arrives. Hosts that take longer than the
+per-host timeout are reported as timed out, and their context is replaced
+before the next collection.
+
+Contexts come from a factory, by default one connecting to the host, so
+collections can be tested against local stand-ins such as the software TPM
+(PYTSS_BACKEND=soft).
+"""
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+HostQuote = collections.namedtuple('HostQuote',
+                                   'data validation pcrs elapsed')
+
+LatencyReport = collections.namedtuple(
+    'LatencyReport', 'count errors timeouts p50 p90 p99 max')
+
+
+class HostTimeout(Exception):
+    """A host did not answer within the per-host timeout"""
+
+
+def connect(host):
+    """The default context factory: connect a new context to host"""
+    import pytss
+    context = pytss.TspiContext()
+    context.connect(host)
+    return context
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+class _HostState(object):
+    def __init__(self, context, aikblob):
+        self.context = context
+        self.aikblob = aikblob
+        self.srk = None
+        self.aik = None
+
+
+class FleetCollector(object):
+    def __init__(self, hosts, pcrs, workers=32, timeout=10.0,
+                 context_factory=connect):
+        """
+        Create a collector
+
+        :param hosts: A dict mapping each host to the TSS key blob of its
+            Attestation Identity Key
+        :param pcrs: The PCR indices to read and quote
+        :param workers: The largest number of hosts contacted at once
+        :param timeout: Seconds a host may take before it is reported as
+            timed out
+        :param context_factory: A callable taking a host and returning a
+            connected TspiContext
+        """
+        self.hosts = dict(hosts)
+        self.pcrs = list(pcrs)
+        self.workers = workers
+        self.timeout = timeout
+        self.context_factory = context_factory
+        self.states = {}
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.timeouts = 0
+
+    def _state(self, host):
+        with self.lock:
+            state = self.states.get(host)
+        if state is None:
+            state = _HostState(self.context_factory(host), self.hosts[host])
+            with self.lock:
+                self.states[host] = state
+        return state
+
+    def _drop(self, host, state=None):
+        with self.lock:
+            if state is None or self.states.get(host) is state:
+                self.states.pop(host, None)
+
+    def _quote(self, state, nonce):
+        from pytss.attestationutils import srk_uuid, well_known_secret
+        from pytss.tspi_defines import (TSS_PCRS_STRUCT_INFO,
+                                        TSS_POLICY_USAGE, TSS_PS_TYPE_SYSTEM,
+                                        TSS_SECRET_MODE_SHA1)
+        context = state.context
+        if state.aik is None:
+            srk = context.load_key_by_uuid(TSS_PS_TYPE_SYSTEM, srk_uuid)
+            policy = srk.get_policy_object(TSS_POLICY_USAGE)
+            policy.set_secret(TSS_SECRET_MODE_SHA1, well_known_secret)
+            state.aik = context.load_key_by_blob(srk, state.aikblob)
+            state.srk = srk
+        pcrs = context.create_pcrs(TSS_PCRS_STRUCT_INFO)
+        try:
+            pcrs.set_pcrs(self.pcrs)
+            data, validation = context.get_tpm_object().get_quote(
+                state.aik, pcrs, nonce)
+            values = dict((pcr, bytearray(value))
+                          for pcr, value in pcrs.get_pcrs().items())
+        finally:
+            pcrs.close()
+        return data, validation, values
+
+    def _collect_host(self, host, nonce, started):
+        started[host] = time.time()
+        state = self._state(host)
+        try:
+            data, validation, values = self._quote(state, nonce)
+        except Exception:
+            # The connection may be broken, so start afresh next time
+            self._drop(host, state)
+            raise
+        return HostQuote(data, validation, values,
+                         time.time() - started[host])
+
+    def collect(self, nonce, hosts=None):
+        """
+        Quote every host
+
+        :param nonce: The challenge to quote with, as for get_quote
+        :param hosts: The hosts to contact, by default all of them
+
+        :returns: A generator of (host, HostQuote or exception) tuples in
+            the order the hosts finish. Hosts that time out yield a
+            HostTimeout.
+        """
+        if hosts is None:
+            hosts = sorted(self.hosts)
+        self.latencies = []
+        self.errors = 0
+        self.timeouts = 0
+        started = {}
+        pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+        try:
+            running = dict((pool.submit(self._collect_host, host, nonce,
+                                        started), host)
+                           for host in hosts)
+            while running:
+                done, _ = concurrent.futures.wait(
+                    running, timeout=self._next_deadline(running, started),
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    host = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        result = future.result()
+                        self.latencies.append(result.elapsed)
+                        yield (host, result)
+                    else:
+                        self.errors += 1
+                        yield (host, error)
+
+                now = time.time()
+                for future, host in list(running.items()):
+                    begun = started.get(host)
+                    if begun is not None and now - begun >= self.timeout:
+                        # The call cannot be interrupted, so abandon it and
+                        # its context
+                        del running[future]
+                        self._drop(host)
+                        self.timeouts += 1
+                        yield (host, HostTimeout(
+                            "%s did not answer in %.1fs" %
+                            (host, self.timeout)))
+        finally:
+            # Do not wait for abandoned calls
+            pool.shutdown(wait=False)
+
+    def _next_deadline(self, running, started):
+        deadlines = [started[host] + self.timeout
+                     for host in running.values() if host in started]
+        if not deadlines:
+            return self.timeout
+        return max(0.0, min(deadlines) - time.time())
+
+    def latency(self):
+        """
+        Summarise the last collection
+
+        :returns: A LatencyReport of the successful hosts' latencies in
+            seconds, with the number of errors and timeouts
+        """
+        values = self.latencies
+        return LatencyReport(len(values), self.errors, self.timeouts,
+                             _percentile(values, 0.50),
+                             _percentile(values, 0.90),
+                             _percentile(values, 0.99),
+                             max(values) if values else None)
+
+    def close(self):
+        """Drop every host's context"""
+        with self.lock:
+            self.states = {}
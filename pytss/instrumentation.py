@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Per-call instrumentation of libtspi.
+
+When enabled, every wrapped Tspi_ call is timed and counted per function,
+together with the number of failures by exception class. Latencies are kept
+in a log-linear histogram in the style of HdrHistogram, so percentiles are
+accurate to a few percent over any range in constant memory.
+
+Enable it with enable() or by setting PYTSS_INSTRUMENT=1 in the environment
+before importing pytss. While disabled the only cost is a single check in
+wrap_libtspi_func.
+"""
+
+import threading
+import time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class LatencyHistogram(object):
+    def __init__(self, precision=5):
+        """
+        Create an empty histogram
+
+        :param precision: Values are bucketed to within 2**-precision of
+            their magnitude
+        """
+        self.precision = precision
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value):
+        shift = value.bit_length() - 1 - self.precision
+        if shift <= 0:
+            return value
+        return (value >> shift) << shift
+
+    def record(self, value):
+        """
+        Record a value
+
+        :param value: A non-negative integer, such as a latency in ns
+        """
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """
+        Return the value below which pct percent of recorded values fall
+
+        :param pct: The percentile, from 0 to 100
+        """
+        if not self.count:
+            return None
+        target = max(1, int(round(self.count * pct / 100.0)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(bucket, self.max)
+        return self.max
+
+    def to_dict(self):
+        """Return the histogram as a dict of summary values and buckets"""
+        ret = {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': float(self.total) / self.count if self.count else None,
+            'buckets': sorted(self.buckets.items()),
+        }
+        for pct in (50, 90, 99, 99.9):
+            ret['p%s' % str(pct).replace('.', '')] = self.percentile(pct)
+        return ret
+
+
+class CallStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.errors = {}
+        self.latency = LatencyHistogram()
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': dict(self.errors),
+            'latency_ns': self.latency.to_dict(),
+        }
+
+
+class Instrumentation(object):
+    """A call hook collecting CallStats for every Tspi_ function"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def __call__(self, name, call, args):
+        start = _clock()
+        error = None
+        try:
+            return call(*args)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._record(name, int((_clock() - start) * 1e9), error)
+
+    def _record(self, name, elapsed, error):
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = CallStats()
+            stats.calls += 1
+            stats.latency.record(elapsed)
+            if error is not None:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict((name, stats.to_dict())
+                        for name, stats in self.stats.items())
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+
+_instrumentation = None
+
+
+def enable():
+    """Start collecting per-call statistics"""
+    global _instrumentation
+    from pytss.interface import add_call_hook
+    if _instrumentation is None:
+        _instrumentation = Instrumentation()
+        add_call_hook(_instrumentation)
+
+
+def disable():
+    """Stop collecting statistics, discarding those collected so far"""
+    global _instrumentation
+    from pytss.interface import remove_call_hook
+    if _instrumentation is not None:
+        remove_call_hook(_instrumentation)
+        _instrumentation = None
+
+
+def is_enabled():
+    return _instrumentation is not None
+
+
+def snapshot():
+    """
+    Export the statistics collected so far
+
+    :returns: A dict mapping Tspi_ function names to dicts of call count,
+        error counts by exception class and latency histogram in ns
+    """
+    if _instrumentation is None:
+        return {}
+    return _instrumentation.snapshot()
+
+
+def reset():
+    """Discard the statistics collected so far"""
+    if _instrumentation is not None:
+        _instrumentation.reset()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Batched PCR extends backed by a hash-chained event journal.
+
+Extending a PCR for every event makes the TPM the bottleneck of anything
+that logs at a high rate, and TspiTPM.extend_pcr keeps no record of what
+was extended. ExtendJournal instead appends each event to a local journal
+file and folds it into a running SHA1 hash chain. Every so many events, or
+every so many seconds, it extends one PCR with the chain head, anchoring
+every event up to that point in the TPM.
+
+JournalReplay reads a journal back, recomputes the chain and the PCR value
+its extensions should have produced, and checks that against the PCR.
+
+The journal is a magic number followed by records, each a type byte, a
+UINT32 length and a payload:
+
+- START: the PCR index and its value when the journal was created
+- EVENT: the event data
+- EXTEND: a chain head, written and synced before the PCR is extended
+
+The PCR must be used for nothing but the journal, and the journal only
+covers one boot of the TPM.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+
+from pytss.eventlog import PcrReplay
+
+MAGIC = b'PTJR\x01'
+
+START = 1
+EVENT = 2
+EXTEND = 3
+
+RECORD_HEADER = struct.Struct('!BI')
+
+CHAIN_START = b'\x00' * 20
+
+
+class JournalError(Exception):
+    """A journal does not match its PCR, or is damaged"""
+
+
+def extended(value, head):
+    """The value of a PCR at value once extended with a chain head"""
+    m = hashlib.sha1()
+    m.update(bytes(value))
+    m.update(hashlib.sha1(head).digest())
+    return m.digest()
+
+
+def chain(head, data):
+    """Fold an event into the hash chain, returning the new head"""
+    m = hashlib.sha1()
+    m.update(head)
+    m.update(hashlib.sha1(bytes(data)).digest())
+    return m.digest()
+
+
+def iter_records(fp):
+    """
+    Read the records of a journal
+
+    A record cut short by a crash while it was being written ends the
+    journal.
+
+    :param fp: A binary file positioned at the start of the journal
+
+    :returns: A generator of (offset, type, payload) tuples, where offset
+        is the end of the record
+    """
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise JournalError("Not a journal")
+    offset = len(MAGIC)
+    while True:
+        header = fp.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        rtype, length = RECORD_HEADER.unpack(header)
+        payload = fp.read(length)
+        if len(payload) < length:
+            return
+        offset += RECORD_HEADER.size + length
+        yield (offset, rtype, payload)
+
+
+class JournalReplay(object):
+    def __init__(self):
+        """Create an empty replay; see feed()"""
+        self.pcr = None
+        self.head = CHAIN_START
+        self.events = 0
+        self.anchored = 0
+        self.extended = 0
+        self.end = None
+        self.replay = None
+        self.last_extend = None
+
+    def feed(self, fp):
+        """
+        Replay a journal
+
+        :param fp: A binary file positioned at the start of the journal
+
+        :returns: The number of events read
+        """
+        for offset, rtype, payload in iter_records(fp):
+            if rtype == START:
+                if self.pcr is not None or len(payload) != 24:
+                    raise JournalError("Bad START record")
+                self.pcr = struct.unpack('!I', payload[:4])[0]
+                self.replay = PcrReplay({self.pcr: payload[4:]})
+            elif self.pcr is None:
+                raise JournalError("Journal does not begin with START")
+            elif rtype == EVENT:
+                self.head = chain(self.head, payload)
+                self.events += 1
+            elif rtype == EXTEND:
+                if payload != self.head:
+                    raise JournalError("EXTEND record does not match the "
+                                       "chain at event %d" % self.events)
+                self.last_extend = (self.anchored, self.pcr_value, payload)
+                self.replay.extend(self.pcr, hashlib.sha1(payload).digest())
+                self.anchored = self.extended = self.events
+            else:
+                raise JournalError("Unknown record type %d" % rtype)
+            self.end = offset
+        if self.pcr is None:
+            raise JournalError("Empty journal")
+        return self.events
+
+    @property
+    def pcr_value(self):
+        """The PCR value the journal's extensions should have produced"""
+        return self.replay.digests.get(self.pcr,
+                                       self.replay.initial[self.pcr])
+
+    @property
+    def pending(self):
+        """The number of events not yet anchored in the PCR"""
+        return self.events - self.anchored
+
+    def verify(self, pcr_value):
+        """
+        Check the journal against the PCR
+
+        The journal's last extension may not have reached the TPM if the
+        writer stopped while making it. Its events then count as pending.
+
+        :param pcr_value: The current value of the journal's PCR
+
+        :returns: True if the journal accounts for the PCR value
+        """
+        pcr_value = bytes(pcr_value)
+        if pcr_value == bytes(self.pcr_value):
+            return True
+        if (self.last_extend is not None and
+                pcr_value == bytes(self.last_extend[1])):
+            self.anchored = self.last_extend[0]
+            return True
+        return False
+
+
+def verify_journal(path, pcr_value):
+    """
+    Check a journal file against its PCR
+
+    :param path: The journal
+    :param pcr_value: The current value of the journal's PCR
+
+    :returns: A JournalReplay, whose anchored and pending counts say how
+        many events the PCR vouches for, or None if the journal does not
+        match the PCR
+    """
+    replay = JournalReplay()
+    with open(path, 'rb') as fp:
+        replay.feed(fp)
+    if not replay.verify(pcr_value):
+        return None
+    return replay
+
+
+class ExtendJournal(object):
+    def __init__(self, tpm, pcr, path, every=64, interval=None, lock=None):
+        """
+        Open or create an extend journal
+
+        An existing journal is checked against the PCR and resumed. If the
+        writer stopped while extending the PCR, the extension is completed.
+
+        :param tpm: The TspiTPM whose PCR is extended
+        :param pcr: The PCR to extend, which must not be used for anything
+            else
+        :param path: The journal file
+        :param every: Extend the PCR once this many events are pending
+        :param interval: If given, also extend the PCR every interval
+            seconds while events are pending
+        :param lock: An optional lock held around every TPM call
+        """
+        self.tpm = tpm
+        self.pcr = pcr
+        self.path = path
+        self.every = every
+        self.interval = interval
+        self.lock = lock or threading.Lock()
+        self.mutex = threading.Lock()
+        self.extending = threading.Lock()
+        self.closed = False
+        # (value before, chain head) of an extension that may not have
+        # reached the TPM
+        self.unsettled = None
+        self.failures = 0
+
+        if os.path.exists(path) and os.path.getsize(path):
+            self._resume()
+        else:
+            self.fp = open(path, 'wb')
+            with self.lock:
+                value = self.tpm.read_pcr(pcr)
+            self.fp.write(MAGIC)
+            self._write(START, struct.pack('!I', pcr) + bytes(value))
+            self._sync()
+            self.head = CHAIN_START
+            self.events = 0
+            self.pending = 0
+            self.value = bytes(value)
+
+        self.cond = threading.Condition(self.mutex)
+        self.thread = None
+        if interval is not None:
+            self.thread = threading.Thread(target=self._timer)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _resume(self):
+        replay = JournalReplay()
+        with open(self.path, 'rb') as fp:
+            replay.feed(fp)
+        if replay.pcr != self.pcr:
+            raise JournalError("Journal is for PCR %d" % replay.pcr)
+        with self.lock:
+            value = self.tpm.read_pcr(self.pcr)
+        if not replay.verify(value):
+            raise JournalError("Journal does not match PCR %d" % self.pcr)
+
+        self.fp = open(self.path, 'r+b')
+        # Drop any record cut short by a crash
+        self.fp.truncate(replay.end)
+        self.fp.seek(replay.end)
+        self.head = replay.head
+        self.events = replay.events
+        self.pending = replay.events - replay.extended
+        self.value = bytes(replay.pcr_value)
+        if bytes(value) != self.value:
+            # The last EXTEND record never reached the TPM
+            self.unsettled = (bytes(value), replay.last_extend[2])
+            self._settle()
+
+    def _write(self, rtype, payload):
+        self.fp.write(RECORD_HEADER.pack(rtype, len(payload)) + payload)
+
+    def _sync(self):
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+
+    def append(self, data):
+        """
+        Journal an event
+
+        :param data: The event data
+
+        :returns: The number of the event in the journal
+        """
+        data = bytes(data)
+        with self.mutex:
+            if self.closed:
+                raise ValueError("Journal is closed")
+            self._write(EVENT, data)
+            self.head = chain(self.head, data)
+            number = self.events
+            self.events += 1
+            self.pending += 1
+            due = self.pending >= self.every
+        if due:
+            try:
+                self.checkpoint()
+            except Exception:
+                # The event is journaled, and the extension is retried by
+                # the next checkpoint
+                pass
+        return number
+
+    def _settle(self):
+        """
+        Make the PCR match the last EXTEND record, with self.extending held
+
+        An extension that failed may still have reached the TPM, so the
+        PCR is read before it is retried.
+        """
+        before, head = self.unsettled
+        with self.lock:
+            value = bytes(self.tpm.read_pcr(self.pcr))
+            if value == before:
+                try:
+                    value = bytes(self.tpm.extend_pcr(self.pcr, head, None))
+                except Exception:
+                    self.failures += 1
+                    raise
+        if value != self.value:
+            raise JournalError("Journal does not match PCR %d" % self.pcr)
+        self.unsettled = None
+        return value
+
+    def checkpoint(self):
+        """
+        Extend the PCR with the chain head if any events are pending
+
+        An extension that failed is completed first, and no new EXTEND
+        record is written until it has been, so the journal never holds an
+        anchor the PCR did not receive. A failure is raised to the caller,
+        and the next checkpoint tries again.
+
+        :returns: The new PCR value, or None if nothing was pending
+        """
+        # Extensions must reach the TPM in journal order
+        with self.extending:
+            value = None
+            if self.unsettled is not None:
+                value = self._settle()
+            with self.mutex:
+                if not self.pending:
+                    return value
+                head = self.head
+                self._write(EXTEND, head)
+                self._sync()
+                self.pending = 0
+                self.unsettled = (self.value, head)
+                self.value = extended(self.value, head)
+            try:
+                with self.lock:
+                    value = bytes(self.tpm.extend_pcr(self.pcr, head, None))
+            except Exception:
+                self.failures += 1
+                raise
+            if value != self.value:
+                raise JournalError("Journal does not match PCR %d" %
+                                   self.pcr)
+            self.unsettled = None
+            return value
+
+    def _timer(self):
+        while True:
+            with self.cond:
+                self.cond.wait(self.interval)
+                if self.closed:
+                    return
+            try:
+                self.checkpoint()
+            except Exception:
+                # Retried on the next tick
+                pass
+
+    def close(self):
+        """Anchor any pending events and close the journal"""
+        self.checkpoint()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        with self.mutex:
+            self.fp.close()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Keys generated ahead of time.
+
+Generating a key with Tspi_Key_CreateKey can take several seconds on TPM
+1.2 hardware, as can the identity key generation behind
+attestationutils.create_aik. KeyPregenPool and AikPool keep a number of
+keys ready, generating more in a background thread while nothing else is
+using the TPM, so that a key can be handed out without waiting for the TPM.
+Keys can be stored on disk, so a pool filled by one process can be drawn on
+by the next.
+
+A wrapped key blob is only useful with the parent key that wrapped it, so a
+pool directory must only ever be used with one parent.
+"""
+
+import abc
+import collections
+import errno
+import os
+import struct
+import threading
+import time
+import uuid
+
+from pytss import TspiKey
+
+BLOB_SUFFIX = '.blob'
+TMP_SUFFIX = '.tmp'
+TAKEN_SUFFIX = '.taken'
+
+# Partly written or claimed files older than this many seconds were left
+# behind by a process that died, and are removed when a pool starts
+STALE_AGE = 3600
+
+# The longest wait between retries after a failed generation
+MAX_ERROR_DELAY = 60.0
+
+# The one kind of key an AikPool keeps
+AIK = 'aik'
+
+
+def _kind_name(kind):
+    return '%08x-%08x' % kind
+
+
+class _PregenPool(abc.ABC):
+    def __init__(self, kinds, target, low_water, directory, idle_delay,
+                 lock):
+        self.kinds = list(kinds)
+        self.target = target
+        if low_water is None:
+            low_water = target
+        self.low_water = low_water
+        self.directory = directory
+        self.idle_delay = idle_delay
+        self.lock = lock or threading.Lock()
+        self.ready = dict((kind, collections.deque()) for kind in self.kinds)
+        self.filling = set()
+        self.error = None
+        self.errors = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        if directory is not None:
+            self._load()
+        self.thread = threading.Thread(target=self._fill)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @abc.abstractmethod
+    def _generate(self, kind):
+        """Generate a key of a kind, with the lock held"""
+
+    def _encode(self, item):
+        return item
+
+    def _decode(self, data):
+        return data
+
+    def _kind_dir(self, kind):
+        return os.path.join(self.directory, self._dir_name(kind))
+
+    def _dir_name(self, kind):
+        return _kind_name(kind)
+
+    def _load(self):
+        for kind in self.kinds:
+            path = self._kind_dir(kind)
+            try:
+                names = sorted(os.listdir(path))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            now = time.time()
+            for name in names:
+                entry = os.path.join(path, name)
+                if name.endswith(BLOB_SUFFIX):
+                    self.ready[kind].append(entry)
+                elif name.endswith((TMP_SUFFIX, TAKEN_SUFFIX)):
+                    self._remove_stale(entry, now)
+
+    def _remove_stale(self, entry, now):
+        try:
+            if now - os.stat(entry).st_mtime > STALE_AGE:
+                os.unlink(entry)
+        except OSError as e:
+            # Another process may have finished with it first
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _store(self, kind, item):
+        """Keep an item, returning the path or the item itself to queue"""
+        if self.directory is None:
+            return item
+        path = self._kind_dir(kind)
+        try:
+            os.makedirs(path, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        name = os.path.join(path, uuid.uuid4().hex)
+        fd = os.open(name + TMP_SUFFIX,
+                     os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self._encode(item))
+        # Only complete blobs are ever picked up by _load
+        os.rename(name + TMP_SUFFIX, name + BLOB_SUFFIX)
+        return name + BLOB_SUFFIX
+
+    def _take(self, entry):
+        """Claim a stored item, or return None if another process has"""
+        if self.directory is None:
+            return entry
+        # Renaming is atomic, so only one process can claim a blob
+        claimed = '%s.%s%s' % (entry, uuid.uuid4().hex, TAKEN_SUFFIX)
+        try:
+            os.rename(entry, claimed)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        with open(claimed, 'rb') as f:
+            data = bytearray(f.read())
+        os.unlink(claimed)
+        return self._decode(data)
+
+    def _locked_generate(self, kind, wait=True):
+        """Generate a key, or return None if the TPM is busy"""
+        if not self.lock.acquire(wait):
+            return None
+        try:
+            return self._generate(kind)
+        finally:
+            self.lock.release()
+
+    def _wanted(self):
+        """Return the kind to generate next, if any"""
+        for kind in self.kinds:
+            count = len(self.ready[kind])
+            if count < self.low_water:
+                self.filling.add(kind)
+            elif count >= self.target:
+                self.filling.discard(kind)
+        if not self.filling:
+            return None
+        return min(self.filling, key=lambda k: len(self.ready[k]))
+
+    def _fill(self):
+        delay = self.idle_delay
+        while True:
+            with self.cond:
+                while not self.closed and self._wanted() is None:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                kind = self._wanted()
+
+            try:
+                item = self._locked_generate(kind, wait=False)
+                if item is not None:
+                    entry = self._store(kind, item)
+            except Exception as e:
+                # Keep the last error for inspection and back off, so a
+                # failing TPM is not hammered. Callers of get() still fall
+                # back to generating keys themselves.
+                with self.cond:
+                    self.error = e
+                    self.errors += 1
+                    if not self.closed:
+                        self.cond.wait(delay)
+                delay = min(max(delay, 0.1) * 2, MAX_ERROR_DELAY)
+                continue
+
+            delay = self.idle_delay
+            with self.cond:
+                if item is None:
+                    self.cond.wait(self.idle_delay)
+                else:
+                    self.ready[kind].append(entry)
+                    self.cond.notify_all()
+
+    def _available(self, kind):
+        with self.cond:
+            return len(self.ready[kind])
+
+    def _get(self, kind):
+        if kind not in self.ready:
+            raise KeyError("The pool does not keep %s keys" %
+                           self._dir_name(kind))
+        while True:
+            with self.cond:
+                entry = None
+                if self.ready[kind]:
+                    entry = self.ready[kind].popleft()
+                if len(self.ready[kind]) < self.low_water:
+                    self.cond.notify_all()
+            if entry is None:
+                return self._locked_generate(kind)
+            item = self._take(entry)
+            if item is not None:
+                return item
+
+    def close(self):
+        """Stop the background refill thread, keeping any stored keys"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+
+
+class KeyPregenPool(_PregenPool):
+    def __init__(self, parent, kinds, target=4, low_water=None,
+                 directory=None, flags=0, idle_delay=0.5, lock=None):
+        """
+        Create a pool of pre-generated keys and start filling it
+
+        TSS contexts must not be used from two threads at once. Either give
+        the pool a parent key from a context of its own, or pass the lock
+        that serialises every other user of the context. The pool only
+        generates a key when it can take the lock without waiting, and
+        otherwise tries again after idle_delay seconds, so that foreground
+        users of the TPM are not held up behind a key generation.
+
+        :param parent: The loaded storage TspiKey to wrap the keys with
+        :param kinds: The kinds of key to keep, as (TSS_KEY_TYPE_,
+            TSS_KEY_SIZE_) tuples
+        :param target: The number of keys of each kind to keep ready
+        :param low_water: Refill a kind once fewer than this many keys
+            remain, by default the target
+        :param directory: A directory to keep the key blobs in, or None to
+            only keep them in memory
+        :param flags: Further TSS_KEY_ flags for every key, such as
+            TSS_KEY_NO_AUTHORIZATION
+        :param idle_delay: Seconds to wait before retrying when the TPM is
+            busy
+        :param lock: An optional lock held around every TPM call
+        """
+        self.parent = parent
+        self.flags = flags
+        super(KeyPregenPool, self).__init__(
+            [tuple(kind) for kind in kinds], target, low_water, directory,
+            idle_delay, lock)
+
+    def _generate(self, kind):
+        key = TspiKey.create(self.parent, kind[0] | kind[1] | self.flags)
+        try:
+            return key.get_keyblob()
+        finally:
+            key.close()
+
+    def available(self, key_type, key_size):
+        """Return the number of keys of a kind that are ready"""
+        return self._available((key_type, key_size))
+
+    def get(self, key_type, key_size):
+        """
+        Return a wrapped key blob
+
+        Keys are handed out from the pool, and only generated while the
+        caller waits when none of the kind are ready. Every blob is handed
+        out once.
+
+        :param key_type: The TSS_KEY_TYPE_ of the key
+        :param key_size: The TSS_KEY_SIZE_ of the key
+
+        :returns: A bytearray containing the TSS key blob, for
+            TspiContext.load_key_by_blob
+        """
+        return self._get((key_type, key_size))
+
+
+class AikPool(_PregenPool):
+    def __init__(self, context, target=4, low_water=None, directory=None,
+                 idle_delay=0.5, lock=None):
+        """
+        Create a pool of pre-generated attestation identity keys and start
+        filling it
+
+        The keys are generated as attestationutils.create_aik does, so the
+        SRK and TPM owner must use the well known secret. As with
+        KeyPregenPool, either give the pool a context of its own or pass
+        the lock that serialises every other user of the context.
+
+        :param context: The connected TspiContext to generate keys with
+        :param target: The number of keys to keep ready
+        :param low_water: Refill once fewer than this many keys remain, by
+            default half the target
+        :param directory: A directory to keep the keys in, or None to only
+            keep them in memory
+        :param idle_delay: Seconds to wait before retrying when the TPM is
+            busy
+        :param lock: An optional lock held around every TPM call
+        """
+        self.context = context
+        self.identity = None
+        if low_water is None:
+            low_water = max(1, target // 2)
+        super(AikPool, self).__init__([AIK], target, low_water, directory,
+                                      idle_delay, lock)
+
+    def _dir_name(self, kind):
+        return kind
+
+    def _generate(self, kind):
+        from pytss import attestationutils
+        # The SRK, policies and dummy CA key are shared by every AIK
+        if self.identity is None:
+            self.identity = attestationutils.prepare_aik(self.context)
+        return attestationutils.create_aik(self.context, self.identity)
+
+    def _encode(self, item):
+        pubkey, blob = item
+        return struct.pack('!I', len(pubkey)) + bytes(pubkey) + bytes(blob)
+
+    def _decode(self, data):
+        length = struct.unpack_from('!I', data)[0]
+        return (data[4:4 + length], data[4 + length:])
+
+    def available(self):
+        """Return the number of keys that are ready"""
+        return self._available(AIK)
+
+    def get(self):
+        """
+        Return an attestation identity key
+
+        Keys are handed out from the pool, and only generated while the
+        caller waits when none are ready. Every key is handed out once.
+
+        :returns: a tuple containing the RSA public key and a TSS key blob,
+            as returned by attestationutils.create_aik
+        """
+        return self._get(AIK)
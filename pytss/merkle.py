@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Merkle trees and inclusion proofs.
+
+A single TPM operation, such as a signature or a quote, can vouch for many
+items at once by covering the root of a Merkle tree over them. Each item
+then comes with a short proof linking it to that root.
+
+Trees follow RFC 6962: leaves and interior nodes are hashed with distinct
+prefixes, so a leaf can never be passed off as a node, and a node without
+a sibling is carried up to the next level unchanged.
+"""
+
+import collections
+import hashlib
+import struct
+
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+# The hash algorithms a tree may use, by the identifier in encoded proofs
+HASHES = {
+    1: 'sha1',
+    2: 'sha256',
+}
+_HASH_IDS = dict((name, ident) for ident, name in HASHES.items())
+
+MerkleProof = collections.namedtuple('MerkleProof',
+                                     'hash_name index size path')
+
+
+def _new_hash(hash_name):
+    if hash_name not in _HASH_IDS:
+        raise ValueError("Unsupported hash %r" % (hash_name,))
+    return hashlib.new(hash_name)
+
+
+def leaf_hash(data, hash_name='sha256'):
+    """Return the tree hash of a leaf"""
+    h = _new_hash(hash_name)
+    h.update(LEAF_PREFIX)
+    h.update(bytes(data))
+    return h.digest()
+
+
+def node_hash(left, right, hash_name='sha256'):
+    """Return the tree hash of an interior node"""
+    h = _new_hash(hash_name)
+    h.update(NODE_PREFIX)
+    h.update(left)
+    h.update(right)
+    return h.digest()
+
+
+class MerkleTree(object):
+    def __init__(self, items, hash_name='sha256'):
+        """
+        Build a tree over a sequence of items
+
+        :param items: The data of each leaf, in order
+        :param hash_name: The hash to build the tree with, 'sha256' or
+            'sha1'
+        """
+        self.hash_name = hash_name
+        level = [leaf_hash(item, hash_name) for item in items]
+        if not level:
+            raise ValueError("A Merkle tree needs at least one item")
+        self.levels = [level]
+        while len(level) > 1:
+            nxt = [node_hash(level[i], level[i + 1], hash_name)
+                   for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                nxt.append(level[-1])
+            self.levels.append(nxt)
+            level = nxt
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    @property
+    def root(self):
+        """The root hash of the tree"""
+        return self.levels[-1][0]
+
+    def proof(self, index):
+        """
+        Return the inclusion proof of a leaf
+
+        :param index: The position of the leaf's item
+
+        :returns: A MerkleProof
+        """
+        if not 0 <= index < len(self):
+            raise IndexError("No leaf %d in a tree of %d" % (index, len(self)))
+        path = []
+        pos = index
+        for level in self.levels[:-1]:
+            sibling = pos ^ 1
+            if sibling < len(level):
+                path.append(level[sibling])
+            pos //= 2
+        return MerkleProof(self.hash_name, index, len(self), path)
+
+    def proofs(self):
+        """Return the inclusion proof of every leaf, in order"""
+        return [self.proof(i) for i in range(len(self))]
+
+
+def root_from_proof(data, proof):
+    """
+    Compute the root a proof leads to from a leaf
+
+    :param data: The leaf's item
+    :param proof: A MerkleProof
+
+    :returns: The root hash
+    """
+    if not 0 <= proof.index < proof.size:
+        raise ValueError("Proof index out of range")
+    node = leaf_hash(data, proof.hash_name)
+    path = iter(proof.path)
+    pos, width = proof.index, proof.size
+    try:
+        while width > 1:
+            if pos % 2:
+                node = node_hash(next(path), node, proof.hash_name)
+            elif pos + 1 < width:
+                node = node_hash(node, next(path), proof.hash_name)
+            pos //= 2
+            width = (width + 1) // 2
+    except StopIteration:
+        raise ValueError("Proof too short")
+    if next(path, None) is not None:
+        raise ValueError("Proof too long")
+    return node
+
+
+def verify_proof(data, proof, root):
+    """
+    Check that an item is a leaf of the tree with the given root
+
+    :param data: The item
+    :param proof: Its MerkleProof
+    :param root: The root hash
+
+    :returns: True if the proof is valid, False otherwise
+    """
+    try:
+        return root_from_proof(data, proof) == bytes(root)
+    except ValueError:
+        return False
+
+
+def encode_proof(proof):
+    """
+    Encode a proof compactly: hash identifier, index, tree size and path
+
+    :returns: bytes
+    """
+    return (struct.pack('!BII', _HASH_IDS[proof.hash_name], proof.index,
+                        proof.size) + b''.join(proof.path))
+
+
+def decode_proof(data):
+    """
+    Decode a proof produced by encode_proof
+
+    :returns: A MerkleProof
+    """
+    data = bytes(data)
+    try:
+        ident, index, size = struct.unpack_from('!BII', data)
+        hash_name = HASHES[ident]
+    except (struct.error, KeyError):
+        raise ValueError("Not an encoded Merkle proof")
+    digest_size = hashlib.new(hash_name).digest_size
+    body = data[struct.calcsize('!BII'):]
+    if len(body) % digest_size:
+        raise ValueError("Truncated Merkle proof")
+    path = [body[i:i + digest_size] for i in range(0, len(body), digest_size)]
+    return MerkleProof(hash_name, index, size, path)
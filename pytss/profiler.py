@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Split the time spent in high level pytss methods between Python and libtspi.
+
+Methods decorated with profiled() are timed as a whole, while a call hook
+attributes the time spent inside each Tspi_ call to the innermost profiled
+method on the calling thread. Whatever remains is Python-side work: copying
+buffers in and out of cffi, allocating handles and freeing TSS memory.
+
+Figures are aggregated per TSS context and per call path, and can be dumped
+as a text report or as collapsed stacks for flamegraph.pl and compatible
+tools. Enable it with enable() or by setting PYTSS_PROFILE=1 in the
+environment before importing pytss. While disabled the decorator adds a
+single check per call.
+"""
+
+import functools
+import threading
+import time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+PYTHON_FRAME = '[python]'
+
+
+class _Frame(object):
+    def __init__(self, name, context):
+        self.name = name
+        self.context = context
+        self.native = {}
+        self.children = 0.0
+        self.start = _clock()
+
+
+class MethodStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.native = 0.0
+        self.python = 0.0
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'total': self.total,
+            'native': self.native,
+            'python': self.python,
+        }
+
+
+class Profiler(object):
+    """A call hook splitting profiled methods into Python and native time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.methods = {}
+        self.stacks = {}
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def __call__(self, name, call, args):
+        stack = getattr(self.local, 'stack', None)
+        if not stack:
+            return call(*args)
+        start = _clock()
+        try:
+            return call(*args)
+        finally:
+            frame = stack[-1]
+            frame.native[name] = frame.native.get(name, 0.0) + \
+                _clock() - start
+
+    def run(self, name, context, func, args, kwargs):
+        stack = self._stack()
+        frame = _Frame(name, context)
+        stack.append(frame)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            total = _clock() - frame.start
+            path = tuple(f.name for f in stack)
+            stack.pop()
+            if stack:
+                stack[-1].children += total
+            self._record(frame, path, total)
+
+    def _record(self, frame, path, total):
+        native = sum(frame.native.values())
+        python = max(0.0, total - native - frame.children)
+        with self.lock:
+            methods = self.methods.setdefault(frame.context, {})
+            stats = methods.get(frame.name)
+            if stats is None:
+                stats = methods[frame.name] = MethodStats()
+            stats.calls += 1
+            stats.total += total
+            stats.native += native
+            stats.python += python
+
+            stacks = self.stacks.setdefault(frame.context, {})
+            key = path + (PYTHON_FRAME,)
+            stacks[key] = stacks.get(key, 0.0) + python
+            for name, elapsed in frame.native.items():
+                key = path + (name,)
+                stacks[key] = stacks.get(key, 0.0) + elapsed
+
+    def snapshot(self):
+        with self.lock:
+            return dict((context, dict((name, stats.to_dict())
+                                       for name, stats in methods.items()))
+                        for context, methods in self.methods.items())
+
+    def collapsed(self):
+        with self.lock:
+            merged = {}
+            for stacks in self.stacks.values():
+                for path, elapsed in stacks.items():
+                    merged[path] = merged.get(path, 0.0) + elapsed
+        lines = []
+        for path in sorted(merged):
+            lines.append('%s %d' % (';'.join(path),
+                                    int(round(merged[path] * 1e6))))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def reset(self):
+        with self.lock:
+            self.methods = {}
+            self.stacks = {}
+
+
+_profiler = None
+
+
+def profiled(func):
+    """
+    Profile a method of a TSS object. The object's context attribute
+    identifies the TSS context the time is accounted to.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        profiler = _profiler
+        if profiler is None:
+            return func(self, *args, **kwargs)
+        name = '%s.%s' % (type(self).__name__, func.__name__)
+        return profiler.run(name, self.context, func, (self,) + args, kwargs)
+
+    return wrapper
+
+
+def enable():
+    """Start profiling"""
+    global _profiler
+    from pytss.interface import add_call_hook
+    if _profiler is None:
+        _profiler = Profiler()
+        add_call_hook(_profiler)
+
+
+def disable():
+    """Stop profiling, discarding the figures collected so far"""
+    global _profiler
+    from pytss.interface import remove_call_hook
+    if _profiler is not None:
+        remove_call_hook(_profiler)
+        _profiler = None
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def snapshot():
+    """
+    Export the figures collected so far
+
+    :returns: A dict mapping TSS contexts to dicts mapping method names to
+        their call count and total, native and Python time in seconds
+    """
+    if _profiler is None:
+        return {}
+    return _profiler.snapshot()
+
+
+def report():
+    """
+    Format the figures collected so far as a table, one row per context
+    and method, slowest first
+
+    :returns: A string
+    """
+    lines = ['%-10s %-34s %8s %12s %12s %12s %7s' %
+             ('context', 'method', 'calls', 'total ms', 'python ms',
+              'native ms', 'python')]
+    rows = []
+    for context, methods in snapshot().items():
+        for name, stats in methods.items():
+            rows.append((stats['total'], context, name, stats))
+    for total, context, name, stats in sorted(rows, key=lambda r: -r[0]):
+        share = 100.0 * stats['python'] / total if total else 0.0
+        lines.append('%-10s %-34s %8d %12.3f %12.3f %12.3f %6.1f%%' %
+                     (context, name, stats['calls'], total * 1e3,
+                      stats['python'] * 1e3, stats['native'] * 1e3, share))
+    return '\n'.join(lines) + '\n'
+
+
+def collapsed_stacks():
+    """
+    Format the figures collected so far as collapsed stacks, one line per
+    call path with its time in microseconds, for use with flamegraph.pl.
+    Time spent in Python is attributed to a [python] frame and time spent
+    in libtspi to a frame named after the Tspi_ function.
+
+    :returns: A string
+    """
+    if _profiler is None:
+        return ''
+    return _profiler.collapsed()
+
+
+def reset():
+    """Discard the figures collected so far"""
+    if _profiler is not None:
+        _profiler.reset()
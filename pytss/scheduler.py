@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Per-context scheduling of TPM commands.
+
+A TPM runs one command at a time, so when several threads share a context
+whoever asks first goes first, and a burst of background work such as key
+pre-generation can hold up a quote for seconds. A TpmScheduler attached to
+a context makes the high level methods of its objects queue for the TPM
+instead. The TPM is granted to the waiting method of the most urgent
+priority class, first come first served within a class. A method waiting
+longer than the aging interval is promoted by one class per interval, so
+background work is delayed but never starved.
+
+Methods decorated with scheduled() declare their default class, and a
+thread can override it for a block with TpmScheduler.priority(). Methods
+called while the thread already holds the TPM run straight away. The
+background helpers' lock parameter accepts TpmScheduler.lock(), which holds
+the TPM at the given class for as long as the helper holds the lock.
+
+Queued work can be cancelled, and per-class queue depths and wait times
+are kept for monitoring. Without a scheduler the decorator adds a single
+lookup per call.
+"""
+
+import collections
+import contextlib
+import functools
+import itertools
+import threading
+import time
+import weakref
+
+_clock = getattr(time, 'monotonic', time.time)
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    INTERACTIVE: 'interactive',
+    NORMAL: 'normal',
+    BACKGROUND: 'background',
+}
+
+QUEUED = 'queued'
+GRANTED = 'granted'
+CANCELLED = 'cancelled'
+DONE = 'done'
+
+ClassStats = collections.namedtuple(
+    'ClassStats', 'queued max_queued granted cancelled mean_wait max_wait')
+
+# TSS context handle -> TpmScheduler. A scheduler is detached when its
+# TspiContext is deleted, and ignored if the TspiContext has gone away
+# without that, so a context that reuses the handle does not inherit it.
+_schedulers = {}
+
+
+class Cancelled(Exception):
+    """Queued work was cancelled before it was granted the TPM"""
+
+
+class Ticket(object):
+    def __init__(self, scheduler, priority, seq):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.seq = seq
+        self.queued = _clock()
+        self.granted = None
+        self.state = QUEUED
+
+    def cancel(self):
+        """
+        Cancel the ticket if it is still queued
+
+        :returns: True if the ticket was cancelled
+        """
+        return self.scheduler._cancel(self)
+
+
+class _Counters(object):
+    def __init__(self):
+        self.max_queued = 0
+        self.granted = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class _SchedulerLock(object):
+    """A lock-like view of a scheduler at a fixed priority"""
+
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def acquire(self, blocking=True):
+        return self.scheduler._enter(self.priority, blocking)
+
+    def release(self):
+        self.scheduler._exit()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class TpmScheduler(object):
+    def __init__(self, context, aging=1.0):
+        """
+        Attach a scheduler to a context
+
+        :param context: The TspiContext whose objects' methods are
+            scheduled
+        :param aging: Seconds of waiting after which queued work is
+            promoted by one priority class, or None for strict priorities
+        """
+        self.context = context.context
+        self.tspi_context = weakref.ref(context)
+        self.aging = aging
+        self.cond = threading.Condition()
+        self.queues = dict((priority, collections.deque())
+                           for priority in PRIORITY_NAMES)
+        self.counters = dict((priority, _Counters())
+                             for priority in PRIORITY_NAMES)
+        self.owner = None
+        self.seq = itertools.count()
+        self.local = threading.local()
+        if _lookup(self.context) is not None:
+            raise ValueError("Context already has a scheduler")
+        _schedulers[self.context] = self
+        context.scheduler = self
+
+    def _effective(self, ticket, now):
+        if not self.aging:
+            return ticket.priority
+        return max(INTERACTIVE,
+                   ticket.priority - int((now - ticket.queued) / self.aging))
+
+    def _grant_next(self):
+        # Called with cond held while nobody owns the TPM
+        now = _clock()
+        heads = [queue[0] for queue in self.queues.values() if queue]
+        if not heads:
+            return
+        ticket = min(heads, key=lambda t: (self._effective(t, now), t.seq))
+        self.queues[ticket.priority].popleft()
+        ticket.state = GRANTED
+        ticket.granted = now
+        wait = now - ticket.queued
+        counters = self.counters[ticket.priority]
+        counters.granted += 1
+        counters.total_wait += wait
+        counters.max_wait = max(counters.max_wait, wait)
+        self.owner = ticket
+        self.cond.notify_all()
+
+    def _queue(self, priority, blocking):
+        with self.cond:
+            if not blocking and (self.owner is not None or self.depth):
+                return None
+            ticket = Ticket(self, priority, next(self.seq))
+            queue = self.queues[priority]
+            queue.append(ticket)
+            counters = self.counters[priority]
+            counters.max_queued = max(counters.max_queued, len(queue))
+            if self.owner is None:
+                self._grant_next()
+            return ticket
+
+    def _wait(self, ticket):
+        with self.cond:
+            while ticket.state == QUEUED:
+                self.cond.wait()
+            if ticket.state == CANCELLED:
+                raise Cancelled("%s work was cancelled" %
+                                PRIORITY_NAMES[ticket.priority])
+
+    def _release(self, ticket):
+        with self.cond:
+            ticket.state = DONE
+            if self.owner is ticket:
+                self.owner = None
+                self._grant_next()
+
+    def _cancel(self, ticket):
+        with self.cond:
+            if ticket.state != QUEUED:
+                return False
+            self.queues[ticket.priority].remove(ticket)
+            ticket.state = CANCELLED
+            self.counters[ticket.priority].cancelled += 1
+            self.cond.notify_all()
+            return True
+
+    def _enter(self, priority, blocking=True):
+        depth = getattr(self.local, 'depth', 0)
+        if depth:
+            self.local.depth = depth + 1
+            return True
+        ticket = self._queue(priority, blocking)
+        if ticket is None:
+            return False
+        self._wait(ticket)
+        self.local.ticket = ticket
+        self.local.depth = 1
+        return True
+
+    def _exit(self):
+        self.local.depth -= 1
+        if not self.local.depth:
+            ticket, self.local.ticket = self.local.ticket, None
+            self._release(ticket)
+
+    @contextlib.contextmanager
+    def slot(self, priority=NORMAL):
+        """
+        Hold the TPM for a block, queueing for it at the given priority
+
+        Raises Cancelled if the wait is cancelled.
+
+        :param priority: INTERACTIVE, NORMAL or BACKGROUND
+        """
+        self._enter(priority)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def lock(self, priority=BACKGROUND):
+        """
+        Return a lock-like object holding the TPM at the given priority,
+        for the lock parameter of the background helpers
+
+        :param priority: INTERACTIVE, NORMAL or BACKGROUND
+        """
+        return _SchedulerLock(self, priority)
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """
+        Run the scheduled methods called by this thread in a block at the
+        given priority, whatever their default
+
+        :param priority: INTERACTIVE, NORMAL or BACKGROUND
+        """
+        previous = getattr(self.local, 'priority', None)
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def current_priority(self, default):
+        """The priority a scheduled method of the given default runs at"""
+        priority = getattr(self.local, 'priority', None)
+        return default if priority is None else priority
+
+    @property
+    def depth(self):
+        """The number of callers waiting for the TPM"""
+        return sum(len(queue) for queue in self.queues.values())
+
+    def pending(self, priority=None):
+        """
+        List the queued tickets
+
+        :param priority: Only list tickets of this class
+
+        :returns: A list of Ticket objects in arrival order
+        """
+        with self.cond:
+            tickets = [ticket for p, queue in self.queues.items()
+                       if priority is None or p == priority
+                       for ticket in queue]
+        return sorted(tickets, key=lambda t: t.seq)
+
+    def cancel(self, priority=None):
+        """
+        Cancel queued work
+
+        :param priority: Only cancel work of this class
+
+        :returns: The number of tickets cancelled
+        """
+        return sum(1 for ticket in self.pending(priority) if ticket.cancel())
+
+    def stats(self):
+        """
+        Report queue depths and wait times
+
+        :returns: A dict mapping each class name to a ClassStats of the
+            current and largest queue depth, the number of grants and
+            cancellations, and the mean and largest wait in seconds
+        """
+        with self.cond:
+            stats = {}
+            for priority, name in PRIORITY_NAMES.items():
+                counters = self.counters[priority]
+                mean = (counters.total_wait / counters.granted
+                        if counters.granted else 0.0)
+                stats[name] = ClassStats(len(self.queues[priority]),
+                                         counters.max_queued,
+                                         counters.granted, counters.cancelled,
+                                         mean, counters.max_wait)
+        return stats
+
+    def reset_stats(self):
+        """Discard the figures collected so far"""
+        with self.cond:
+            for priority in PRIORITY_NAMES:
+                self.counters[priority] = _Counters()
+
+    def close(self):
+        """Detach the scheduler, cancelling any queued work"""
+        self.cancel()
+        if _schedulers.get(self.context) is self:
+            del _schedulers[self.context]
+        context = self.tspi_context()
+        if context is not None and context.scheduler is self:
+            context.scheduler = None
+
+
+def _lookup(handle):
+    scheduler = _schedulers.get(handle)
+    if scheduler is not None and scheduler.tspi_context() is None:
+        # The context was deleted without detaching the scheduler
+        if _schedulers.get(handle) is scheduler:
+            del _schedulers[handle]
+        return None
+    return scheduler
+
+
+def get_scheduler(context):
+    """
+    Return the scheduler attached to a context, if any
+
+    :param context: A TspiContext or TSS context handle
+    """
+    return _lookup(getattr(context, 'context', context))
+
+
+@contextlib.contextmanager
+def _unscheduled():
+    yield
+
+
+def hold(context, priority=NORMAL):
+    """
+    Hold the TPM of a context for a block if it has a scheduler, for TPM
+    calls that cannot be wrapped with scheduled(), such as those made by
+    generators between yields
+
+    :param context: The TSS context handle
+    :param priority: The default priority class of the calls
+    """
+    scheduler = _lookup(context)
+    if scheduler is None:
+        return _unscheduled()
+    return scheduler.slot(scheduler.current_priority(priority))
+
+
+def scheduled(priority=NORMAL):
+    """
+    Queue a method of a TSS object for the TPM when its context has a
+    scheduler. The object's context attribute identifies the context.
+
+    :param priority: The method's default priority class
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            scheduler = _lookup(self.context)
+            if scheduler is None:
+                return func(self, *args, **kwargs)
+            with scheduler.slot(scheduler.current_priority(priority)):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,1565 @@
+#!/usr/bin/env python3
+"""
+A software stand-in for libtspi and a TPM 1.2.
+
+SoftTspi provides the Tspi_ functions and TSS constants pytss uses, backed
+by SoftTPM, an in-process model of a TPM. It lets the library and
+attestationutils be exercised and benchmarked on machines without a TPM or
+a TSS daemon. Select it by setting PYTSS_BACKEND=soft in the environment
+before importing pytss.
+
+The cryptography is real: keys are RSA keys generated on demand, quotes and
+signatures are PKCS#1 v1.5 signatures, bind and identity activation use the
+TCPA flavour of OAEP, and PCRs are extended with SHA1. Functions return the
+same TSS_RESULT codes libtspi would, so exceptions surface exactly as they
+do against hardware. Blobs use the TPM 1.2 wire layouts, but their private
+parts are protected with AES-GCM under a per-TPM secret rather than the
+TPM's RSA storage scheme, so they are only meaningful to the SoftTPM that
+created them.
+
+Every command that would reach the TPM can be slowed down to emulate a
+real part, either per function through SoftTPM.latency or globally with
+PYTSS_SOFT_LATENCY, which takes a number of seconds or "typical".
+
+Requires the cryptography package.
+"""
+
+import datetime
+import functools
+import hashlib
+import hmac
+import itertools
+import os
+import struct
+import threading
+import time
+
+from cryptography import x509
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, utils
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.x509.oid import NameOID
+
+from pytss import NUM_PCRS
+from pytss import tss_constants as tc
+from pytss.structs import (TPM_TAG_CURRENT_TICKS, TPM_TAG_KEY12,
+                           TPM_TAG_SIGNINFO, TPM_TAG_STORED_DATA12, TpmKey12,
+                           TpmPubKey, TpmStoredData12, pcr_composite)
+
+RESETTABLE_PCRS = (16, 23)
+WELL_KNOWN_SECRET = b'\x00' * 20
+SRK_UUID = (0, 0, 0, 0, 0, (0, 0, 0, 0, 0, 1))
+
+TPM_TAG_PCR_INFO_LONG = 0x0006
+TPM_ORD_MAKEIDENTITY = 0x00000079
+TPM_VERSION = b'\x01\x01\x00\x00'
+SOFT_VENDOR_ID = b'PYTS'
+SOFT_KEY_SLOTS = 10
+SOFT_INPUT_BUFFER = 1280
+
+# Rough command durations of a discrete TPM 1.2 part, in seconds
+TYPICAL_LATENCY = {
+    'Tspi_TPM_GetRandom': 0.01,
+    'Tspi_TPM_PcrRead': 0.005,
+    'Tspi_TPM_PcrExtend': 0.01,
+    'Tspi_TPM_PcrReset': 0.01,
+    'Tspi_TPM_Quote': 0.35,
+    'Tspi_TPM_GetCapability': 0.005,
+    'Tspi_TPM_ReadCurrentTicks': 0.005,
+    'Tspi_TPM_ReadCounter': 0.005,
+    'Tspi_TPM_GetPubEndorsementKey': 0.05,
+    'Tspi_TPM_TakeOwnership': 10.0,
+    'Tspi_TPM_CollateIdentityRequest': 5.0,
+    'Tspi_TPM_ActivateIdentity': 0.5,
+    'Tspi_Context_LoadKeyByBlob': 0.4,
+    'Tspi_Context_LoadKeyByUUID': 0.005,
+    'Tspi_Key_LoadKey': 0.4,
+    'Tspi_Key_CreateKey': 5.0,
+    'Tspi_Hash_Sign': 0.35,
+    'Tspi_Hash_TickStampBlob': 0.35,
+    'Tspi_Data_Seal': 0.1,
+    'Tspi_Data_Unseal': 0.4,
+    'Tspi_Data_Unbind': 0.4,
+    'Tspi_NV_DefineSpace': 0.05,
+    'Tspi_NV_ReleaseSpace': 0.05,
+    'Tspi_NV_ReadValue': 0.02,
+    'Tspi_NV_WriteValue': 0.05,
+}
+
+_TSS_USAGE = {
+    tc.TSS_KEY_TYPE_DEFAULT: tc.TPM_KEY_LEGACY,
+    tc.TSS_KEY_TYPE_SIGNING: tc.TPM_KEY_SIGNING,
+    tc.TSS_KEY_TYPE_STORAGE: tc.TPM_KEY_STORAGE,
+    tc.TSS_KEY_TYPE_IDENTITY: tc.TPM_KEY_IDENTITY,
+    tc.TSS_KEY_TYPE_AUTHCHANGE: tc.TPM_KEY_AUTHCHANGE,
+    tc.TSS_KEY_TYPE_BIND: tc.TPM_KEY_BIND,
+    tc.TSS_KEY_TYPE_LEGACY: tc.TPM_KEY_LEGACY,
+    tc.TSS_KEY_TYPE_MIGRATE: tc.TPM_KEY_MIGRATE,
+}
+
+_TSS_SIZE = {
+    tc.TSS_KEY_SIZE_DEFAULT: 2048,
+    tc.TSS_KEY_SIZE_512: 512,
+    tc.TSS_KEY_SIZE_1024: 1024,
+    tc.TSS_KEY_SIZE_2048: 2048,
+    tc.TSS_KEY_SIZE_4096: 4096,
+    tc.TSS_KEY_SIZE_8192: 8192,
+    tc.TSS_KEY_SIZE_16384: 16384,
+}
+
+# Encryption and signature schemes by key usage
+_SCHEMES = {
+    tc.TPM_KEY_SIGNING: (tc.TPM_ES_NONE, tc.TPM_SS_RSASSAPKCS1v15_SHA1),
+    tc.TPM_KEY_STORAGE: (tc.TPM_ES_RSAESOAEP_SHA1_MGF1, tc.TPM_SS_NONE),
+    tc.TPM_KEY_IDENTITY: (tc.TPM_ES_NONE, tc.TPM_SS_RSASSAPKCS1v15_SHA1),
+    tc.TPM_KEY_AUTHCHANGE: (tc.TPM_ES_RSAESOAEP_SHA1_MGF1, tc.TPM_SS_NONE),
+    tc.TPM_KEY_BIND: (tc.TPM_ES_RSAESOAEP_SHA1_MGF1, tc.TPM_SS_NONE),
+    tc.TPM_KEY_LEGACY: (tc.TPM_ES_RSAESOAEP_SHA1_MGF1,
+                        tc.TPM_SS_RSASSAPKCS1v15_SHA1),
+    tc.TPM_KEY_MIGRATE: (tc.TPM_ES_RSAESOAEP_SHA1_MGF1, tc.TPM_SS_NONE),
+}
+
+_KEY_FLAG_MIGRATABLE = 0x00000002
+_KEY_FLAG_VOLATILE = 0x00000004
+
+_SHA1_DIGESTINFO = b'\x30\x21\x30\x09\x06\x05\x2b\x0e\x03\x02\x1a\x05\x00' \
+                   b'\x04\x14'
+
+_TCPA_OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA1()),
+                          algorithm=hashes.SHA1(), label=b'TCPA')
+
+
+class SoftTpmError(Exception):
+    """Carries the TSS_RESULT a Tspi_ function returns"""
+
+    def __init__(self, code):
+        super(SoftTpmError, self).__init__("TSS result 0x%x" % code)
+        self.code = code
+
+
+def _tss(code):
+    return SoftTpmError(tc.TSS_LAYER_TSP | code)
+
+
+def _tpm(code):
+    return SoftTpmError(tc.TSS_LAYER_TPM | code)
+
+
+def _sha1(*parts):
+    m = hashlib.sha1()
+    for part in parts:
+        m.update(part)
+    return m.digest()
+
+
+def _int_to_bytes(value, length):
+    return value.to_bytes(length, 'big')
+
+
+def _bytes_to_int(data):
+    return int.from_bytes(bytes(data), 'big')
+
+
+def _mgf1(seed, length):
+    mask = b''
+    counter = 0
+    while len(mask) < length:
+        mask += _sha1(seed, struct.pack('!I', counter))
+        counter += 1
+    return mask[:length]
+
+
+def _oaep_encrypt(n, data):
+    """RSAES-OAEP with SHA1 and the label "TCPA", for any modulus"""
+    k = (n.bit_length() + 7) // 8
+    if len(data) > k - 42:
+        raise _tss(tc.TSS_E_ENC_INVALID_LENGTH)
+    db = _sha1(b'TCPA') + b'\x00' * (k - len(data) - 42) + b'\x01' + data
+    seed = os.urandom(20)
+    masked_db = bytes(a ^ b for a, b in zip(db, _mgf1(seed, k - 21)))
+    masked_seed = bytes(a ^ b for a, b in zip(seed, _mgf1(masked_db, 20)))
+    em = b'\x00' + masked_seed + masked_db
+    return _int_to_bytes(pow(_bytes_to_int(em), 65537, n), k)
+
+
+def _pkcs1_type1(data, k):
+    if len(data) > k - 11:
+        raise _tpm(tc.TPM_E_BAD_DATASIZE)
+    return b'\x00\x01' + b'\xff' * (k - len(data) - 3) + b'\x00' + data
+
+
+def _pcr_select(pcrs):
+    select = bytearray(3)
+    for pcr in pcrs:
+        select[pcr // 8] |= 1 << (pcr % 8)
+    return struct.pack('!H', 3) + bytes(select)
+
+
+def _parse_pcr_select(data, offset):
+    size = struct.unpack_from('!H', data, offset)[0]
+    select = bytearray(data[offset + 2:offset + 2 + size])
+    pcrs = [i for i in range(size * 8) if select[i // 8] & (1 << (i % 8))]
+    return pcrs, offset + 2 + size
+
+
+def _gcm_seal(key, plaintext, aad):
+    nonce = os.urandom(12)
+    return nonce + AESGCM(key).encrypt(nonce, plaintext, aad)
+
+
+def _gcm_open(key, blob, aad):
+    try:
+        return AESGCM(key).decrypt(blob[:12], blob[12:], aad)
+    except (InvalidTag, ValueError):
+        raise _tpm(tc.TPM_E_DECRYPT_ERROR)
+
+
+class _KeyData(object):
+    """The material and properties of a created or loaded key"""
+
+    def __init__(self, usage, bits, key_flags, auth_usage, auth, n,
+                 private=None):
+        self.usage = usage
+        self.bits = bits
+        self.key_flags = key_flags
+        self.auth_usage = auth_usage
+        self.auth = auth
+        self.n = n
+        self.private = private
+        self.enc_data = b''
+
+    @classmethod
+    def generate(cls, usage, bits, key_flags, auth_usage, auth):
+        private = rsa.generate_private_key(public_exponent=65537,
+                                           key_size=bits)
+        n = private.public_key().public_numbers().n
+        return cls(usage, bits, key_flags, auth_usage, auth, n, private)
+
+    def key_parms(self):
+        enc, sig = _SCHEMES.get(self.usage, (tc.TPM_ES_NONE, tc.TPM_SS_NONE))
+        rsaparms = struct.pack('!III', self.bits, 2, 0)
+        return struct.pack('!IHHI', tc.TPM_ALG_RSA, enc, sig,
+                           len(rsaparms)) + rsaparms
+
+    def store_pubkey(self):
+        k = self.bits // 8
+        return struct.pack('!I', k) + _int_to_bytes(self.n, k)
+
+    def pubkey(self):
+        """TPM_PUBKEY"""
+        return self.key_parms() + self.store_pubkey()
+
+    def public_part(self):
+        return struct.pack('!HHHIB', TPM_TAG_KEY12, 0, self.usage,
+                           self.key_flags, self.auth_usage) + \
+            self.key_parms() + struct.pack('!I', 0) + self.store_pubkey()
+
+    def blob(self):
+        """TPM_KEY12"""
+        return self.public_part() + struct.pack('!I', len(self.enc_data)) + \
+            self.enc_data
+
+    def wrap(self, parent_secret):
+        p = self.private.private_numbers().p
+        plain = (self.auth or WELL_KNOWN_SECRET) + \
+            _int_to_bytes(p, self.bits // 16)
+        self.enc_data = _gcm_seal(parent_secret, plain, self.public_part())
+
+    @classmethod
+    def from_blob(cls, blob):
+        try:
+            key = TpmKey12(blob)
+            if key.tag != TPM_TAG_KEY12:
+                raise _tpm(tc.TPM_E_BADTAG)
+            data = cls(key.key_usage, key.algorithm_parms.rsa_parms.key_length,
+                       key.key_flags, key.auth_data_usage, None,
+                       _bytes_to_int(key.modulus))
+            data.enc_data = key.enc_data.tobytes()
+        except ValueError:
+            raise _tpm(tc.TPM_E_INVALID_STRUCTURE)
+        return data
+
+    def unwrap(self, parent_secret):
+        plain = _gcm_open(parent_secret, self.enc_data, self.public_part())
+        auth, p = plain[:20], _bytes_to_int(plain[20:])
+        if self.auth_usage != tc.TPM_AUTH_NEVER:
+            self.auth = auth
+        q = self.n // p
+        d = pow(65537, -1, (p - 1) * (q - 1))
+        numbers = rsa.RSAPrivateNumbers(
+            p, q, d, rsa.rsa_crt_dmp1(d, p), rsa.rsa_crt_dmq1(d, q),
+            rsa.rsa_crt_iqmp(p, q), rsa.RSAPublicNumbers(65537, self.n))
+        self.private = numbers.private_key()
+
+
+class SoftTPM(object):
+    def __init__(self, latency=None, owned=True,
+                 owner_secret=WELL_KNOWN_SECRET,
+                 srk_secret=WELL_KNOWN_SECRET):
+        """
+        Create a software TPM
+
+        :param latency: A dict mapping Tspi_ function names to the number of
+            seconds each command should take, such as TYPICAL_LATENCY
+        :param owned: Take ownership straight away, as a provisioned
+            machine would have done
+        :param owner_secret: The 20 byte owner authorisation if owned
+        :param srk_secret: The 20 byte SRK authorisation if owned
+        """
+        self.latency = dict(latency or {})
+        self.default_latency = 0
+        self.busy = threading.Lock()
+        self.proof = os.urandom(20)
+        self.owner = None
+        self.srk = None
+        self.nv = {}
+        # The active monotonic counter, which survives reboots
+        self.counter = 0
+        self._ek = None
+        self._ca = None
+        self.reset()
+        if owned:
+            self.take_ownership(owner_secret, srk_secret)
+
+    def reset(self):
+        """Emulate a reboot: reset the PCRs, event log and tick session"""
+        self.pcrs = [b'\x00' * 20] * NUM_PCRS
+        # The dynamic PCRs only reset to zero on a late launch
+        for pcr in range(17, 23):
+            self.pcrs[pcr] = b'\xff' * 20
+        self.events = [[] for _ in range(NUM_PCRS)]
+        self.tick_nonce = os.urandom(20)
+        self.started = time.time()
+
+    def delay(self, name):
+        latency = self.latency.get(name, self.default_latency)
+        if latency:
+            time.sleep(latency)
+
+    def storage_secret(self, key):
+        """The AES key protecting blobs wrapped by a storage key"""
+        return hmac.new(self.proof, _int_to_bytes(key.n, key.bits // 8),
+                        hashlib.sha256).digest()
+
+    def take_ownership(self, owner_secret, srk_secret=None,
+                       srk_auth_usage=tc.TPM_AUTH_ALWAYS):
+        if self.owner is not None:
+            raise _tpm(tc.TPM_E_OWNER_SET)
+        if srk_secret is None:
+            srk_auth_usage = tc.TPM_AUTH_NEVER
+        self.srk = _KeyData.generate(tc.TPM_KEY_STORAGE, 2048, 0,
+                                     srk_auth_usage, srk_secret)
+        self.owner = owner_secret
+
+    def extend(self, pcr, digest, event_type=None, event=None):
+        self.pcrs[pcr] = _sha1(self.pcrs[pcr], digest)
+        if event_type is not None:
+            self.events[pcr].append((event_type, digest, event or b''))
+        return self.pcrs[pcr]
+
+    @property
+    def ek(self):
+        """The endorsement key"""
+        if self._ek is None:
+            self._ek = _KeyData.generate(tc.TPM_KEY_STORAGE, 2048, 0,
+                                         tc.TPM_AUTH_NEVER, None)
+        return self._ek
+
+    def _ca_key(self):
+        if self._ca is None:
+            key = rsa.generate_private_key(public_exponent=65537,
+                                           key_size=2048)
+            name = x509.Name([x509.NameAttribute(
+                NameOID.COMMON_NAME, u'pytss software TPM CA')])
+            now = datetime.datetime.utcnow()
+            cert = x509.CertificateBuilder().subject_name(name) \
+                .issuer_name(name).public_key(key.public_key()) \
+                .serial_number(x509.random_serial_number()) \
+                .not_valid_before(now) \
+                .not_valid_after(now + datetime.timedelta(days=3650)) \
+                .add_extension(x509.BasicConstraints(ca=True, path_length=0),
+                               critical=True) \
+                .sign(key, hashes.SHA256())
+            self._ca = (key, cert)
+        return self._ca
+
+    @property
+    def ca_certificate(self):
+        """The PEM certificate of the CA that issued the EK certificate"""
+        return self._ca_key()[1].public_bytes(serialization.Encoding.PEM)
+
+    def ek_certificate(self):
+        """The DER encoded endorsement key certificate"""
+        ca_key, ca_cert = self._ca_key()
+        now = datetime.datetime.utcnow()
+        public = rsa.RSAPublicNumbers(65537, self.ek.n).public_key()
+        cert = x509.CertificateBuilder() \
+            .subject_name(x509.Name([x509.NameAttribute(
+                NameOID.COMMON_NAME, u'pytss software TPM EK')])) \
+            .issuer_name(ca_cert.subject).public_key(public) \
+            .serial_number(x509.random_serial_number()) \
+            .not_valid_before(now) \
+            .not_valid_after(now + datetime.timedelta(days=3650)) \
+            .sign(ca_key, hashes.SHA256())
+        return cert.public_bytes(serialization.Encoding.DER)
+
+    def nv_area(self, index):
+        if index == tc.TPM_NV_INDEX_EKCert and index not in self.nv:
+            cert = self.ek_certificate()
+            data = struct.pack('!HBH', 0x1001, 0, len(cert) + 2) + \
+                struct.pack('!H', 0x1002) + cert
+            self.nv[index] = _NvArea(len(data), tc.TPM_NV_PER_OWNERWRITE |
+                                     tc.TPM_NV_PER_WRITEALL, None, data)
+        return self.nv.get(index)
+
+    def increment_counter(self):
+        """
+        Increment the active monotonic counter, as TPM_IncrementCounter
+        would. The Tspi API has no increment call, so this stands in for
+        the platform tool that would do it.
+
+        :returns: The new counter value
+        """
+        with self.busy:
+            self.counter += 1
+            return self.counter
+
+    def ticks(self):
+        """The current tick count, in microseconds since the last reset"""
+        return int((time.time() - self.started) * 1e6)
+
+
+class _NvArea(object):
+    def __init__(self, size, permissions, auth, data=None):
+        self.size = size
+        self.permissions = permissions
+        self.auth = auth
+        self.data = bytearray(data or b'\xff' * size)
+
+
+class _Context(object):
+    def __init__(self):
+        self.connected = False
+        self.memory = {}
+        self.policy = None
+        self.tpm = None
+
+
+class _Object(object):
+    def __init__(self, context, flags):
+        self.context = context
+        self.flags = flags
+        self.policy = None
+        self.attribs = {}
+
+
+class _Policy(_Object):
+    def __init__(self, context, flags):
+        super(_Policy, self).__init__(context, flags)
+        self.secret = None
+
+
+class _Tpm(_Object):
+    pass
+
+
+class _Key(_Object):
+    def __init__(self, context, flags):
+        super(_Key, self).__init__(context, flags)
+        self.data = None
+        self.loaded = False
+        self.srk = bool(flags & tc.TSS_KEY_TSP_SRK)
+        self.n = None
+
+    def template(self):
+        """The usage, size, key flags and auth usage asked for at creation"""
+        flags = self.flags
+        usage = _TSS_USAGE.get(flags & tc.TSS_KEY_TYPE_BITMASK)
+        bits = self.attribs.get('bits',
+                                _TSS_SIZE.get(flags & tc.TSS_KEY_SIZE_BITMASK))
+        if usage is None or bits is None:
+            raise _tss(tc.TSS_E_INVALID_OBJECT_INITFLAG)
+        key_flags = 0
+        if flags & tc.TSS_KEY_MIGRATABLE:
+            key_flags |= _KEY_FLAG_MIGRATABLE
+        if flags & tc.TSS_KEY_VOLATILE:
+            key_flags |= _KEY_FLAG_VOLATILE
+        if flags & tc.TSS_KEY_AUTHORIZATION:
+            auth_usage = tc.TPM_AUTH_ALWAYS
+        elif flags & tc.TSS_KEY_AUTHORIZATION_PRIV_USE_ONLY:
+            auth_usage = tc.TPM_AUTH_PRIV_USE_ONLY
+        else:
+            auth_usage = tc.TPM_AUTH_NEVER
+        return usage, bits, key_flags, auth_usage
+
+    def modulus(self):
+        if self.data is not None:
+            return self.data.n
+        return self.n
+
+
+class _EncData(_Object):
+    def __init__(self, context, flags):
+        super(_EncData, self).__init__(context, flags)
+        self.blob = None
+
+
+class _Pcrs(_Object):
+    def __init__(self, context, flags):
+        super(_Pcrs, self).__init__(context, flags)
+        self.selection = set()
+        self.values = {}
+
+
+class _Hash(_Object):
+    def __init__(self, context, flags):
+        super(_Hash, self).__init__(context, flags)
+        self.hash = hashlib.sha1() if flags != tc.TSS_HASH_OTHER else None
+        self.digest = None
+
+
+class _Nv(_Object):
+    def __init__(self, context, flags):
+        super(_Nv, self).__init__(context, flags)
+        self.index = None
+        self.permissions = 0
+        self.size = 0
+
+
+_OBJECT_TYPES = {
+    tc.TSS_OBJECT_TYPE_POLICY: _Policy,
+    tc.TSS_OBJECT_TYPE_RSAKEY: _Key,
+    tc.TSS_OBJECT_TYPE_ENCDATA: _EncData,
+    tc.TSS_OBJECT_TYPE_PCRS: _Pcrs,
+    tc.TSS_OBJECT_TYPE_HASH: _Hash,
+    tc.TSS_OBJECT_TYPE_NV: _Nv,
+}
+
+
+def _tsp_call(func):
+    """A Tspi_ function handled entirely by the TSS library"""
+    @functools.wraps(func)
+    def wrapper(self, *args):
+        with self.lock:
+            try:
+                func(self, *args)
+            except SoftTpmError as e:
+                return e.code
+        return tc.TSS_SUCCESS
+
+    return wrapper
+
+
+def _tpm_call(func):
+    """A Tspi_ function that sends a command to the TPM"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self, *args):
+        with self.tpm.busy:
+            self.tpm.delay(name)
+            with self.lock:
+                try:
+                    func(self, *args)
+                except SoftTpmError as e:
+                    return e.code
+        return tc.TSS_SUCCESS
+
+    return wrapper
+
+
+class SoftTspi(object):
+    """A drop-in replacement for the cffi libtspi module"""
+
+    def __init__(self, ffi, tpm=None):
+        """
+        :param ffi: The FFI instance the caller allocates buffers with
+        :param tpm: The SoftTPM to talk to, by default a new one configured
+            from PYTSS_SOFT_LATENCY
+        """
+        for name in dir(tc):
+            if name.startswith(('TPM_', 'TSS_')):
+                setattr(self, name, getattr(tc, name))
+        self.ffi = ffi
+        if tpm is None:
+            tpm = SoftTPM(_latency_from_env())
+        self.tpm = tpm
+        self.lock = threading.RLock()
+        self.handles = itertools.count(0x10)
+        self.contexts = {}
+        self.objects = {}
+
+    def __getattr__(self, name):
+        if not name.startswith('Tspi_'):
+            raise AttributeError(name)
+
+        def unimplemented(*args):
+            return tc.TSS_LAYER_TSP | tc.TSS_E_NOTIMPL
+        unimplemented.__name__ = name
+        return unimplemented
+
+    # Helpers
+
+    def _context(self, handle):
+        context = self.contexts.get(handle)
+        if context is None:
+            raise _tss(tc.TSS_E_INVALID_HANDLE)
+        return context
+
+    def _get(self, handle, cls):
+        obj = self.objects.get(handle)
+        if not isinstance(obj, cls):
+            raise _tss(tc.TSS_E_INVALID_HANDLE)
+        return obj
+
+    def _add(self, obj):
+        handle = next(self.handles)
+        self.objects[handle] = obj
+        if not isinstance(obj, _Policy) and obj.policy is None:
+            obj.policy = self.contexts[obj.context].policy
+        return handle
+
+    def _read(self, ptr, length):
+        if not length:
+            return b''
+        return self.ffi.buffer(ptr, length)[:]
+
+    def _alloc(self, context, data):
+        buf = self.ffi.new('BYTE[]', max(1, len(data)))
+        self.ffi.memmove(buf, bytes(data), len(data))
+        self.contexts[context].memory[self._address(buf)] = buf
+        return buf
+
+    def _address(self, ptr):
+        return int(self.ffi.cast('uintptr_t', ptr))
+
+    def _output(self, context, data, plen, pdata):
+        plen[0] = len(data)
+        pdata[0] = self._alloc(context, data)
+
+    def _secret(self, obj):
+        policy = self.objects.get(obj.policy)
+        if policy is None or policy.secret is None:
+            raise _tss(tc.TSS_E_POLICY_NO_SECRET)
+        return policy.secret
+
+    def _authorize(self, obj, expected, failure=tc.TPM_E_AUTHFAIL):
+        if expected is None:
+            return
+        if not hmac.compare_digest(self._secret(obj), expected):
+            raise _tpm(failure)
+
+    def _tpm_object(self, context):
+        ctx = self.contexts[context]
+        if ctx.tpm is None:
+            ctx.tpm = self._add(_Tpm(context, 0))
+        return self.objects[ctx.tpm]
+
+    def _owner_auth(self, obj):
+        if self.tpm.owner is None:
+            raise _tpm(tc.TPM_E_NOSRK)
+        self._authorize(self._tpm_object(obj.context), self.tpm.owner)
+
+    def _use_key(self, key, usages=None, failure=tc.TPM_E_INVALID_KEYUSAGE):
+        if not key.loaded or key.data is None or key.data.private is None:
+            raise _tss(tc.TSS_E_KEY_NOT_LOADED)
+        if usages is not None and key.data.usage not in usages:
+            raise _tpm(failure)
+        self._authorize(key, key.data.auth)
+        return key.data
+
+    def _public(self, key):
+        if key.data is not None:
+            return key.data
+        if key.n is None:
+            raise _tss(tc.TSS_E_KEY_NOT_SET)
+        usage, bits, key_flags, auth_usage = key.template()
+        return _KeyData(usage, key.n.bit_length() + 7 & ~7, key_flags,
+                        auth_usage, None, key.n)
+
+    def _pcr_values(self, pcrs):
+        values = {}
+        for pcr in pcrs.selection:
+            values[pcr] = pcrs.values.get(pcr, self.tpm.pcrs[pcr])
+        return values
+
+    def _sign(self, key, data, scheme=tc.TPM_SS_RSASSAPKCS1v15_SHA1):
+        if scheme == tc.TPM_SS_RSASSAPKCS1v15_SHA1:
+            if len(data) != 20:
+                raise _tss(tc.TSS_E_HASH_INVALID_LENGTH)
+            return key.private.sign(data, padding.PKCS1v15(),
+                                    utils.Prehashed(hashes.SHA1()))
+        if scheme == tc.TPM_SS_RSASSAPKCS1v15_DER:
+            numbers = key.private.private_numbers()
+            k = key.bits // 8
+            m = _bytes_to_int(_pkcs1_type1(data, k))
+            return _int_to_bytes(pow(m, numbers.d, key.n), k)
+        raise _tpm(tc.TPM_E_INAPPROPRIATE_SIG)
+
+    def _create_key(self, key, parent):
+        usage, bits, key_flags, auth_usage = key.template()
+        if bits > 2048:
+            raise _tpm(tc.TPM_E_BAD_KEY_PROPERTY)
+        auth = None
+        if auth_usage != tc.TPM_AUTH_NEVER:
+            auth = self._secret(key)
+        data = _KeyData.generate(usage, bits, key_flags, auth_usage, auth)
+        data.wrap(self.tpm.storage_secret(parent))
+        data.private = None
+        key.data = data
+        key.loaded = False
+
+    def _load_key(self, key, parent):
+        parentdata = self._use_key(parent, (tc.TPM_KEY_STORAGE,))
+        data = _KeyData.from_blob(key.data.blob())
+        data.unwrap(self.tpm.storage_secret(parentdata))
+        key.data = data
+        key.loaded = True
+
+    # Contexts and objects
+
+    @_tsp_call
+    def Tspi_Context_Create(self, phContext):
+        handle = next(self.handles)
+        context = self.contexts[handle] = _Context()
+        policy = _Policy(handle, tc.TSS_POLICY_USAGE)
+        context.policy = self._add(policy)
+        phContext[0] = handle
+
+    @_tsp_call
+    def Tspi_Context_Close(self, hContext):
+        self._context(hContext)
+        for handle, obj in list(self.objects.items()):
+            if obj.context == hContext:
+                del self.objects[handle]
+        del self.contexts[hContext]
+
+    @_tsp_call
+    def Tspi_Context_Connect(self, hContext, wszDestination):
+        self._context(hContext).connected = True
+
+    @_tsp_call
+    def Tspi_Context_FreeMemory(self, hContext, rgbMemory):
+        context = self._context(hContext)
+        if rgbMemory == self.ffi.NULL:
+            context.memory.clear()
+        elif context.memory.pop(self._address(rgbMemory), None) is None:
+            raise _tss(tc.TSS_E_INVALID_RESOURCE)
+
+    @_tsp_call
+    def Tspi_Context_CreateObject(self, hContext, objectType, initFlags,
+                                  phObject):
+        self._context(hContext)
+        cls = _OBJECT_TYPES.get(objectType)
+        if cls is None:
+            raise _tss(tc.TSS_E_INVALID_OBJECT_TYPE)
+        phObject[0] = self._add(cls(hContext, initFlags))
+
+    @_tsp_call
+    def Tspi_Context_CloseObject(self, hContext, hObject):
+        obj = self._get(hObject, _Object)
+        if obj.context != hContext:
+            raise _tss(tc.TSS_E_INVALID_HANDLE)
+        del self.objects[hObject]
+
+    @_tsp_call
+    def Tspi_Context_GetTpmObject(self, hContext, phTPM):
+        if not self._context(hContext).connected:
+            raise _tss(tc.TSS_E_NO_CONNECTION)
+        self._tpm_object(hContext)
+        phTPM[0] = self.contexts[hContext].tpm
+
+    @_tsp_call
+    def Tspi_Context_GetDefaultPolicy(self, hContext, phPolicy):
+        phPolicy[0] = self._context(hContext).policy
+
+    @_tpm_call
+    def Tspi_Context_LoadKeyByUUID(self, hContext, persistentStorageType,
+                                   uuidData, phKey):
+        if not self._context(hContext).connected:
+            raise _tss(tc.TSS_E_NO_CONNECTION)
+        uuid = (uuidData.ulTimeLow, uuidData.usTimeMid, uuidData.usTimeHigh,
+                uuidData.bClockSeqHigh, uuidData.bClockSeqLow,
+                tuple(uuidData.rgbNode))
+        if (persistentStorageType != tc.TSS_PS_TYPE_SYSTEM or
+                uuid != SRK_UUID or self.tpm.srk is None):
+            raise _tss(tc.TSS_E_PS_KEY_NOTFOUND)
+        key = _Key(hContext, tc.TSS_KEY_TSP_SRK)
+        key.data = self.tpm.srk
+        key.loaded = True
+        phKey[0] = self._add(key)
+
+    @_tpm_call
+    def Tspi_Context_LoadKeyByBlob(self, hContext, hUnwrappingKey,
+                                   ulBlobLength, rgbBlobData, phKey):
+        if not self._context(hContext).connected:
+            raise _tss(tc.TSS_E_NO_CONNECTION)
+        parent = self._get(hUnwrappingKey, _Key)
+        key = _Key(hContext, 0)
+        key.data = _KeyData.from_blob(self._read(rgbBlobData, ulBlobLength))
+        self._load_key(key, parent)
+        phKey[0] = self._add(key)
+
+    # Attributes and policies
+
+    @_tsp_call
+    def Tspi_SetAttribUint32(self, hObject, attribFlag, subFlag, ulAttrib):
+        obj = self._get(hObject, _Object)
+        if isinstance(obj, _Nv):
+            if attribFlag == tc.TSS_TSPATTRIB_NV_INDEX:
+                obj.index = ulAttrib & ~tc.TSS_NV_DEFINED
+            elif attribFlag == tc.TSS_TSPATTRIB_NV_PERMISSIONS:
+                obj.permissions = ulAttrib
+            elif attribFlag == tc.TSS_TSPATTRIB_NV_DATASIZE:
+                obj.size = ulAttrib
+            else:
+                raise _tss(tc.TSS_E_INVALID_ATTRIB_FLAG)
+        elif (isinstance(obj, _Key) and
+              attribFlag == tc.TSS_TSPATTRIB_RSAKEY_INFO and
+              subFlag == tc.TSS_TSPATTRIB_KEYINFO_RSA_KEYSIZE):
+            obj.attribs['bits'] = ulAttrib
+        else:
+            obj.attribs[(attribFlag, subFlag)] = ulAttrib
+
+    @_tsp_call
+    def Tspi_GetAttribUint32(self, hObject, attribFlag, subFlag, pulAttrib):
+        obj = self._get(hObject, _Object)
+        if isinstance(obj, _Nv) and attribFlag == tc.TSS_TSPATTRIB_NV_INDEX:
+            value = obj.index
+        elif (isinstance(obj, _Key) and
+              attribFlag == tc.TSS_TSPATTRIB_RSAKEY_INFO and
+              subFlag == tc.TSS_TSPATTRIB_KEYINFO_RSA_KEYSIZE):
+            value = self._public(obj).bits
+        elif (attribFlag, subFlag) in obj.attribs:
+            value = obj.attribs[(attribFlag, subFlag)]
+        else:
+            raise _tss(tc.TSS_E_INVALID_ATTRIB_FLAG)
+        pulAttrib[0] = value
+
+    @_tsp_call
+    def Tspi_SetAttribData(self, hObject, attribFlag, subFlag,
+                           ulAttribDataSize, rgbAttribData):
+        obj = self._get(hObject, _Object)
+        data = self._read(rgbAttribData, ulAttribDataSize)
+        if isinstance(obj, _EncData):
+            if (attribFlag != tc.TSS_TSPATTRIB_ENCDATA_BLOB or
+                    subFlag != tc.TSS_TSPATTRIB_ENCDATABLOB_BLOB):
+                raise _tss(tc.TSS_E_INVALID_ATTRIB_FLAG)
+            obj.blob = data
+        elif isinstance(obj, _Key):
+            if (attribFlag == tc.TSS_TSPATTRIB_RSAKEY_INFO and
+                    subFlag == tc.TSS_TSPATTRIB_KEYINFO_RSA_MODULUS):
+                obj.n = _bytes_to_int(data)
+            elif (attribFlag == tc.TSS_TSPATTRIB_KEY_BLOB and
+                  subFlag == tc.TSS_TSPATTRIB_KEYBLOB_BLOB):
+                obj.data = _KeyData.from_blob(data)
+                obj.loaded = False
+            elif (attribFlag == tc.TSS_TSPATTRIB_KEY_BLOB and
+                  subFlag == tc.TSS_TSPATTRIB_KEYBLOB_PUBLIC_KEY):
+                try:
+                    obj.n = _bytes_to_int(TpmPubKey(data).modulus)
+                except ValueError:
+                    raise _tss(tc.TSS_E_INVALID_ATTRIB_DATA)
+            else:
+                raise _tss(tc.TSS_E_INVALID_ATTRIB_FLAG)
+        else:
+            raise _tss(tc.TSS_E_INVALID_ATTRIB_FLAG)
+
+    @_tsp_call
+    def Tspi_GetAttribData(self, hObject, attribFlag, subFlag,
+                           pulAttribDataSize, prgbAttribData):
+        obj = self._get(hObject, _Object)
+        if isinstance(obj, _EncData):
+            if (attribFlag != tc.TSS_TSPATTRIB_ENCDATA_BLOB or
+                    subFlag != tc.TSS_TSPATTRIB_ENCDATABLOB_BLOB):
+                raise _tss(tc.TSS_E_INVALID_ATTRIB_FLAG)
+            if obj.blob is None:
+                raise _tss(tc.TSS_E_ENC_NO_DATA)
+            data = obj.blob
+        elif isinstance(obj, _Key):
+            key = self._public(obj)
+            if attribFlag == tc.TSS_TSPATTRIB_KEY_BLOB:
+                if subFlag == tc.TSS_TSPATTRIB_KEYBLOB_BLOB:
+                    data = key.blob()
+                elif subFlag == tc.TSS_TSPATTRIB_KEYBLOB_PUBLIC_KEY:
+                    data = key.pubkey()
+                elif subFlag == tc.TSS_TSPATTRIB_KEYBLOB_PRIVATE_KEY:
+                    data = key.enc_data
+                else:
+                    raise _tss(tc.TSS_E_INVALID_ATTRIB_SUBFLAG)
+            elif attribFlag == tc.TSS_TSPATTRIB_RSAKEY_INFO:
+                if subFlag == tc.TSS_TSPATTRIB_KEYINFO_RSA_MODULUS:
+                    data = _int_to_bytes(key.n, key.bits // 8)
+                elif subFlag == tc.TSS_TSPATTRIB_KEYINFO_RSA_EXPONENT:
+                    data = _int_to_bytes(65537, 3)
+                else:
+                    raise _tss(tc.TSS_E_INVALID_ATTRIB_SUBFLAG)
+            else:
+                raise _tss(tc.TSS_E_INVALID_ATTRIB_FLAG)
+        else:
+            raise _tss(tc.TSS_E_INVALID_ATTRIB_FLAG)
+        self._output(obj.context, data, pulAttribDataSize, prgbAttribData)
+
+    @_tsp_call
+    def Tspi_GetPolicyObject(self, hObject, policyType, phPolicy):
+        obj = self._get(hObject, _Object)
+        if policyType != tc.TSS_POLICY_USAGE:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        phPolicy[0] = obj.policy
+
+    @_tsp_call
+    def Tspi_Policy_SetSecret(self, hPolicy, secretMode, ulSecretLength,
+                              rgbSecret):
+        policy = self._get(hPolicy, _Policy)
+        if secretMode == tc.TSS_SECRET_MODE_SHA1:
+            if ulSecretLength != 20:
+                raise _tss(tc.TSS_E_BAD_PARAMETER)
+            policy.secret = self._read(rgbSecret, ulSecretLength)
+        elif secretMode == tc.TSS_SECRET_MODE_PLAIN:
+            policy.secret = _sha1(self._read(rgbSecret, ulSecretLength))
+        elif secretMode == tc.TSS_SECRET_MODE_NONE:
+            policy.secret = None
+        else:
+            raise _tss(tc.TSS_E_NOTIMPL)
+
+    @_tsp_call
+    def Tspi_Policy_FlushSecret(self, hPolicy):
+        self._get(hPolicy, _Policy).secret = None
+
+    @_tsp_call
+    def Tspi_Policy_AssignToObject(self, hPolicy, hObject):
+        self._get(hPolicy, _Policy)
+        self._get(hObject, _Object).policy = hPolicy
+
+    # TPM
+
+    @_tpm_call
+    def Tspi_TPM_GetRandom(self, hTPM, ulRandomDataLength, prgbRandomData):
+        tpm = self._get(hTPM, _Tpm)
+        prgbRandomData[0] = self._alloc(tpm.context,
+                                        os.urandom(ulRandomDataLength))
+
+    @_tpm_call
+    def Tspi_TPM_StirRandom(self, hTPM, ulEntropyDataLength,
+                            rgbEntropyData):
+        self._get(hTPM, _Tpm)
+
+    @_tpm_call
+    def Tspi_TPM_PcrRead(self, hTPM, ulPcrIndex, pulPcrValueLength,
+                         prgbPcrValue):
+        tpm = self._get(hTPM, _Tpm)
+        if ulPcrIndex >= NUM_PCRS:
+            raise _tpm(tc.TPM_E_BADINDEX)
+        self._output(tpm.context, self.tpm.pcrs[ulPcrIndex],
+                     pulPcrValueLength, prgbPcrValue)
+
+    @_tpm_call
+    def Tspi_TPM_PcrExtend(self, hTPM, ulPcrIndex, ulPcrDataLength,
+                           pbPcrData, pPcrEvent, pulPcrValueLength,
+                           prgbPcrValue):
+        tpm = self._get(hTPM, _Tpm)
+        if ulPcrIndex >= NUM_PCRS:
+            raise _tpm(tc.TPM_E_BADINDEX)
+        digest = _sha1(self._read(pbPcrData, ulPcrDataLength))
+        if pPcrEvent != self.ffi.NULL:
+            event = pPcrEvent[0]
+            value = self.tpm.extend(ulPcrIndex, digest, event.eventType,
+                                    self._read(event.rgbEvent,
+                                               event.ulEventLength))
+        else:
+            value = self.tpm.extend(ulPcrIndex, digest)
+        self._output(tpm.context, value, pulPcrValueLength, prgbPcrValue)
+
+    @_tpm_call
+    def Tspi_TPM_PcrReset(self, hTPM, hPcrComposite):
+        self._get(hTPM, _Tpm)
+        pcrs = self._get(hPcrComposite, _Pcrs)
+        if not pcrs.selection:
+            raise _tss(tc.TSS_E_NO_PCRS_SET)
+        for pcr in pcrs.selection:
+            if pcr not in RESETTABLE_PCRS:
+                raise _tpm(tc.TPM_E_NOTRESETABLE)
+        for pcr in pcrs.selection:
+            self.tpm.pcrs[pcr] = b'\x00' * 20
+            self.tpm.events[pcr] = []
+
+    @_tsp_call
+    def Tspi_TPM_GetEvents(self, hTPM, ulPcrIndex, ulStartNumber,
+                           pulEventNumber, prgPcrEvents):
+        tpm = self._get(hTPM, _Tpm)
+        if ulPcrIndex >= NUM_PCRS:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        log = self.tpm.events[ulPcrIndex]
+        if ulStartNumber > len(log):
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        selected = log[ulStartNumber:ulStartNumber + pulEventNumber[0]]
+        pulEventNumber[0] = len(selected)
+        if not selected:
+            prgPcrEvents[0] = self.ffi.NULL
+            return
+        events = self.ffi.new('TSS_PCR_EVENT[]', len(selected))
+        for i, (event_type, digest, data) in enumerate(selected):
+            events[i].versionInfo.bMajor = 1
+            events[i].versionInfo.bMinor = 2
+            events[i].ulPcrIndex = ulPcrIndex
+            events[i].eventType = event_type
+            events[i].ulPcrValueLength = len(digest)
+            events[i].rgbPcrValue = self._alloc(tpm.context, digest)
+            events[i].ulEventLength = len(data)
+            events[i].rgbEvent = self._alloc(tpm.context, data)
+        self.contexts[tpm.context].memory[self._address(events)] = events
+        prgPcrEvents[0] = events
+
+    @_tpm_call
+    def Tspi_TPM_Quote(self, hTPM, hIdentKey, hPcrComposite,
+                       pValidationData):
+        tpm = self._get(hTPM, _Tpm)
+        key = self._use_key(self._get(hIdentKey, _Key),
+                            (tc.TPM_KEY_SIGNING, tc.TPM_KEY_IDENTITY,
+                             tc.TPM_KEY_LEGACY))
+        pcrs = self._get(hPcrComposite, _Pcrs)
+        if not pcrs.selection:
+            raise _tss(tc.TSS_E_NO_PCRS_SET)
+        valid = pValidationData[0]
+        if valid.ulExternalDataLength != 20:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        nonce = self._read(valid.rgbExternalData, 20)
+
+        pcrs.values = dict((pcr, self.tpm.pcrs[pcr])
+                           for pcr in pcrs.selection)
+        composite = _sha1(pcr_composite(pcrs.values))
+        data = TPM_VERSION + b'QUOT' + composite + nonce
+        signature = self._sign(key, _sha1(data))
+
+        valid.versionInfo.bMajor = 1
+        valid.versionInfo.bMinor = 2
+        valid.ulDataLength = len(data)
+        valid.rgbData = self._alloc(tpm.context, data)
+        valid.ulValidationDataLength = len(signature)
+        valid.rgbValidationData = self._alloc(tpm.context, signature)
+
+    @_tpm_call
+    def Tspi_TPM_GetCapability(self, hTPM, capArea, ulSubCapLength,
+                               rgbSubCap, pulRespDataLength, prgbRespData):
+        tpm = self._get(hTPM, _Tpm)
+        sub = self._read(rgbSubCap, ulSubCapLength)
+        # The TSS takes and returns property values in host byte order
+        subcap = struct.unpack('=I', sub)[0] if len(sub) == 4 else None
+        if capArea == tc.TSS_TPMCAP_PROPERTY:
+            loaded = sum(1 for obj in self.objects.values()
+                         if isinstance(obj, _Key) and obj.loaded and
+                         obj.data is not self.tpm.srk)
+            properties = {
+                tc.TSS_TPMCAP_PROP_PCR: struct.pack('=I', NUM_PCRS),
+                tc.TSS_TPMCAP_PROP_MANUFACTURER: struct.pack(
+                    '=I', struct.unpack('!I', SOFT_VENDOR_ID)[0]),
+                tc.TSS_TPMCAP_PROP_SLOTS: struct.pack(
+                    '=I', max(0, SOFT_KEY_SLOTS - loaded)),
+                tc.TSS_TPMCAP_PROP_MAXKEYS: struct.pack('=I', SOFT_KEY_SLOTS),
+                tc.TSS_TPMCAP_PROP_OWNER: struct.pack(
+                    '=B', self.tpm.owner is not None),
+                tc.TSS_TPMCAP_PROP_INPUTBUFFERSIZE: struct.pack(
+                    '=I', SOFT_INPUT_BUFFER),
+            }
+            if subcap not in properties:
+                raise _tpm(tc.TPM_E_BAD_MODE)
+            data = properties[subcap]
+        elif capArea == tc.TSS_TPMCAP_VERSION_VAL:
+            # TPM_CAP_VERSION_INFO
+            data = struct.pack('!H4sHB4sH', 0x0030, b'\x01\x02\x01\x00', 2,
+                               1, SOFT_VENDOR_ID, 0)
+        elif capArea == tc.TSS_TPMCAP_NV_LIST:
+            self.tpm.nv_area(tc.TPM_NV_INDEX_EKCert)
+            data = b''.join(struct.pack('!I', index)
+                            for index in sorted(self.tpm.nv))
+        else:
+            raise _tpm(tc.TPM_E_BAD_MODE)
+        self._output(tpm.context, data, pulRespDataLength, prgbRespData)
+
+    @_tpm_call
+    def Tspi_TPM_ReadCurrentTicks(self, hTPM, tickCount):
+        self._get(hTPM, _Tpm)
+        tickCount.tag = TPM_TAG_CURRENT_TICKS
+        tickCount.currentTicks = self.tpm.ticks()
+        tickCount.tickRate = 1
+        self.ffi.memmove(tickCount.tickNonce.nonce, self.tpm.tick_nonce, 20)
+
+    @_tpm_call
+    def Tspi_TPM_ReadCounter(self, hTPM, counterValue):
+        self._get(hTPM, _Tpm)
+        counterValue[0] = self.tpm.counter
+
+    @_tpm_call
+    def Tspi_TPM_GetPubEndorsementKey(self, hTPM, fOwnerAuthorized,
+                                      pValidationData,
+                                      phEndorsementPubKey):
+        tpm = self._get(hTPM, _Tpm)
+        if fOwnerAuthorized:
+            self._owner_auth(tpm)
+        elif self.tpm.owner is not None:
+            raise _tpm(tc.TPM_E_DISABLED_CMD)
+        key = _Key(tpm.context, tc.TSS_KEY_TYPE_STORAGE)
+        key.n = self.tpm.ek.n
+        phEndorsementPubKey[0] = self._add(key)
+
+    @_tpm_call
+    def Tspi_TPM_TakeOwnership(self, hTPM, hKeySRK, hEndorsementPubKey):
+        tpm = self._get(hTPM, _Tpm)
+        srk = self._get(hKeySRK, _Key)
+        if self.tpm.owner is not None:
+            raise _tpm(tc.TPM_E_OWNER_SET)
+        owner = self._secret(tpm)
+        auth_usage = srk.template()[3]
+        secret = self._secret(srk) if auth_usage != tc.TPM_AUTH_NEVER \
+            else None
+        self.tpm.take_ownership(owner, secret, auth_usage)
+        srk.data = self.tpm.srk
+        srk.loaded = True
+
+    @_tpm_call
+    def Tspi_TPM_CollateIdentityRequest(self, hTPM, hKeySRK, hCAPubKey,
+                                        ulIdentityLabelLength,
+                                        rgbIdentityLabelData, hIdentityKey,
+                                        algID, pulTCPAIdentityReqLength,
+                                        prgbTCPAIdentityReq):
+        tpm = self._get(hTPM, _Tpm)
+        self._owner_auth(tpm)
+        srk = self._get(hKeySRK, _Key)
+        srkdata = self._use_key(srk, (tc.TPM_KEY_STORAGE,))
+        ca = self._public(self._get(hCAPubKey, _Key))
+        aik = self._get(hIdentityKey, _Key)
+        if aik.template()[0] != tc.TPM_KEY_IDENTITY:
+            raise _tss(tc.TSS_E_INVALID_KEYUSAGE)
+        if algID != tc.TSS_ALG_AES:
+            raise _tss(tc.TSS_E_NOTIMPL)
+        label = b''
+        if ulIdentityLabelLength:
+            label = self._read(rgbIdentityLabelData, ulIdentityLabelLength)
+
+        self._create_key(aik, srkdata)
+        self._load_key(aik, srk)
+        aikdata = aik.data
+        aik.loaded = False
+        pubkey = aikdata.pubkey()
+
+        contents = TPM_VERSION + struct.pack('!I', TPM_ORD_MAKEIDENTITY) + \
+            _sha1(label, ca.pubkey()) + pubkey
+        binding = self._sign(aikdata, _sha1(contents))
+        proof = TPM_VERSION + struct.pack('!IIIII', len(label),
+                                          len(binding), 0, 0, 0) + \
+            pubkey + label + binding
+
+        sessionkey = os.urandom(16)
+        iv = os.urandom(16)
+        padder_len = 16 - len(proof) % 16
+        encryptor = Cipher(algorithms.AES(sessionkey), modes.CBC(iv)) \
+            .encryptor()
+        symblob = encryptor.update(proof + bytes([padder_len]) *
+                                   padder_len) + encryptor.finalize()
+        symkey = struct.pack('!IHH', tc.TPM_ALG_AES128,
+                             tc.TPM_ES_SYM_CBC_PKCS5PAD, 16) + sessionkey
+        asymblob = _oaep_encrypt(ca.n, symkey)
+
+        symparms = struct.pack('!III', 128, 128, 16) + iv
+        asymparms = struct.pack('!III', ca.bits, 2, 0)
+        req = struct.pack('!II', len(asymblob), len(symblob)) + \
+            struct.pack('!IHHI', tc.TPM_ALG_RSA,
+                        tc.TPM_ES_RSAESOAEP_SHA1_MGF1, tc.TPM_SS_NONE,
+                        len(asymparms)) + asymparms + \
+            struct.pack('!IHHI', tc.TPM_ALG_AES128,
+                        tc.TPM_ES_SYM_CBC_PKCS5PAD, tc.TPM_SS_NONE,
+                        len(symparms)) + symparms + asymblob + symblob
+        self._output(tpm.context, req, pulTCPAIdentityReqLength,
+                     prgbTCPAIdentityReq)
+
+    @_tpm_call
+    def Tspi_TPM_ActivateIdentity(self, hTPM, hIdentKey,
+                                  ulAsymCAContentsBlobLength,
+                                  rgbAsymCAContentsBlob,
+                                  ulSymCAAttestationBlobLength,
+                                  rgbSymCAAttestationBlob,
+                                  pulCredentialLength, prgbCredential):
+        tpm = self._get(hTPM, _Tpm)
+        self._owner_auth(tpm)
+        aik = self._use_key(self._get(hIdentKey, _Key),
+                            (tc.TPM_KEY_IDENTITY,))
+        asym = self._read(rgbAsymCAContentsBlob, ulAsymCAContentsBlobLength)
+        sym = self._read(rgbSymCAAttestationBlob,
+                         ulSymCAAttestationBlobLength)
+
+        try:
+            contents = self.tpm.ek.private.decrypt(asym, _TCPA_OAEP)
+        except ValueError:
+            raise _tpm(tc.TPM_E_DECRYPT_ERROR)
+        if len(contents) < 28:
+            raise _tpm(tc.TPM_E_BAD_PARAMETER)
+        alg, scheme, size = struct.unpack_from('!IHH', contents)
+        sessionkey = contents[8:8 + size]
+        digest = contents[8 + size:8 + size + 20]
+        if digest != _sha1(aik.pubkey()):
+            raise _tpm(tc.TPM_E_BAD_PARAMETER)
+
+        # The TSS decrypts the TPM_SYM_CA_ATTESTATION with the session key
+        try:
+            credsize, alg, scheme, sigscheme, parmsize = \
+                struct.unpack_from('!IIHHI', sym)
+            keylen, blocksize, ivsize = struct.unpack_from('!III', sym, 16)
+        except struct.error:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        offset = 16 + parmsize
+        credential = sym[offset:offset + credsize]
+        if ivsize:
+            iv = sym[28:28 + ivsize]
+        else:
+            iv, credential = credential[:16], credential[16:]
+        if (alg != tc.TPM_ALG_AES128 or
+                scheme != tc.TPM_ES_SYM_CBC_PKCS5PAD or
+                len(credential) % 16 or not credential):
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        decryptor = Cipher(algorithms.AES(sessionkey), modes.CBC(iv)) \
+            .decryptor()
+        plain = decryptor.update(credential) + decryptor.finalize()
+        pad = bytearray(plain)[-1]
+        if not 1 <= pad <= 16 or plain[-pad:] != bytes([pad]) * pad:
+            raise _tss(tc.TSS_E_FAIL)
+        self._output(tpm.context, plain[:-pad], pulCredentialLength,
+                     prgbCredential)
+
+    # PCR composites
+
+    @_tsp_call
+    def Tspi_PcrComposite_SelectPcrIndex(self, hPcrComposite, ulPcrIndex):
+        pcrs = self._get(hPcrComposite, _Pcrs)
+        if ulPcrIndex >= NUM_PCRS:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        pcrs.selection.add(ulPcrIndex)
+
+    @_tsp_call
+    def Tspi_PcrComposite_SelectPcrIndexEx(self, hPcrComposite, ulPcrIndex,
+                                           direction):
+        pcrs = self._get(hPcrComposite, _Pcrs)
+        if ulPcrIndex >= NUM_PCRS:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        pcrs.selection.add(ulPcrIndex)
+
+    @_tsp_call
+    def Tspi_PcrComposite_SetPcrValue(self, hPcrComposite, ulPcrIndex,
+                                      ulPcrValueLength, rgbPcrValue):
+        pcrs = self._get(hPcrComposite, _Pcrs)
+        if ulPcrIndex >= NUM_PCRS or ulPcrValueLength != 20:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        pcrs.selection.add(ulPcrIndex)
+        pcrs.values[ulPcrIndex] = self._read(rgbPcrValue, ulPcrValueLength)
+
+    @_tsp_call
+    def Tspi_PcrComposite_GetPcrValue(self, hPcrComposite, ulPcrIndex,
+                                      pulPcrValueLength, prgbPcrValue):
+        pcrs = self._get(hPcrComposite, _Pcrs)
+        if ulPcrIndex not in pcrs.selection:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        self._output(pcrs.context, pcrs.values.get(ulPcrIndex, b'\x00' * 20),
+                     pulPcrValueLength, prgbPcrValue)
+
+    @_tsp_call
+    def Tspi_PcrComposite_GetCompositeHash(self, hPcrComposite, pLen,
+                                           ppbHashData):
+        pcrs = self._get(hPcrComposite, _Pcrs)
+        if not pcrs.selection:
+            raise _tss(tc.TSS_E_NO_PCRS_SET)
+        self._output(pcrs.context, _sha1(pcr_composite(
+            self._pcr_values(pcrs))), pLen, ppbHashData)
+
+    # Keys
+
+    @_tpm_call
+    def Tspi_Key_CreateKey(self, hKey, hWrappingKey, hPcrComposite):
+        key = self._get(hKey, _Key)
+        parent = self._use_key(self._get(hWrappingKey, _Key),
+                               (tc.TPM_KEY_STORAGE,))
+        self._create_key(key, parent)
+
+    @_tpm_call
+    def Tspi_Key_LoadKey(self, hKey, hUnwrappingKey):
+        key = self._get(hKey, _Key)
+        if key.data is None:
+            raise _tss(tc.TSS_E_KEY_NOT_SET)
+        self._load_key(key, self._get(hUnwrappingKey, _Key))
+
+    @_tsp_call
+    def Tspi_Key_UnloadKey(self, hKey):
+        key = self._get(hKey, _Key)
+        if not key.loaded:
+            raise _tss(tc.TSS_E_KEY_NOT_LOADED)
+        # The SRK is permanently loaded
+        if key.data is not self.tpm.srk:
+            key.data.private = None
+        key.loaded = False
+
+    @_tpm_call
+    def Tspi_Key_GetPubKey(self, hKey, pulPubKeyLength, prgbPubKey):
+        key = self._get(hKey, _Key)
+        if not key.loaded:
+            raise _tss(tc.TSS_E_KEY_NOT_LOADED)
+        self._output(key.context, key.data.pubkey(), pulPubKeyLength,
+                     prgbPubKey)
+
+    # Hashes
+
+    @_tsp_call
+    def Tspi_Hash_UpdateHashValue(self, hHash, ulDataLength, rgbData):
+        obj = self._get(hHash, _Hash)
+        if obj.hash is None:
+            raise _tss(tc.TSS_E_HASH_INVALID_ALG)
+        obj.hash.update(self._read(rgbData, ulDataLength))
+        obj.digest = obj.hash.digest()
+
+    @_tsp_call
+    def Tspi_Hash_SetHashValue(self, hHash, ulHashValueLength, rgbHashValue):
+        obj = self._get(hHash, _Hash)
+        if obj.hash is not None and ulHashValueLength != 20:
+            raise _tss(tc.TSS_E_HASH_INVALID_LENGTH)
+        obj.digest = self._read(rgbHashValue, ulHashValueLength)
+
+    @_tsp_call
+    def Tspi_Hash_GetHashValue(self, hHash, pulHashValueLength,
+                               prgbHashValue):
+        obj = self._get(hHash, _Hash)
+        if obj.digest is None:
+            raise _tss(tc.TSS_E_HASH_NO_DATA)
+        self._output(obj.context, obj.digest, pulHashValueLength,
+                     prgbHashValue)
+
+    @_tpm_call
+    def Tspi_Hash_Sign(self, hHash, hKey, pulSignatureLength,
+                       prgbSignature):
+        obj = self._get(hHash, _Hash)
+        key = self._use_key(self._get(hKey, _Key),
+                            (tc.TPM_KEY_SIGNING, tc.TPM_KEY_LEGACY))
+        if obj.digest is None:
+            raise _tss(tc.TSS_E_HASH_NO_DATA)
+        scheme = _SCHEMES[key.usage][1]
+        self._output(obj.context, self._sign(key, obj.digest, scheme),
+                     pulSignatureLength, prgbSignature)
+
+    @_tpm_call
+    def Tspi_Hash_TickStampBlob(self, hHash, hIdentKey, pValidationData):
+        obj = self._get(hHash, _Hash)
+        key = self._use_key(self._get(hIdentKey, _Key),
+                            (tc.TPM_KEY_SIGNING, tc.TPM_KEY_IDENTITY,
+                             tc.TPM_KEY_LEGACY))
+        if obj.digest is None:
+            raise _tss(tc.TSS_E_HASH_NO_DATA)
+        if len(obj.digest) != 20:
+            raise _tss(tc.TSS_E_HASH_INVALID_LENGTH)
+        valid = pValidationData[0]
+        if valid.ulExternalDataLength != 20:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        nonce = self._read(valid.rgbExternalData, 20)
+
+        ticks = struct.pack('!HQH', TPM_TAG_CURRENT_TICKS, self.tpm.ticks(),
+                            1) + self.tpm.tick_nonce
+        stamped = obj.digest + ticks
+        data = (struct.pack('!H', TPM_TAG_SIGNINFO) + b'TSTP' + nonce +
+                struct.pack('!I', len(stamped)) + stamped)
+        signature = self._sign(key, _sha1(data))
+
+        valid.versionInfo.bMajor = 1
+        valid.versionInfo.bMinor = 2
+        valid.ulDataLength = len(data)
+        valid.rgbData = self._alloc(obj.context, data)
+        valid.ulValidationDataLength = len(signature)
+        valid.rgbValidationData = self._alloc(obj.context, signature)
+
+    @_tsp_call
+    def Tspi_Hash_VerifySignature(self, hHash, hKey, ulSignatureLength,
+                                  rgbSignature):
+        obj = self._get(hHash, _Hash)
+        key = self._public(self._get(hKey, _Key))
+        if obj.digest is None:
+            raise _tss(tc.TSS_E_HASH_NO_DATA)
+        k = key.bits // 8
+        signature = _bytes_to_int(self._read(rgbSignature,
+                                             ulSignatureLength))
+        if ulSignatureLength != k or signature >= key.n:
+            raise _tss(tc.TSS_E_FAIL)
+        em = _int_to_bytes(pow(signature, 65537, key.n), k)
+        data = obj.digest
+        if obj.hash is not None:
+            data = _SHA1_DIGESTINFO + data
+        if em != _pkcs1_type1(data, k):
+            raise _tss(tc.TSS_E_FAIL)
+
+    # Sealing and binding
+
+    @_tpm_call
+    def Tspi_Data_Seal(self, hEncData, hEncKey, ulDataLength, rgbDataToSeal,
+                       hPcrComposite):
+        encdata = self._get(hEncData, _EncData)
+        if encdata.flags != tc.TSS_ENCDATA_SEAL:
+            raise _tss(tc.TSS_E_INVALID_OBJECT_TYPE)
+        key = self._use_key(self._get(hEncKey, _Key), (tc.TPM_KEY_STORAGE,))
+        data = self._read(rgbDataToSeal, ulDataLength)
+        # TPM_SEALED_DATA and OAEP padding have to fit in the key
+        if len(data) > key.bits // 8 - 42 - 65:
+            raise _tpm(tc.TPM_E_BAD_DATASIZE)
+        policy = self.objects.get(encdata.policy)
+        auth = policy.secret if policy is not None else None
+
+        sealinfo = b''
+        if hPcrComposite:
+            pcrs = self._get(hPcrComposite, _Pcrs)
+            values = self._pcr_values(pcrs)
+            current = dict((pcr, self.tpm.pcrs[pcr]) for pcr in values)
+            select = _pcr_select(values)
+            sealinfo = struct.pack('!HBB', TPM_TAG_PCR_INFO_LONG, 1, 0x1f) + \
+                select + select + _sha1(pcr_composite(current)) + \
+                _sha1(pcr_composite(values))
+        header = struct.pack('!HHI', TPM_TAG_STORED_DATA12, 0,
+                             len(sealinfo)) + sealinfo
+        plain = (b'\x01' if auth is not None else b'\x00') + \
+            (auth or WELL_KNOWN_SECRET) + data
+        enc = _gcm_seal(self.tpm.storage_secret(key), plain, header)
+        encdata.blob = header + struct.pack('!I', len(enc)) + enc
+
+    @_tpm_call
+    def Tspi_Data_Unseal(self, hEncData, hKey, pulUnsealedDataLength,
+                         prgbUnsealedData):
+        encdata = self._get(hEncData, _EncData)
+        key = self._use_key(self._get(hKey, _Key), (tc.TPM_KEY_STORAGE,))
+        if encdata.blob is None:
+            raise _tss(tc.TSS_E_ENC_NO_DATA)
+        try:
+            stored = TpmStoredData12(encdata.blob)
+            if stored.tag != TPM_TAG_STORED_DATA12:
+                raise _tpm(tc.TPM_E_NOTSEALED_BLOB)
+            sealinfo = stored.seal_info.tobytes()
+            enc = stored.enc_data.tobytes()
+        except ValueError:
+            raise _tpm(tc.TPM_E_INVALID_STRUCTURE)
+
+        header = encdata.blob[:8 + len(sealinfo)]
+        plain = _gcm_open(self.tpm.storage_secret(key), enc, header)
+        if sealinfo:
+            pcrs, offset = _parse_pcr_select(sealinfo, 4)
+            pcrs, offset = _parse_pcr_select(sealinfo, offset)
+            release = sealinfo[offset + 20:offset + 40]
+            current = dict((pcr, self.tpm.pcrs[pcr]) for pcr in pcrs)
+            if _sha1(pcr_composite(current)) != release:
+                raise _tpm(tc.TPM_E_WRONGPCRVAL)
+        if plain[0:1] == b'\x01':
+            self._authorize(encdata, plain[1:21], tc.TPM_E_AUTH2FAIL)
+        self._output(encdata.context, plain[21:], pulUnsealedDataLength,
+                     prgbUnsealedData)
+
+    @_tsp_call
+    def Tspi_Data_Bind(self, hEncData, hEncKey, ulDataLength, rgbDataToBind):
+        encdata = self._get(hEncData, _EncData)
+        if encdata.flags != tc.TSS_ENCDATA_BIND:
+            raise _tss(tc.TSS_E_INVALID_OBJECT_TYPE)
+        key = self._public(self._get(hEncKey, _Key))
+        if key.usage not in (tc.TPM_KEY_BIND, tc.TPM_KEY_LEGACY):
+            raise _tss(tc.TSS_E_INVALID_KEYUSAGE)
+        if not ulDataLength:
+            raise _tss(tc.TSS_E_ENC_NO_DATA)
+        # TPM_BOUND_DATA: version and TPM_PT_BIND payload type
+        bound = TPM_VERSION + b'\x02' + self._read(rgbDataToBind,
+                                                   ulDataLength)
+        encdata.blob = _oaep_encrypt(key.n, bound)
+
+    @_tpm_call
+    def Tspi_Data_Unbind(self, hEncData, hKey, pulUnboundDataLength,
+                         prgbUnboundData):
+        encdata = self._get(hEncData, _EncData)
+        key = self._use_key(self._get(hKey, _Key),
+                            (tc.TPM_KEY_BIND, tc.TPM_KEY_LEGACY))
+        if encdata.blob is None:
+            raise _tss(tc.TSS_E_ENC_NO_DATA)
+        try:
+            bound = key.private.decrypt(encdata.blob, _TCPA_OAEP)
+        except ValueError:
+            raise _tpm(tc.TPM_E_DECRYPT_ERROR)
+        if bound[:5] != TPM_VERSION + b'\x02':
+            raise _tpm(tc.TPM_E_INVALID_STRUCTURE)
+        self._output(encdata.context, bound[5:], pulUnboundDataLength,
+                     prgbUnboundData)
+
+    # NV storage
+
+    def _nv_authorize(self, nv, area, authperm, ownerperm):
+        if area.permissions & authperm:
+            policy = self.objects.get(nv.policy)
+            if policy is None or policy.secret is None:
+                raise _tpm(tc.TPM_E_AUTH_CONFLICT)
+            self._authorize(nv, area.auth)
+        elif area.permissions & ownerperm:
+            tpm = self._tpm_object(nv.context)
+            policy = self.objects.get(tpm.policy)
+            if policy is None or policy.secret is None:
+                raise _tpm(tc.TPM_E_AUTH_CONFLICT)
+            self._owner_auth(nv)
+
+    def _nv_area(self, nv):
+        area = self.tpm.nv_area(nv.index)
+        if area is None:
+            raise _tpm(tc.TPM_E_BADINDEX)
+        return area
+
+    @_tpm_call
+    def Tspi_NV_DefineSpace(self, hNVStore, hReadPcrComposite,
+                            hWritePcrComposite):
+        nv = self._get(hNVStore, _Nv)
+        self._owner_auth(nv)
+        if nv.index is None or not nv.size:
+            raise _tss(tc.TSS_E_BAD_PARAMETER)
+        if self.tpm.nv_area(nv.index) is not None:
+            raise _tss(tc.TSS_E_NV_AREA_EXIST)
+        auth = None
+        if nv.permissions & (tc.TPM_NV_PER_AUTHREAD |
+                             tc.TPM_NV_PER_AUTHWRITE):
+            auth = self._secret(nv)
+        self.tpm.nv[nv.index] = _NvArea(nv.size, nv.permissions, auth)
+
+    @_tpm_call
+    def Tspi_NV_ReleaseSpace(self, hNVStore):
+        nv = self._get(hNVStore, _Nv)
+        self._owner_auth(nv)
+        if self.tpm.nv_area(nv.index) is None:
+            raise _tss(tc.TSS_E_NV_AREA_NOT_EXIST)
+        del self.tpm.nv[nv.index]
+
+    @_tpm_call
+    def Tspi_NV_WriteValue(self, hNVStore, offset, ulDataLength,
+                           rgbDataToWrite):
+        nv = self._get(hNVStore, _Nv)
+        area = self._nv_area(nv)
+        if offset + ulDataLength > area.size:
+            raise _tpm(tc.TPM_E_NOSPACE)
+        self._nv_authorize(nv, area, tc.TPM_NV_PER_AUTHWRITE,
+                           tc.TPM_NV_PER_OWNERWRITE)
+        area.data[offset:offset + ulDataLength] = \
+            self._read(rgbDataToWrite, ulDataLength)
+
+    @_tpm_call
+    def Tspi_NV_ReadValue(self, hNVStore, offset, ulDataLength,
+                          rgbDataRead):
+        nv = self._get(hNVStore, _Nv)
+        area = self._nv_area(nv)
+        length = ulDataLength[0]
+        if offset + length > area.size:
+            raise _tpm(tc.TPM_E_NOSPACE)
+        self._nv_authorize(nv, area, tc.TPM_NV_PER_AUTHREAD,
+                           tc.TPM_NV_PER_OWNERREAD)
+        self._output(nv.context, area.data[offset:offset + length],
+                     ulDataLength, rgbDataRead)
+
+
+def _latency_from_env():
+    setting = os.environ.get('PYTSS_SOFT_LATENCY')
+    if not setting:
+        return None
+    if setting == 'typical':
+        return TYPICAL_LATENCY
+    seconds = float(setting)
+    return dict((name, seconds) for name in TYPICAL_LATENCY)
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Zero-copy views over TPM 1.2 wire structures.
+
+The TSS hands key blobs, sealed data, quotes and identity requests back as
+flat big-endian byte strings laid out as described by the corresponding
+structures in interface.h. The classes here wrap such a buffer in a
+memoryview and only decode a field when it is accessed. Variable length
+fields are returned as memoryview slices of the original buffer, so nothing
+is copied until the caller asks for it.
+"""
+
+import abc
+import binascii
+import struct
+
+_UINT16 = struct.Struct('!H')
+_UINT32 = struct.Struct('!I')
+_UINT64 = struct.Struct('!Q')
+
+TPM_TAG_KEY12 = 0x0028
+TPM_TAG_STORED_DATA12 = 0x0016
+TPM_TAG_CURRENT_TICKS = 0x0014
+TPM_TAG_SIGNINFO = 0x0005
+
+
+class TpmStruct(abc.ABC):
+    """Base class for a lazily decoded TPM structure"""
+
+    def __init__(self, data, offset=0):
+        """
+        Wrap a buffer containing a TPM structure
+
+        :param data: Any object supporting the buffer protocol
+        :param offset: The offset of the structure within data
+        """
+        self.buf = memoryview(data)
+        self.offset = offset
+
+    def _unpack(self, fmt, offset):
+        try:
+            return fmt.unpack_from(self.buf, self.offset + offset)[0]
+        except struct.error:
+            raise ValueError("Truncated %s" % type(self).__name__)
+
+    def _uint8(self, offset):
+        if self.offset + offset >= len(self.buf):
+            raise ValueError("Truncated %s" % type(self).__name__)
+        return bytearray(self.buf[self.offset + offset:
+                                  self.offset + offset + 1])[0]
+
+    def _uint16(self, offset):
+        return self._unpack(_UINT16, offset)
+
+    def _uint32(self, offset):
+        return self._unpack(_UINT32, offset)
+
+    def _uint64(self, offset):
+        return self._unpack(_UINT64, offset)
+
+    def _bytes(self, offset, length):
+        start = self.offset + offset
+        end = start + length
+        if end > len(self.buf):
+            raise ValueError("Truncated %s" % type(self).__name__)
+        return self.buf[start:end]
+
+    @property
+    @abc.abstractmethod
+    def size(self):
+        """The encoded length of the structure in bytes"""
+
+    def tobytes(self):
+        """Return a copy of the encoded structure"""
+        return self._bytes(0, self.size).tobytes()
+
+
+class TpmKeyParms(TpmStruct):
+    """TPM_KEY_PARMS"""
+
+    @property
+    def algorithm_id(self):
+        return self._uint32(0)
+
+    @property
+    def enc_scheme(self):
+        return self._uint16(4)
+
+    @property
+    def sig_scheme(self):
+        return self._uint16(6)
+
+    @property
+    def parm_size(self):
+        return self._uint32(8)
+
+    @property
+    def parms(self):
+        return self._bytes(12, self.parm_size)
+
+    @property
+    def rsa_parms(self):
+        """The parms field interpreted as TPM_RSA_KEY_PARMS"""
+        return TpmRsaKeyParms(self.buf, self.offset + 12)
+
+    @property
+    def size(self):
+        return 12 + self.parm_size
+
+
+class TpmRsaKeyParms(TpmStruct):
+    """TPM_RSA_KEY_PARMS"""
+
+    @property
+    def key_length(self):
+        return self._uint32(0)
+
+    @property
+    def num_primes(self):
+        return self._uint32(4)
+
+    @property
+    def exponent_size(self):
+        return self._uint32(8)
+
+    @property
+    def exponent(self):
+        """
+        The public exponent as an integer. An empty exponent field means
+        the default of 65537.
+        """
+        size = self.exponent_size
+        if size == 0:
+            return 65537
+        return int(binascii.hexlify(self._bytes(12, size).tobytes()), 16)
+
+    @property
+    def size(self):
+        return 12 + self.exponent_size
+
+
+class TpmStorePubkey(TpmStruct):
+    """TPM_STORE_PUBKEY"""
+
+    @property
+    def key_length(self):
+        return self._uint32(0)
+
+    @property
+    def key(self):
+        return self._bytes(4, self.key_length)
+
+    @property
+    def size(self):
+        return 4 + self.key_length
+
+
+class TpmPubKey(TpmStruct):
+    """TPM_PUBKEY, as returned by TspiKey.get_pubkeyblob()"""
+
+    @property
+    def algorithm_parms(self):
+        return TpmKeyParms(self.buf, self.offset)
+
+    @property
+    def pub_key(self):
+        return TpmStorePubkey(self.buf,
+                              self.offset + self.algorithm_parms.size)
+
+    @property
+    def modulus(self):
+        """The RSA modulus"""
+        return self.pub_key.key
+
+    @property
+    def size(self):
+        return self.algorithm_parms.size + self.pub_key.size
+
+
+class TpmKey12(TpmStruct):
+    """
+    TPM_KEY12, as returned by TspiKey.get_keyblob(). A legacy TPM_KEY has
+    the same layout with a TPM_STRUCT_VER in place of tag and fill, which
+    can be told apart with is_key12.
+    """
+
+    def __init__(self, data, offset=0):
+        super(TpmKey12, self).__init__(data, offset)
+        self._offsets = None
+
+    def _layout(self):
+        if self._offsets is None:
+            parms = 11
+            pcrinfo = parms + TpmKeyParms(self.buf, self.offset + parms).size
+            pubkey = pcrinfo + 4 + self._uint32(pcrinfo)
+            enc = pubkey + TpmStorePubkey(self.buf, self.offset + pubkey).size
+            self._offsets = (parms, pcrinfo, pubkey, enc)
+        return self._offsets
+
+    @property
+    def tag(self):
+        return self._uint16(0)
+
+    @property
+    def is_key12(self):
+        return self.tag == TPM_TAG_KEY12
+
+    @property
+    def ver(self):
+        """The leading TPM_STRUCT_VER of a legacy TPM_KEY"""
+        return self._bytes(0, 4)
+
+    @property
+    def fill(self):
+        return self._uint16(2)
+
+    @property
+    def key_usage(self):
+        return self._uint16(4)
+
+    @property
+    def key_flags(self):
+        return self._uint32(6)
+
+    @property
+    def auth_data_usage(self):
+        return self._uint8(10)
+
+    @property
+    def algorithm_parms(self):
+        return TpmKeyParms(self.buf, self.offset + self._layout()[0])
+
+    @property
+    def pcr_info_size(self):
+        return self._uint32(self._layout()[1])
+
+    @property
+    def pcr_info(self):
+        offset = self._layout()[1]
+        return self._bytes(offset + 4, self._uint32(offset))
+
+    @property
+    def pub_key(self):
+        return TpmStorePubkey(self.buf, self.offset + self._layout()[2])
+
+    @property
+    def modulus(self):
+        """The RSA modulus"""
+        return self.pub_key.key
+
+    @property
+    def enc_size(self):
+        return self._uint32(self._layout()[3])
+
+    @property
+    def enc_data(self):
+        offset = self._layout()[3]
+        return self._bytes(offset + 4, self._uint32(offset))
+
+    @property
+    def size(self):
+        return self._layout()[3] + 4 + self.enc_size
+
+
+class TpmStoredData12(TpmStruct):
+    """TPM_STORED_DATA12, as returned by TspiKey.seal()"""
+
+    @property
+    def tag(self):
+        return self._uint16(0)
+
+    @property
+    def et(self):
+        return self._uint16(2)
+
+    @property
+    def seal_info_size(self):
+        return self._uint32(4)
+
+    @property
+    def seal_info(self):
+        return self._bytes(8, self.seal_info_size)
+
+    @property
+    def enc_data_size(self):
+        return self._uint32(8 + self.seal_info_size)
+
+    @property
+    def enc_data(self):
+        offset = 8 + self.seal_info_size
+        return self._bytes(offset + 4, self._uint32(offset))
+
+    @property
+    def size(self):
+        return 12 + self.seal_info_size + self.enc_data_size
+
+
+class TpmQuoteInfo(TpmStruct):
+    """TPM_QUOTE_INFO, the data returned by TspiTPM.get_quote()"""
+
+    @property
+    def version(self):
+        return self._bytes(0, 4)
+
+    @property
+    def fixed(self):
+        return self._bytes(4, 4)
+
+    @property
+    def composite_hash(self):
+        return self._bytes(8, 20)
+
+    @property
+    def external_data(self):
+        return self._bytes(28, 20)
+
+    @property
+    def size(self):
+        return 48
+
+
+class TpmIdentityReq(TpmStruct):
+    """TPM_IDENTITY_REQ, as returned by TspiTPM.collate_identity_request()"""
+
+    @property
+    def asym_size(self):
+        return self._uint32(0)
+
+    @property
+    def sym_size(self):
+        return self._uint32(4)
+
+    @property
+    def asym_algorithm(self):
+        return TpmKeyParms(self.buf, self.offset + 8)
+
+    @property
+    def sym_algorithm(self):
+        return TpmKeyParms(self.buf,
+                           self.offset + 8 + self.asym_algorithm.size)
+
+    def _blob_offset(self):
+        return 8 + self.asym_algorithm.size + self.sym_algorithm.size
+
+    @property
+    def asym_blob(self):
+        return self._bytes(self._blob_offset(), self.asym_size)
+
+    @property
+    def sym_blob(self):
+        return self._bytes(self._blob_offset() + self.asym_size,
+                           self.sym_size)
+
+    @property
+    def size(self):
+        return self._blob_offset() + self.asym_size + self.sym_size
+
+
+class TpmCurrentTicks(TpmStruct):
+    """TPM_CURRENT_TICKS"""
+
+    @property
+    def tag(self):
+        return self._uint16(0)
+
+    @property
+    def current_ticks(self):
+        return self._uint64(2)
+
+    @property
+    def tick_rate(self):
+        """Microseconds per tick"""
+        return self._uint16(10)
+
+    @property
+    def tick_nonce(self):
+        return self._bytes(12, 20)
+
+    @property
+    def size(self):
+        return 32
+
+
+class TpmSignInfo(TpmStruct):
+    """TPM_SIGN_INFO, the data signed by TspiHash.tickstamp()"""
+
+    @property
+    def tag(self):
+        return self._uint16(0)
+
+    @property
+    def fixed(self):
+        return self._bytes(2, 4)
+
+    @property
+    def replay(self):
+        return self._bytes(6, 20)
+
+    @property
+    def data_len(self):
+        return self._uint32(26)
+
+    @property
+    def data(self):
+        return self._bytes(30, self.data_len)
+
+    @property
+    def digest(self):
+        """The digest a "TSTP" tick stamp was taken over"""
+        return self._bytes(30, 20)
+
+    @property
+    def ticks(self):
+        """The TpmCurrentTicks of a "TSTP" tick stamp"""
+        return TpmCurrentTicks(self.buf, self.offset + 50)
+
+    @property
+    def size(self):
+        return 30 + self.data_len
+
+
+def pcr_composite(pcrvalues):
+    """
+    Encode a TPM_PCR_COMPOSITE
+
+    :param pcrvalues: A dict mapping PCR indices to their values
+
+    :returns: The encoded structure, whose SHA1 digest is the compositeHash
+        of a TPM_QUOTE_INFO over the same PCRs
+    """
+    select = 0
+    maxpcr = 0
+    values = bytearray()
+
+    for pcr in sorted(pcrvalues):
+        values += pcrvalues[pcr]
+        select |= (1 << pcr)
+        maxpcr = pcr
+
+    # pcrSelect is a bitmap with PCR 0 in the low bit of the first byte
+    if maxpcr < 16:
+        header = struct.pack('!H', 2) + struct.pack('<H', select)
+    else:
+        header = struct.pack('!H', 4) + struct.pack('<I', select)
+    header += struct.pack('!I', len(values))
+
+    return header + bytes(values)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+TPM-anchored timestamps for large numbers of records.
+
+A TPM tick stamp signs a digest together with the TPM's tick counter, but
+costs an RSA operation in the TPM. TickStamper builds a Merkle tree over a
+batch of records and tick-stamps only the root, giving every record the
+same timestamp and an inclusion proof. TickStampService collects records
+submitted from any thread and stamps them once per interval.
+
+verify_timestamp checks a record's timestamp using only the signing key's
+public modulus. Ticks count from the TPM's last tick session reset, which
+the tick nonce identifies; relating them to wall clock time needs a
+separately trusted reading of the same session, such as one taken with
+TspiTPM.read_ticks.
+"""
+
+import collections
+import hashlib
+import threading
+
+from pytss import TspiHash
+from pytss.interface import tss_lib
+from pytss.structs import TPM_TAG_SIGNINFO, TpmSignInfo
+from pytss import merkle
+
+TimeStamp = collections.namedtuple('TimeStamp',
+                                   'proof root data signature')
+
+
+class TickStamper(object):
+    def __init__(self, key, hash_name='sha256'):
+        """
+        Create a batch tick stamper
+
+        :param key: A loaded signing or identity TspiKey using
+            the TPM_SS_RSASSAPKCS1v15_SHA1 signature scheme
+        :param hash_name: The hash to build trees with, 'sha256' or 'sha1'
+        """
+        self.key = key
+        self.hash_name = hash_name
+
+    def stamp(self, records, nonce=None):
+        """
+        Tick-stamp a batch of records with a single TPM operation
+
+        :param records: A sequence of records, each a bytes-like object
+        :param nonce: An optional anti-replay nonce for the tick stamp
+
+        :returns: A list of the TimeStamp of each record, in order
+        """
+        tree = merkle.MerkleTree(records, self.hash_name)
+        digest = TspiHash(self.key.context, tss_lib.TSS_HASH_SHA1)
+        try:
+            digest.update(tree.root)
+            ticks, data, signature = digest.tickstamp(self.key, nonce)
+        finally:
+            digest.close()
+        return [TimeStamp(proof, tree.root, data, signature)
+                for proof in tree.proofs()]
+
+
+class _Pending(object):
+    def __init__(self, record):
+        self.record = record
+        self.stamp = None
+        self.error = None
+        self.done = threading.Event()
+
+    def result(self, timeout=None):
+        """
+        Wait for the record to be stamped
+
+        :param timeout: The longest to wait in seconds, or None to wait
+            forever
+
+        :returns: The record's TimeStamp
+        """
+        if not self.done.wait(timeout):
+            raise RuntimeError("Timed out waiting for a timestamp")
+        if self.error is not None:
+            raise self.error
+        return self.stamp
+
+
+class TickStampService(object):
+    def __init__(self, stamper, interval=1.0, max_batch=None, lock=None):
+        """
+        Tick-stamp submitted records once per interval
+
+        As with the other background helpers, either give the service a
+        key from a TSS context of its own, or pass the lock that serialises
+        every other user of the context.
+
+        :param stamper: The TickStamper to use
+        :param interval: Seconds between stamps
+        :param max_batch: Stamp early once this many records are waiting
+        :param lock: An optional lock held around every TPM call
+        """
+        self.stamper = stamper
+        self.interval = interval
+        self.max_batch = max_batch
+        self.lock = lock or threading.Lock()
+        self.waiting = []
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, record):
+        """
+        Queue a record for the next stamp
+
+        :param record: The record, a bytes-like object
+
+        :returns: An object whose result() method waits for and returns the
+            record's TimeStamp
+        """
+        pending = _Pending(bytes(record))
+        with self.cond:
+            if self.closed:
+                raise ValueError("Service is closed")
+            self.waiting.append(pending)
+            if self.max_batch and len(self.waiting) >= self.max_batch:
+                self.cond.notify_all()
+        return pending
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.closed:
+                    self.cond.wait(self.interval)
+                batch, self.waiting = self.waiting, []
+                closed = self.closed
+            if batch:
+                self._stamp(batch)
+            if closed:
+                return
+
+    def _stamp(self, batch):
+        try:
+            with self.lock:
+                stamps = self.stamper.stamp([p.record for p in batch])
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+                pending.done.set()
+            return
+        for pending, stamp in zip(batch, stamps):
+            pending.stamp = stamp
+            pending.done.set()
+
+    def close(self):
+        """Stamp the records still waiting and stop the service"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+
+
+def verify_timestamp(record, stamp, modulus, exponent=65537, nonce=None,
+                     hash_name='sha256'):
+    """
+    Check a record's timestamp without a TPM
+
+    :param record: The record
+    :param stamp: Its TimeStamp, whose proof may be a MerkleProof or the
+        proof encoded by merkle.encode_proof
+    :param modulus: The signing key's public modulus, as returned by
+        TspiKey.get_pubkey
+    :param exponent: The signing key's public exponent
+    :param nonce: The anti-replay nonce the stamp was taken with, if any
+    :param hash_name: The only tree hash to accept proofs for, 'sha256' as
+        used by TickStamper by default
+
+    :returns: The TpmCurrentTicks the record was stamped with, or None if
+        the timestamp is not valid
+    """
+    from pytss.attestationutils import pkcs1_verify
+    try:
+        info = TpmSignInfo(bytes(stamp.data))
+        if (info.tag != TPM_TAG_SIGNINFO or info.fixed.tobytes() != b'TSTP'
+                or info.data_len != 52):
+            return None
+        if info.digest.tobytes() != hashlib.sha1(bytes(stamp.root)).digest():
+            return None
+        replay = b'\x00' * 20
+        if nonce:
+            replay = hashlib.sha1(bytes(nonce)).digest()
+        if info.replay.tobytes() != replay:
+            return None
+    except ValueError:
+        return None
+    proof = stamp.proof
+    if not isinstance(proof, merkle.MerkleProof):
+        try:
+            proof = merkle.decode_proof(proof)
+        except ValueError:
+            return None
+    # The prover picks the hash named in the proof, so pin it
+    if proof.hash_name != hash_name:
+        return None
+    if not merkle.verify_proof(record, proof, stamp.root):
+        return None
+    if not pkcs1_verify(hashlib.sha1(bytes(stamp.data)).digest(),
+                        stamp.signature, modulus, exponent):
+        return None
+    return info.ticks
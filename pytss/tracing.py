@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Record libtspi call sessions and replay them without a TPM.
+
+While recording, a call hook writes every wrapped Tspi_ call to a binary
+trace: its name, the values it left in its output parameters, its result
+code and how long it took. ReplayTspi is a drop-in replacement for the cffi
+libtspi module that serves those calls back in order, so a session captured
+once against real hardware can be rerun at full speed, or at its recorded
+pace, to benchmark the Python side reproducibly.
+
+Output parameters are recognised by their C type: pointers to integers and
+handles, BYTE ** buffers whose length is given by the preceding argument,
+arrays of structures returned through a pointer to a pointer, and any field
+of a structure passed by pointer that the call changed. Input buffers are
+not recorded.
+
+Record by calling start_recording() or by setting PYTSS_RECORD to the trace
+path before importing pytss. Replay by setting PYTSS_BACKEND=replay and
+PYTSS_REPLAY to the trace path. Replay is only deterministic if the session
+makes the same calls in the same order, so record sessions from a single
+thread.
+
+A trace is laid out as magic "PTTR" | version (1) followed by records. A
+name record is "D" | name length (2) | name and assigns the next name
+number. A call record is "C" | name number (2) | result (4) |
+duration in ns (8) | argument count (2) | arguments. Each argument is a
+tagged value: "X" for a parameter left untouched, "N" for NULL, "I" | 8
+byte integer, "B" | length (4) | bytes, "S" | field count (2) | fields for
+a structure and "L" | count (4) | values for an array of structures.
+"""
+
+import collections
+import struct
+import threading
+import time
+
+from pytss import tss_constants
+
+MAGIC = b'PTTR'
+VERSION = 1
+
+TraceCall = collections.namedtuple('TraceCall',
+                                   'name result duration args')
+
+# Cleanup calls made by finalizers may run after the recorded session ended
+_CLEANUP = frozenset([
+    'Tspi_Context_Close',
+    'Tspi_Context_CloseObject',
+    'Tspi_Context_FreeMemory',
+    'Tspi_Key_UnloadKey',
+])
+
+_CALL = struct.Struct('!HIQH')
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class ReplayError(Exception):
+    """The session being replayed diverged from the recorded one"""
+
+
+class _Untouched(object):
+    def __repr__(self):
+        return 'UNTOUCHED'
+
+
+UNTOUCHED = _Untouched()
+
+
+def _write_value(out, value):
+    if value is UNTOUCHED:
+        out.append(b'X')
+    elif value is None:
+        out.append(b'N')
+    elif isinstance(value, int):
+        out.append(b'I' + struct.pack('!Q', value))
+    elif isinstance(value, bytes):
+        out.append(b'B' + struct.pack('!I', len(value)) + value)
+    elif isinstance(value, tuple):
+        out.append(b'S' + struct.pack('!H', len(value)))
+        for field in value:
+            _write_value(out, field)
+    elif isinstance(value, list):
+        out.append(b'L' + struct.pack('!I', len(value)))
+        for item in value:
+            _write_value(out, item)
+    else:
+        raise TypeError("Cannot trace %r" % (value,))
+
+
+def _read_exact(src, length):
+    data = src.read(length)
+    if len(data) < length:
+        raise ValueError("Truncated trace")
+    return data
+
+
+def _read_value(src):
+    tag = _read_exact(src, 1)
+    if tag == b'X':
+        return UNTOUCHED
+    if tag == b'N':
+        return None
+    if tag == b'I':
+        return struct.unpack('!Q', _read_exact(src, 8))[0]
+    if tag == b'B':
+        length = struct.unpack('!I', _read_exact(src, 4))[0]
+        return _read_exact(src, length)
+    if tag == b'S':
+        count = struct.unpack('!H', _read_exact(src, 2))[0]
+        return tuple(_read_value(src) for _ in range(count))
+    if tag == b'L':
+        count = struct.unpack('!I', _read_exact(src, 4))[0]
+        return [_read_value(src) for _ in range(count)]
+    raise ValueError("Bad trace value tag %r" % tag)
+
+
+class TraceWriter(object):
+    def __init__(self, dst):
+        """
+        Start a trace
+
+        :param dst: A file-like object opened for binary writing
+        """
+        self.dst = dst
+        self.names = {}
+        self.lock = threading.Lock()
+        dst.write(MAGIC + struct.pack('!B', VERSION))
+
+    def write(self, call):
+        """
+        Append a call to the trace
+
+        :param call: A TraceCall
+        """
+        out = []
+        with self.lock:
+            number = self.names.get(call.name)
+            if number is None:
+                number = self.names[call.name] = len(self.names)
+                name = call.name.encode('ascii')
+                out.append(b'D' + struct.pack('!H', len(name)) + name)
+            out.append(b'C' + _CALL.pack(number, call.result, call.duration,
+                                         len(call.args)))
+            for value in call.args:
+                _write_value(out, value)
+            self.dst.write(b''.join(out))
+
+    def close(self):
+        self.dst.flush()
+
+
+def read_trace(src):
+    """
+    Read a trace written by TraceWriter
+
+    :param src: A file-like object opened for binary reading
+
+    :returns: A generator of TraceCall records
+    """
+    if _read_exact(src, 5) != MAGIC + struct.pack('!B', VERSION):
+        raise ValueError("Not a pytss trace")
+    names = []
+    while True:
+        tag = src.read(1)
+        if not tag:
+            return
+        if tag == b'D':
+            length = struct.unpack('!H', _read_exact(src, 2))[0]
+            names.append(_read_exact(src, length).decode('ascii'))
+        elif tag == b'C':
+            number, result, duration, count = \
+                _CALL.unpack(_read_exact(src, _CALL.size))
+            args = tuple(_read_value(src) for _ in range(count))
+            yield TraceCall(names[number], result, duration, args)
+        else:
+            raise ValueError("Bad trace record tag %r" % tag)
+
+
+def _is_integer(ffi, ctype):
+    return ctype.kind == 'primitive' and ffi.sizeof(ctype) >= 4
+
+
+class Recorder(object):
+    """A call hook writing every Tspi_ call to a TraceWriter"""
+
+    def __init__(self, writer, ffi):
+        self.writer = writer
+        self.ffi = ffi
+
+    def __call__(self, name, call, args):
+        before = [self._snapshot(arg) for arg in args]
+        start = _clock()
+        try:
+            ret = call(*args)
+        except Exception as e:
+            from pytss.interface import result_code
+            result = result_code(e)
+            if result is not None:
+                self._record(name, args, before, result, start)
+            raise
+        self._record(name, args, before, 0, start)
+        return ret
+
+    def _record(self, name, args, before, result, start):
+        duration = int((_clock() - start) * 1e9)
+        values = []
+        previous = None
+        for arg, snapshot in zip(args, before):
+            value = self._encode(arg, snapshot, previous)
+            values.append(value)
+            previous = value if isinstance(value, int) else None
+        self.writer.write(TraceCall(name, result, duration, tuple(values)))
+
+    def _snapshot(self, arg):
+        ffi = self.ffi
+        if not isinstance(arg, ffi.CData):
+            return None
+        ctype = ffi.typeof(arg)
+        if (ctype.kind == 'pointer' and ctype.item.kind == 'struct' and
+                arg != ffi.NULL):
+            return ffi.buffer(arg, ffi.sizeof(ctype.item))[:]
+        return None
+
+    def _encode(self, arg, snapshot, previous):
+        ffi = self.ffi
+        if isinstance(arg, int):
+            return arg
+        if not isinstance(arg, ffi.CData):
+            return UNTOUCHED
+        ctype = ffi.typeof(arg)
+        if ctype.kind != 'pointer':
+            return UNTOUCHED
+        if arg == ffi.NULL:
+            return None
+        item = ctype.item
+        if _is_integer(ffi, item):
+            return int(arg[0])
+        if item.kind == 'struct':
+            return self._encode_struct(arg[0], snapshot)
+        if item.kind == 'pointer' and previous is not None:
+            if arg[0] == ffi.NULL:
+                return None
+            if item.item.kind == 'primitive':
+                return ffi.buffer(arg[0], previous * ffi.sizeof(item.item))[:]
+            if item.item.kind == 'struct':
+                return [self._encode_struct(arg[0][i], None)
+                        for i in range(previous)]
+        return UNTOUCHED
+
+    def _encode_struct(self, value, snapshot):
+        """Encode the fields of a structure that differ from snapshot"""
+        ffi = self.ffi
+        if snapshot is not None:
+            current = ffi.buffer(ffi.addressof(value))[:]
+        fields = []
+        previous = None
+        for name, field in ffi.typeof(value).fields:
+            ftype = field.type
+            member = getattr(value, name)
+            size = ffi.sizeof(ftype)
+            if (snapshot is not None and
+                    current[field.offset:field.offset + size] ==
+                    snapshot[field.offset:field.offset + size]):
+                encoded = UNTOUCHED
+            elif ftype.kind == 'primitive':
+                encoded = int(member)
+            elif ftype.kind == 'array':
+                encoded = ffi.buffer(member)[:]
+            elif ftype.kind == 'struct':
+                encoded = self._encode_struct(member, None)
+            elif (ftype.kind == 'pointer' and
+                  ftype.item.kind == 'primitive'):
+                if member == ffi.NULL:
+                    encoded = None
+                else:
+                    encoded = ffi.buffer(member, (previous or 0) *
+                                         ffi.sizeof(ftype.item))[:]
+            else:
+                encoded = UNTOUCHED
+            fields.append(encoded)
+            previous = int(member) if ftype.kind == 'primitive' else None
+        return tuple(fields)
+
+
+_recording = None
+
+
+def start_recording(path):
+    """
+    Start writing every Tspi_ call to a trace file
+
+    :param path: The path of the trace file, which is overwritten
+    """
+    global _recording
+    from pytss.interface import add_call_hook, ffi
+    if _recording is not None:
+        raise RuntimeError("Already recording")
+    writer = TraceWriter(open(path, 'wb'))
+    _recording = Recorder(writer, ffi)
+    add_call_hook(_recording)
+
+
+def stop_recording():
+    """Stop recording and close the trace file"""
+    global _recording
+    from pytss.interface import remove_call_hook
+    if _recording is not None:
+        remove_call_hook(_recording)
+        _recording.writer.close()
+        _recording.writer.dst.close()
+        _recording = None
+
+
+def is_recording():
+    return _recording is not None
+
+
+class ReplayTspi(object):
+    """A drop-in replacement for the cffi libtspi module replaying a trace"""
+
+    def __init__(self, ffi, trace, realtime=False):
+        """
+        :param ffi: The FFI instance the caller allocates buffers with
+        :param trace: The path of a trace file, or a sequence of TraceCall
+        :param realtime: Take as long over each call as the recorded one did
+        """
+        for name in dir(tss_constants):
+            if name.startswith(('TPM_', 'TSS_')):
+                setattr(self, name, getattr(tss_constants, name))
+        self.ffi = ffi
+        if isinstance(trace, str):
+            with open(trace, 'rb') as src:
+                trace = list(read_trace(src))
+        self.calls = list(trace)
+        self.realtime = realtime
+        self.lock = threading.Lock()
+        self.memory = {}
+        self.position = 0
+
+    def rewind(self):
+        """Start replaying from the beginning of the trace again"""
+        with self.lock:
+            self.position = 0
+            self.memory.clear()
+
+    @property
+    def finished(self):
+        return self.position >= len(self.calls)
+
+    def __getattr__(self, name):
+        if not name.startswith('Tspi_'):
+            raise AttributeError(name)
+
+        def replay(*args):
+            return self._replay(name, args)
+        replay.__name__ = name
+        return replay
+
+    def _replay(self, name, args):
+        with self.lock:
+            if self.position >= len(self.calls):
+                if name in _CLEANUP:
+                    return tss_constants.TSS_SUCCESS
+                raise ReplayError("%s called after the end of the trace" %
+                                  name)
+            call = self.calls[self.position]
+            if call.name != name:
+                raise ReplayError("Call %d is %s, expected %s" %
+                                  (self.position, name, call.name))
+            self.position += 1
+            if name == 'Tspi_Context_FreeMemory':
+                self._free(args[1])
+            for arg, value in zip(args, call.args):
+                self._apply(arg, value)
+        if self.realtime:
+            time.sleep(call.duration / 1e9)
+        return call.result
+
+    def _free(self, pointer):
+        ffi = self.ffi
+        if pointer == ffi.NULL:
+            self.memory.clear()
+        else:
+            self.memory.pop(int(ffi.cast('uintptr_t', pointer)), None)
+
+    def _alloc(self, ctype, init):
+        buf = self.ffi.new(ctype, init)
+        self.memory[int(self.ffi.cast('uintptr_t', buf))] = buf
+        return buf
+
+    def _apply(self, arg, value):
+        ffi = self.ffi
+        if value is UNTOUCHED or not isinstance(arg, ffi.CData):
+            return
+        ctype = ffi.typeof(arg)
+        if ctype.kind != 'pointer' or arg == ffi.NULL:
+            return
+        item = ctype.item
+        if _is_integer(ffi, item):
+            arg[0] = value
+        elif item.kind == 'struct':
+            self._apply_struct(arg[0], value)
+        elif value is None:
+            arg[0] = ffi.NULL
+        elif isinstance(value, bytes):
+            arg[0] = self._alloc(ffi.getctype(item.item, '[]'), value)
+        elif isinstance(value, list):
+            array = self._alloc(ffi.getctype(item.item, '[]'), len(value))
+            for i, fields in enumerate(value):
+                self._apply_struct(array[i], fields)
+            arg[0] = array
+
+    def _apply_struct(self, target, fields):
+        ffi = self.ffi
+        if fields is UNTOUCHED:
+            return
+        for (name, field), value in zip(ffi.typeof(target).fields, fields):
+            ftype = field.type
+            if value is UNTOUCHED:
+                continue
+            if ftype.kind == 'primitive':
+                setattr(target, name, value)
+            elif ftype.kind == 'array':
+                ffi.memmove(getattr(target, name), value, len(value))
+            elif ftype.kind == 'struct':
+                self._apply_struct(getattr(target, name), value)
+            elif value is None:
+                setattr(target, name, ffi.NULL)
+            else:
+                setattr(target, name,
+                        self._alloc(ffi.getctype(ftype.item, '[]'), value))
@@ -0,0 +1,643 @@
+#!/usr/bin/env python3
+"""
+Values of the TSS 1.2 and TPM 1.2 constants used by pytss, as defined in
+the TrouSerS headers. Backends that are not compiled against libtspi, such
+as the software TPM, provide these in place of the values cffi extracts
+from <trousers/tss.h>.
+"""
+
+# Error layers
+TSS_LAYER_TPM = 0x0000
+TSS_LAYER_TDDL = 0x1000
+TSS_LAYER_TCS = 0x2000
+TSS_LAYER_TSP = 0x3000
+
+TSS_SUCCESS = 0x0
+
+# TSS errors, common to all layers
+TSS_E_BASE = 0x0
+TSS_E_FAIL = TSS_E_BASE + 0x002
+TSS_E_BAD_PARAMETER = TSS_E_BASE + 0x003
+TSS_E_INTERNAL_ERROR = TSS_E_BASE + 0x004
+TSS_E_OUTOFMEMORY = TSS_E_BASE + 0x005
+TSS_E_NOTIMPL = TSS_E_BASE + 0x006
+TSS_E_KEY_ALREADY_REGISTERED = TSS_E_BASE + 0x008
+TSS_E_TPM_UNEXPECTED = TSS_E_BASE + 0x010
+TSS_E_COMM_FAILURE = TSS_E_BASE + 0x011
+TSS_E_TIMEOUT = TSS_E_BASE + 0x012
+TSS_E_TPM_UNSUPPORTED_FEATURE = TSS_E_BASE + 0x014
+TSS_E_CANCELED = TSS_E_BASE + 0x016
+TSS_E_PS_KEY_NOTFOUND = TSS_E_BASE + 0x020
+TSS_E_PS_KEY_EXISTS = TSS_E_BASE + 0x021
+TSS_E_PS_BAD_KEY_STATE = TSS_E_BASE + 0x022
+
+# TSS errors, TSP layer
+TSS_E_INVALID_OBJECT_TYPE = TSS_E_BASE + 0x101
+TSS_E_NO_CONNECTION = TSS_E_BASE + 0x102
+TSS_E_CONNECTION_FAILED = TSS_E_BASE + 0x103
+TSS_E_CONNECTION_BROKEN = TSS_E_BASE + 0x104
+TSS_E_HASH_INVALID_ALG = TSS_E_BASE + 0x105
+TSS_E_HASH_INVALID_LENGTH = TSS_E_BASE + 0x106
+TSS_E_HASH_NO_DATA = TSS_E_BASE + 0x107
+TSS_E_INVALID_ATTRIB_FLAG = TSS_E_BASE + 0x109
+TSS_E_INVALID_ATTRIB_SUBFLAG = TSS_E_BASE + 0x10A
+TSS_E_INVALID_ATTRIB_DATA = TSS_E_BASE + 0x10B
+TSS_E_INVALID_OBJECT_INITFLAG = TSS_E_BASE + 0x10D
+TSS_E_NO_PCRS_SET = TSS_E_BASE + 0x10F
+TSS_E_KEY_NOT_LOADED = TSS_E_BASE + 0x110
+TSS_E_KEY_NOT_SET = TSS_E_BASE + 0x111
+TSS_E_VALIDATION_FAILED = TSS_E_BASE + 0x112
+TSS_E_TSP_AUTHREQUIRED = TSS_E_BASE + 0x113
+TSS_E_TSP_AUTH2REQUIRED = TSS_E_BASE + 0x114
+TSS_E_TSP_AUTHFAIL = TSS_E_BASE + 0x115
+TSS_E_TSP_AUTH2FAIL = TSS_E_BASE + 0x116
+TSS_E_KEY_NO_MIGRATION_POLICY = TSS_E_BASE + 0x117
+TSS_E_POLICY_NO_SECRET = TSS_E_BASE + 0x118
+TSS_E_INVALID_OBJ_ACCESS = TSS_E_BASE + 0x119
+TSS_E_INVALID_ENCSCHEME = TSS_E_BASE + 0x11A
+TSS_E_INVALID_SIGSCHEME = TSS_E_BASE + 0x11B
+TSS_E_ENC_INVALID_LENGTH = TSS_E_BASE + 0x11C
+TSS_E_ENC_NO_DATA = TSS_E_BASE + 0x11D
+TSS_E_ENC_INVALID_TYPE = TSS_E_BASE + 0x11E
+TSS_E_INVALID_KEYUSAGE = TSS_E_BASE + 0x11F
+TSS_E_VERIFICATION_FAILED = TSS_E_BASE + 0x120
+TSS_E_HASH_NO_IDENTIFIER = TSS_E_BASE + 0x121
+TSS_E_INVALID_HANDLE = TSS_E_BASE + 0x122
+TSS_E_SILENT_CONTEXT = TSS_E_BASE + 0x123
+TSS_E_EK_CHECKSUM = TSS_E_BASE + 0x124
+TSS_E_DELEGATION_NOTSET = TSS_E_BASE + 0x125
+TSS_E_DELFAMILY_NOTFOUND = TSS_E_BASE + 0x126
+TSS_E_DELFAMILY_ROWEXISTS = TSS_E_BASE + 0x127
+TSS_E_VERSION_MISMATCH = TSS_E_BASE + 0x128
+TSS_E_DAA_AR_DECRYPTION_ERROR = TSS_E_BASE + 0x129
+TSS_E_DAA_AUTHENTICATION_ERROR = TSS_E_BASE + 0x12A
+TSS_E_DAA_CHALLENGE_RESPONSE_ERROR = TSS_E_BASE + 0x12B
+TSS_E_DAA_CREDENTIAL_PROOF_ERROR = TSS_E_BASE + 0x12C
+TSS_E_DAA_CREDENTIAL_REQUEST_PROOF_ERROR = TSS_E_BASE + 0x12D
+TSS_E_DAA_ISSUER_KEY_ERROR = TSS_E_BASE + 0x12E
+TSS_E_DAA_PSEUDONYM_ERROR = TSS_E_BASE + 0x12F
+TSS_E_INVALID_RESOURCE = TSS_E_BASE + 0x130
+TSS_E_NV_AREA_EXIST = TSS_E_BASE + 0x131
+TSS_E_NV_AREA_NOT_EXIST = TSS_E_BASE + 0x132
+TSS_E_TSP_TRANS_AUTHFAIL = TSS_E_BASE + 0x133
+TSS_E_TSP_TRANS_AUTHREQUIRED = TSS_E_BASE + 0x134
+TSS_E_TSP_TRANS_NOTEXCLUSIVE = TSS_E_BASE + 0x135
+TSS_E_TSP_TRANS_FAIL = TSS_E_BASE + 0x136
+TSS_E_TSP_TRANS_NO_PUBKEY = TSS_E_BASE + 0x137
+TSS_E_NO_ACTIVE_COUNTER = TSS_E_BASE + 0x138
+
+# TPM errors
+TPM_E_BASE = 0x0
+TPM_E_NON_FATAL = 0x800
+TPM_E_AUTHFAIL = TPM_E_BASE + 1
+TPM_E_BADINDEX = TPM_E_BASE + 2
+TPM_E_BAD_PARAMETER = TPM_E_BASE + 3
+TPM_E_AUDITFAILURE = TPM_E_BASE + 4
+TPM_E_CLEAR_DISABLED = TPM_E_BASE + 5
+TPM_E_DEACTIVATED = TPM_E_BASE + 6
+TPM_E_DISABLED = TPM_E_BASE + 7
+TPM_E_DISABLED_CMD = TPM_E_BASE + 8
+TPM_E_FAIL = TPM_E_BASE + 9
+TPM_E_BAD_ORDINAL = TPM_E_BASE + 10
+TPM_E_INSTALL_DISABLED = TPM_E_BASE + 11
+TPM_E_INVALID_KEYHANDLE = TPM_E_BASE + 12
+TPM_E_KEYNOTFOUND = TPM_E_BASE + 13
+TPM_E_INAPPROPRIATE_ENC = TPM_E_BASE + 14
+TPM_E_MIGRATEFAIL = TPM_E_BASE + 15
+TPM_E_INVALID_PCR_INFO = TPM_E_BASE + 16
+TPM_E_NOSPACE = TPM_E_BASE + 17
+TPM_E_NOSRK = TPM_E_BASE + 18
+TPM_E_NOTSEALED_BLOB = TPM_E_BASE + 19
+TPM_E_OWNER_SET = TPM_E_BASE + 20
+TPM_E_RESOURCES = TPM_E_BASE + 21
+TPM_E_SHORTRANDOM = TPM_E_BASE + 22
+TPM_E_SIZE = TPM_E_BASE + 23
+TPM_E_WRONGPCRVAL = TPM_E_BASE + 24
+TPM_E_BAD_PARAM_SIZE = TPM_E_BASE + 25
+TPM_E_SHA_THREAD = TPM_E_BASE + 26
+TPM_E_SHA_ERROR = TPM_E_BASE + 27
+TPM_E_FAILEDSELFTEST = TPM_E_BASE + 28
+TPM_E_AUTH2FAIL = TPM_E_BASE + 29
+TPM_E_BADTAG = TPM_E_BASE + 30
+TPM_E_IOERROR = TPM_E_BASE + 31
+TPM_E_ENCRYPT_ERROR = TPM_E_BASE + 32
+TPM_E_DECRYPT_ERROR = TPM_E_BASE + 33
+TPM_E_INVALID_AUTHHANDLE = TPM_E_BASE + 34
+TPM_E_NO_ENDORSEMENT = TPM_E_BASE + 35
+TPM_E_INVALID_KEYUSAGE = TPM_E_BASE + 36
+TPM_E_WRONG_ENTITYTYPE = TPM_E_BASE + 37
+TPM_E_INVALID_POSTINIT = TPM_E_BASE + 38
+TPM_E_INAPPROPRIATE_SIG = TPM_E_BASE + 39
+TPM_E_BAD_KEY_PROPERTY = TPM_E_BASE + 40
+TPM_E_BAD_MIGRATION = TPM_E_BASE + 41
+TPM_E_BAD_SCHEME = TPM_E_BASE + 42
+TPM_E_BAD_DATASIZE = TPM_E_BASE + 43
+TPM_E_BAD_MODE = TPM_E_BASE + 44
+TPM_E_BAD_PRESENCE = TPM_E_BASE + 45
+TPM_E_BAD_VERSION = TPM_E_BASE + 46
+TPM_E_NO_WRAP_TRANSPORT = TPM_E_BASE + 47
+TPM_E_AUDITFAIL_UNSUCCESSFUL = TPM_E_BASE + 48
+TPM_E_AUDITFAIL_SUCCESSFUL = TPM_E_BASE + 49
+TPM_E_NOTRESETABLE = TPM_E_BASE + 50
+TPM_E_NOTLOCAL = TPM_E_BASE + 51
+TPM_E_BAD_TYPE = TPM_E_BASE + 52
+TPM_E_INVALID_RESOURCE = TPM_E_BASE + 53
+TPM_E_NOTFIPS = TPM_E_BASE + 54
+TPM_E_INVALID_FAMILY = TPM_E_BASE + 55
+TPM_E_NO_NV_PERMISSION = TPM_E_BASE + 56
+TPM_E_REQUIRES_SIGN = TPM_E_BASE + 57
+TPM_E_KEY_NOTSUPPORTED = TPM_E_BASE + 58
+TPM_E_AUTH_CONFLICT = TPM_E_BASE + 59
+TPM_E_AREA_LOCKED = TPM_E_BASE + 60
+TPM_E_BAD_LOCALITY = TPM_E_BASE + 61
+TPM_E_READ_ONLY = TPM_E_BASE + 62
+TPM_E_PER_NOWRITE = TPM_E_BASE + 63
+TPM_E_FAMILYCOUNT = TPM_E_BASE + 64
+TPM_E_WRITE_LOCKED = TPM_E_BASE + 65
+TPM_E_BAD_ATTRIBUTES = TPM_E_BASE + 66
+TPM_E_INVALID_STRUCTURE = TPM_E_BASE + 67
+TPM_E_KEY_OWNER_CONTROL = TPM_E_BASE + 68
+TPM_E_BAD_COUNTER = TPM_E_BASE + 69
+TPM_E_NOT_FULLWRITE = TPM_E_BASE + 70
+TPM_E_CONTEXT_GAP = TPM_E_BASE + 71
+TPM_E_MAXNVWRITES = TPM_E_BASE + 72
+TPM_E_NOOPERATOR = TPM_E_BASE + 73
+TPM_E_RESOURCEMISSING = TPM_E_BASE + 74
+TPM_E_DELEGATE_LOCK = TPM_E_BASE + 75
+TPM_E_DELEGATE_FAMILY = TPM_E_BASE + 76
+TPM_E_DELEGATE_ADMIN = TPM_E_BASE + 77
+TPM_E_TRANSPORT_NOTEXCLUSIVE = TPM_E_BASE + 78
+TPM_E_OWNER_CONTROL = TPM_E_BASE + 79
+TPM_E_DAA_RESOURCES = TPM_E_BASE + 80
+TPM_E_DAA_INPUT_DATA0 = TPM_E_BASE + 81
+TPM_E_DAA_INPUT_DATA1 = TPM_E_BASE + 82
+TPM_E_DAA_ISSUER_SETTINGS = TPM_E_BASE + 83
+TPM_E_DAA_TPM_SETTINGS = TPM_E_BASE + 84
+TPM_E_DAA_STAGE = TPM_E_BASE + 85
+TPM_E_DAA_ISSUER_VALIDITY = TPM_E_BASE + 86
+TPM_E_DAA_WRONG_W = TPM_E_BASE + 87
+TPM_E_BAD_HANDLE = TPM_E_BASE + 88
+TPM_E_BAD_DELEGATE = TPM_E_BASE + 89
+TPM_E_BADCONTEXT = TPM_E_BASE + 90
+TPM_E_TOOMANYCONTEXTS = TPM_E_BASE + 91
+TPM_E_MA_TICKET_SIGNATURE = TPM_E_BASE + 92
+TPM_E_MA_DESTINATION = TPM_E_BASE + 93
+TPM_E_MA_SOURCE = TPM_E_BASE + 94
+TPM_E_MA_AUTHORITY = TPM_E_BASE + 95
+TPM_E_PERMANENTEK = TPM_E_BASE + 97
+TPM_E_BAD_SIGNATURE = TPM_E_BASE + 98
+TPM_E_NOCONTEXTSPACE = TPM_E_BASE + 99
+TPM_E_RETRY = TPM_E_BASE + TPM_E_NON_FATAL
+TPM_E_NEEDS_SELFTEST = TPM_E_BASE + TPM_E_NON_FATAL + 1
+TPM_E_DOING_SELFTEST = TPM_E_BASE + TPM_E_NON_FATAL + 2
+TPM_E_DEFEND_LOCK_RUNNING = TPM_E_BASE + TPM_E_NON_FATAL + 3
+
+# Object types
+TSS_OBJECT_TYPE_POLICY = 0x01
+TSS_OBJECT_TYPE_RSAKEY = 0x02
+TSS_OBJECT_TYPE_ENCDATA = 0x03
+TSS_OBJECT_TYPE_PCRS = 0x04
+TSS_OBJECT_TYPE_HASH = 0x05
+TSS_OBJECT_TYPE_DELFAMILY = 0x06
+TSS_OBJECT_TYPE_NV = 0x07
+TSS_OBJECT_TYPE_MIGDATA = 0x08
+TSS_OBJECT_TYPE_DAA_CERTIFICATE = 0x09
+TSS_OBJECT_TYPE_DAA_ISSUER_KEY = 0x0a
+TSS_OBJECT_TYPE_DAA_ARA_KEY = 0x0b
+
+# Key init flags
+TSS_KEY_NO_AUTHORIZATION = 0x00000000
+TSS_KEY_AUTHORIZATION = 0x00000001
+TSS_KEY_AUTHORIZATION_PRIV_USE_ONLY = 0x00000002
+TSS_KEY_NON_VOLATILE = 0x00000000
+TSS_KEY_VOLATILE = 0x00000004
+TSS_KEY_NOT_MIGRATABLE = 0x00000000
+TSS_KEY_MIGRATABLE = 0x00000008
+TSS_KEY_TYPE_DEFAULT = 0x00000000
+TSS_KEY_TYPE_SIGNING = 0x00000010
+TSS_KEY_TYPE_STORAGE = 0x00000020
+TSS_KEY_TYPE_IDENTITY = 0x00000030
+TSS_KEY_TYPE_AUTHCHANGE = 0x00000040
+TSS_KEY_TYPE_BIND = 0x00000050
+TSS_KEY_TYPE_LEGACY = 0x00000060
+TSS_KEY_TYPE_MIGRATE = 0x00000070
+TSS_KEY_TYPE_BITMASK = 0x000000F0
+TSS_KEY_SIZE_DEFAULT = 0x00000000
+TSS_KEY_SIZE_512 = 0x00000100
+TSS_KEY_SIZE_1024 = 0x00000200
+TSS_KEY_SIZE_2048 = 0x00000300
+TSS_KEY_SIZE_4096 = 0x00000400
+TSS_KEY_SIZE_8192 = 0x00000500
+TSS_KEY_SIZE_16384 = 0x00000600
+TSS_KEY_SIZE_BITMASK = 0x00000F00
+TSS_KEY_NOT_CERTIFIED_MIGRATABLE = 0x00000000
+TSS_KEY_CERTIFIED_MIGRATABLE = 0x00001000
+TSS_KEY_STRUCT_DEFAULT = 0x00000000
+TSS_KEY_STRUCT_KEY = 0x00004000
+TSS_KEY_STRUCT_KEY12 = 0x00008000
+TSS_KEY_STRUCT_BITMASK = 0x0001C000
+TSS_KEY_EMPTY_KEY = 0x00000000
+TSS_KEY_TSP_SRK = 0x04000000
+TSS_KEY_TEMPLATE_BITMASK = 0xFC000000
+
+TSS_KEY_SIZEVAL_512BIT = 0x0200
+TSS_KEY_SIZEVAL_1024BIT = 0x0400
+TSS_KEY_SIZEVAL_2048BIT = 0x0800
+TSS_KEY_SIZEVAL_4096BIT = 0x1000
+TSS_KEY_SIZEVAL_8192BIT = 0x2000
+TSS_KEY_SIZEVAL_16384BIT = 0x4000
+
+# Other object init flags
+TSS_ENCDATA_SEAL = 0x00000001
+TSS_ENCDATA_BIND = 0x00000002
+TSS_ENCDATA_LEGACY = 0x00000003
+
+TSS_HASH_DEFAULT = 0x00000000
+TSS_HASH_SHA1 = 0x00000001
+TSS_HASH_OTHER = 0xFFFFFFFF
+
+TSS_POLICY_USAGE = 0x00000001
+TSS_POLICY_MIGRATION = 0x00000002
+TSS_POLICY_OPERATOR = 0x00000003
+
+TSS_PCRS_STRUCT_DEFAULT = 0x00000000
+TSS_PCRS_STRUCT_INFO = 0x00000001
+TSS_PCRS_STRUCT_INFO_LONG = 0x00000002
+TSS_PCRS_STRUCT_INFO_SHORT = 0x00000003
+TSS_PCRS_DIRECTION_CREATION = 1
+TSS_PCRS_DIRECTION_RELEASE = 2
+
+# Secrets and persistent storage
+TSS_SECRET_MODE_NONE = 0x00000800
+TSS_SECRET_MODE_SHA1 = 0x00001000
+TSS_SECRET_MODE_PLAIN = 0x00001800
+TSS_SECRET_MODE_POPUP = 0x00002000
+TSS_SECRET_MODE_CALLBACK = 0x00002800
+
+TSS_SECRET_LIFETIME_ALWAYS = 0x00000001
+TSS_SECRET_LIFETIME_COUNTER = 0x00000002
+TSS_SECRET_LIFETIME_TIMER = 0x00000003
+
+TSS_PS_TYPE_USER = 1
+TSS_PS_TYPE_SYSTEM = 2
+
+# Context attributes
+TSS_TSPATTRIB_CONTEXT_SILENT_MODE = 0x00000001
+TSS_TSPATTRIB_CONTEXT_MACHINE_NAME = 0x00000002
+TSS_TSPATTRIB_CONTEXT_VERSION_MODE = 0x00000003
+TSS_TSPATTRIB_CONTEXT_TRANSPORT = 0x00000004
+TSS_TSPATTRIB_CONTEXT_CONNECTION_VERSION = 0x00000005
+TSS_TSPATTRIB_SECRET_HASH_MODE = 0x00000006
+TSS_TSPATTRIB_CONTEXTTRANS_CONTROL = 0x00000010
+TSS_TSPATTRIB_CONTEXTTRANS_MODE = 0x00000020
+TSS_TSPATTRIB_CONTEXT_NOT_SILENT = 0x00000000
+TSS_TSPATTRIB_CONTEXT_SILENT = 0x00000001
+TSS_TSPATTRIB_CONTEXT_VERSION_AUTO = 0x00000001
+TSS_TSPATTRIB_CONTEXT_VERSION_V1_1 = 0x00000002
+TSS_TSPATTRIB_CONTEXT_VERSION_V1_2 = 0x00000003
+TSS_TSPATTRIB_DISABLE_TRANSPORT = 0x00000016
+TSS_TSPATTRIB_ENABLE_TRANSPORT = 0x00000032
+TSS_TSPATTRIB_TRANSPORT_NO_DEFAULT_ENCRYPTION = 0x00000000
+TSS_TSPATTRIB_TRANSPORT_DEFAULT_ENCRYPTION = 0x00000001
+TSS_TSPATTRIB_TRANSPORT_AUTHENTIC_CHANNEL = 0x00000002
+TSS_TSPATTRIB_TRANSPORT_EXCLUSIVE = 0x00000004
+TSS_TSPATTRIB_TRANSPORT_STATIC_AUTH = 0x00000008
+TSS_TSPATTRIB_SECRET_HASH_MODE_POPUP = 0x00000001
+TSS_TSPATTRIB_HASH_MODE_NOT_NULL = 0x00000000
+TSS_TSPATTRIB_HASH_MODE_NULL = 0x00000001
+
+# TPM attributes
+TSS_TSPATTRIB_TPM_CALLBACK_COLLATEIDENTITY = 0x00000001
+TSS_TSPATTRIB_TPM_CALLBACK_ACTIVATEIDENTITY = 0x00000002
+TSS_TSPATTRIB_TPM_ORDINAL_AUDIT_STATUS = 0x00000003
+TSS_TSPATTRIB_TPM_CREDENTIAL = 0x00001000
+
+# Policy attributes
+TSS_TSPATTRIB_POLICY_CALLBACK_HMAC = 0x00000080
+TSS_TSPATTRIB_POLICY_CALLBACK_XOR_ENC = 0x00000100
+TSS_TSPATTRIB_POLICY_CALLBACK_TAKEOWNERSHIP = 0x00000180
+TSS_TSPATTRIB_POLICY_CALLBACK_CHANGEAUTHASYM = 0x00000200
+TSS_TSPATTRIB_POLICY_SECRET_LIFETIME = 0x00000280
+TSS_TSPATTRIB_POLICY_POPUPSTRING = 0x00000300
+TSS_TSPATTRIB_POLICY_CALLBACK_SEALX_MASK = 0x00000380
+TSS_TSPATTRIB_POLICY_DELEGATION_INFO = 0x00000001
+TSS_TSPATTRIB_POLICY_DELEGATION_PCR = 0x00000002
+TSS_TSPATTRIB_POLSECRET_LIFETIME_ALWAYS = 0x00000001
+TSS_TSPATTRIB_POLSECRET_LIFETIME_COUNTER = 0x00000002
+TSS_TSPATTRIB_POLSECRET_LIFETIME_TIMER = 0x00000003
+TSS_TSPATTRIB_POLICYSECRET_LIFETIME_ALWAYS = \
+    TSS_TSPATTRIB_POLSECRET_LIFETIME_ALWAYS
+TSS_TSPATTRIB_POLICYSECRET_LIFETIME_COUNTER = \
+    TSS_TSPATTRIB_POLSECRET_LIFETIME_COUNTER
+TSS_TSPATTRIB_POLICYSECRET_LIFETIME_TIMER = \
+    TSS_TSPATTRIB_POLSECRET_LIFETIME_TIMER
+TSS_TSPATTRIB_POLDEL_TYPE = 0x00000001
+TSS_TSPATTRIB_POLDEL_INDEX = 0x00000002
+TSS_TSPATTRIB_POLDEL_PER1 = 0x00000003
+TSS_TSPATTRIB_POLDEL_PER2 = 0x00000004
+TSS_TSPATTRIB_POLDEL_LABEL = 0x00000005
+TSS_TSPATTRIB_POLDEL_FAMILYID = 0x00000006
+TSS_TSPATTRIB_POLDEL_VERCOUNT = 0x00000007
+TSS_TSPATTRIB_POLDEL_OWNERBLOB = 0x00000008
+TSS_TSPATTRIB_POLDEL_KEYBLOB = 0x00000009
+TSS_TSPATTRIB_POLDELPCR_LOCALITY = 0x00000001
+TSS_TSPATTRIB_POLDELPCR_DIGESTATRELEASE = 0x00000002
+TSS_TSPATTRIB_POLDELPCR_SELECTION = 0x00000003
+
+# Key attributes
+TSS_TSPATTRIB_KEY_BLOB = 0x00000040
+TSS_TSPATTRIB_KEY_INFO = 0x00000080
+TSS_TSPATTRIB_KEY_UUID = 0x000000C0
+TSS_TSPATTRIB_KEY_PCR = 0x00000100
+TSS_TSPATTRIB_RSAKEY_INFO = 0x00000140
+TSS_TSPATTRIB_KEY_REGISTER = 0x00000180
+TSS_TSPATTRIB_KEY_PCR_LONG = 0x000001c0
+TSS_TSPATTRIB_KEY_CONTROLBIT = 0x00000200
+TSS_TSPATTRIB_KEY_CMKINFO = 0x00000400
+TSS_TSPATTRIB_KEYBLOB_BLOB = 0x00000008
+TSS_TSPATTRIB_KEYBLOB_PUBLIC_KEY = 0x00000010
+TSS_TSPATTRIB_KEYBLOB_PRIVATE_KEY = 0x00000028
+TSS_TSPATTRIB_KEYINFO_SIZE = 0x00000080
+TSS_TSPATTRIB_KEYINFO_USAGE = 0x00000100
+TSS_TSPATTRIB_KEYINFO_KEYFLAGS = 0x00000180
+TSS_TSPATTRIB_KEYINFO_AUTHUSAGE = 0x00000200
+TSS_TSPATTRIB_KEYINFO_ALGORITHM = 0x00000280
+TSS_TSPATTRIB_KEYINFO_SIGSCHEME = 0x00000300
+TSS_TSPATTRIB_KEYINFO_ENCSCHEME = 0x00000380
+TSS_TSPATTRIB_KEYINFO_MIGRATABLE = 0x00000400
+TSS_TSPATTRIB_KEYINFO_REDIRECTED = 0x00000480
+TSS_TSPATTRIB_KEYINFO_VOLATILE = 0x00000500
+TSS_TSPATTRIB_KEYINFO_AUTHDATAUSAGE = 0x00000580
+TSS_TSPATTRIB_KEYINFO_VERSION = 0x00000600
+TSS_TSPATTRIB_KEYINFO_CMK = 0x00000680
+TSS_TSPATTRIB_KEYINFO_KEYSTRUCT = 0x00000700
+TSS_TSPATTRIB_KEYCONTROL_OWNEREVICT = 0x00000780
+TSS_TSPATTRIB_KEYINFO_RSA_EXPONENT = 0x00001000
+TSS_TSPATTRIB_KEYINFO_RSA_MODULUS = 0x00002000
+TSS_TSPATTRIB_KEYINFO_RSA_KEYSIZE = 0x00003000
+TSS_TSPATTRIB_KEYINFO_RSA_PRIMES = 0x00004000
+TSS_TSPATTRIB_KEYPCR_DIGEST_ATCREATION = 0x00008000
+TSS_TSPATTRIB_KEYPCR_DIGEST_ATRELEASE = 0x00010000
+TSS_TSPATTRIB_KEYPCR_SELECTION = 0x00018000
+TSS_TSPATTRIB_KEYREGISTER_USER = 0x02000000
+TSS_TSPATTRIB_KEYREGISTER_SYSTEM = 0x04000000
+TSS_TSPATTRIB_KEYREGISTER_NO = 0x06000000
+TSS_TSPATTRIB_KEYPCRLONG_LOCALITY_ATCREATION = 0x00040000
+TSS_TSPATTRIB_KEYPCRLONG_LOCALITY_ATRELEASE = 0x00080000
+TSS_TSPATTRIB_KEYPCRLONG_CREATION_SELECTION = 0x000C0000
+TSS_TSPATTRIB_KEYPCRLONG_RELEASE_SELECTION = 0x00100000
+TSS_TSPATTRIB_KEYPCRLONG_DIGEST_ATCREATION = 0x00140000
+TSS_TSPATTRIB_KEYPCRLONG_DIGEST_ATRELEASE = 0x00180000
+TSS_TSPATTRIB_KEYINFO_CMK_MA_APPROVAL = 0x00000010
+TSS_TSPATTRIB_KEYINFO_CMK_MA_DIGEST = 0x00000020
+
+# Encrypted data attributes
+TSS_TSPATTRIB_ENCDATA_BLOB = 0x00000008
+TSS_TSPATTRIB_ENCDATA_PCR = 0x00000010
+TSS_TSPATTRIB_ENCDATA_PCR_LONG = 0x00000018
+TSS_TSPATTRIB_ENCDATA_SEAL = 0x00000020
+TSS_TSPATTRIB_ENCDATABLOB_BLOB = 0x00000001
+TSS_TSPATTRIB_ENCDATAPCR_DIGEST_ATCREATION = 0x00000002
+TSS_TSPATTRIB_ENCDATAPCR_DIGEST_ATRELEASE = 0x00000003
+TSS_TSPATTRIB_ENCDATAPCR_SELECTION = 0x00000004
+TSS_TSPATTRIB_ENCDATAPCR_DIGEST_RELEASE = \
+    TSS_TSPATTRIB_ENCDATAPCR_DIGEST_ATRELEASE
+TSS_TSPATTRIB_ENCDATAPCRLONG_LOCALITY_ATCREATION = 0x00000005
+TSS_TSPATTRIB_ENCDATAPCRLONG_LOCALITY_ATRELEASE = 0x00000006
+TSS_TSPATTRIB_ENCDATAPCRLONG_CREATION_SELECTION = 0x00000007
+TSS_TSPATTRIB_ENCDATAPCRLONG_RELEASE_SELECTION = 0x00000008
+TSS_TSPATTRIB_ENCDATAPCRLONG_DIGEST_ATCREATION = 0x00000009
+TSS_TSPATTRIB_ENCDATAPCRLONG_DIGEST_ATRELEASE = 0x0000000A
+TSS_TSPATTRIB_ENCDATASEAL_PROTECT_MODE = 0x00000001
+TSS_TSPATTRIB_ENCDATASEAL_NO_PROTECT = 0x00000000
+TSS_TSPATTRIB_ENCDATASEAL_PROTECT = 0x00000001
+TSS_TSPATTRIB_ENCDATASEAL_NOPROTECT = TSS_TSPATTRIB_ENCDATASEAL_NO_PROTECT
+
+# NV attributes
+TSS_TSPATTRIB_NV_INDEX = 0x00000001
+TSS_TSPATTRIB_NV_PERMISSIONS = 0x00000002
+TSS_TSPATTRIB_NV_STATE = 0x00000003
+TSS_TSPATTRIB_NV_DATASIZE = 0x00000004
+TSS_TSPATTRIB_NV_PCR = 0x00000005
+TSS_TSPATTRIB_NVSTATE_READSTCLEAR = 0x00100000
+TSS_TSPATTRIB_NVSTATE_WRITESTCLEAR = 0x00200000
+TSS_TSPATTRIB_NVSTATE_WRITEDEFINE = 0x00300000
+TSS_TSPATTRIB_NVPCR_READPCRSELECTION = 0x01000000
+TSS_TSPATTRIB_NVPCR_READDIGESTATRELEASE = 0x02000000
+TSS_TSPATTRIB_NVPCR_READLOCALITYATRELEASE = 0x03000000
+TSS_TSPATTRIB_NVPCR_WRITEPCRSELECTION = 0x04000000
+TSS_TSPATTRIB_NVPCR_WRITEDIGESTATRELEASE = 0x05000000
+TSS_TSPATTRIB_NVPCR_WRITELOCALITYATRELEASE = 0x06000000
+
+# PCR, hash and delegation attributes
+TSS_TSPATTRIB_PCRS_INFO = 0x00000001
+TSS_TSPATTRIB_PCRSINFO_PCRSTRUCT = 0x00000001
+TSS_TSPATTRIB_HASH_IDENTIFIER = 0x00001000
+TSS_TSPATTRIB_ALG_IDENTIFIER = 0x00002000
+TSS_TSPATTRIB_DELFAMILY_STATE = 0x00000001
+TSS_TSPATTRIB_DELFAMILY_INFO = 0x00000002
+TSS_TSPATTRIB_DELFAMILYSTATE_LOCKED = 0x00000001
+TSS_TSPATTRIB_DELFAMILYSTATE_ENABLED = 0x00000002
+TSS_TSPATTRIB_DELFAMILYINFO_LABEL = 0x00000003
+TSS_TSPATTRIB_DELFAMILYINFO_VERCOUNT = 0x00000004
+TSS_TSPATTRIB_DELFAMILYINFO_FAMILYID = 0x00000005
+
+# DAA attributes
+TSS_TSPATTRIB_DAACRED_COMMIT = 0x00000001
+TSS_TSPATTRIB_DAACRED_ATTRIB_GAMMAS = 0x00000002
+TSS_TSPATTRIB_DAACRED_CREDENTIAL_BLOB = 0x00000003
+TSS_TSPATTRIB_DAACRED_CALLBACK_SIGN = 0x00000004
+TSS_TSPATTRIB_DAACRED_CALLBACK_VERIFYSIGNATURE = 0x00000005
+TSS_TSPATTRIB_DAACOMMIT_NUMBER = 0x00000001
+TSS_TSPATTRIB_DAACOMMIT_SELECTION = 0x00000002
+TSS_TSPATTRIB_DAACOMMIT_COMMITMENTS = 0x00000003
+TSS_TSPATTRIB_DAAATTRIBGAMMAS_BLOB = 0xffffffff
+TSS_TSPATTRIB_DAAISSUERKEY_BLOB = 0x00000001
+TSS_TSPATTRIB_DAAISSUERKEY_PUBKEY = 0x00000002
+TSS_TSPATTRIB_DAAISSUERKEYBLOB_PUBLIC_KEY = 0x00000001
+TSS_TSPATTRIB_DAAISSUERKEYBLOB_SECRET_KEY = 0x00000002
+TSS_TSPATTRIB_DAAISSUERKEYBLOB_KEYBLOB = 0x00000003
+TSS_TSPATTRIB_DAAISSUERKEYBLOB_PROOF = 0x00000004
+TSS_TSPATTRIB_DAAISSUERKEYPUBKEY_NUM_ATTRIBS = 0x00000001
+TSS_TSPATTRIB_DAAISSUERKEYPUBKEY_NUM_PLATFORM_ATTRIBS = 0x00000002
+TSS_TSPATTRIB_DAAISSUERKEYPUBKEY_NUM_ISSUER_ATTRIBS = 0x00000003
+TSS_TSPATTRIB_DAAARAKEY_BLOB = 0x00000001
+TSS_TSPATTRIB_DAAARAKEYBLOB_PUBLIC_KEY = 0x00000001
+TSS_TSPATTRIB_DAAARAKEYBLOB_SECRET_KEY = 0x00000002
+TSS_TSPATTRIB_DAAARAKEYBLOB_KEYBLOB = 0x00000003
+
+# Algorithms and schemes
+TSS_ALG_RSA = 0x20
+TSS_ALG_DES = 0x21
+TSS_ALG_3DES = 0x22
+TSS_ALG_SHA = 0x23
+TSS_ALG_HMAC = 0x24
+TSS_ALG_AES128 = 0x25
+TSS_ALG_AES = TSS_ALG_AES128
+TSS_ALG_XOR = 0x26
+TSS_ALG_MGF1 = 0x27
+TSS_ALG_AES192 = 0x28
+TSS_ALG_AES256 = 0x29
+
+TPM_ALG_RSA = 0x00000001
+TPM_ALG_DES = 0x00000002
+TPM_ALG_3DES = 0x00000003
+TPM_ALG_SHA = 0x00000004
+TPM_ALG_HMAC = 0x00000005
+TPM_ALG_AES128 = 0x00000006
+TPM_ALG_AES = TPM_ALG_AES128
+TPM_ALG_MGF1 = 0x00000007
+TPM_ALG_AES192 = 0x00000008
+TPM_ALG_AES256 = 0x00000009
+TPM_ALG_XOR = 0x0000000A
+
+TPM_ES_NONE = 0x0001
+TPM_ES_RSAESPKCSv15 = 0x0002
+TPM_ES_RSAESOAEP_SHA1_MGF1 = 0x0003
+TPM_ES_SYM_CNT = 0x0004
+TPM_ES_SYM_CTR = TPM_ES_SYM_CNT
+TPM_ES_SYM_OFB = 0x0005
+TPM_ES_SYM_CBC_PKCS5PAD = 0x00ff
+
+TPM_SS_NONE = 0x0001
+TPM_SS_RSASSAPKCS1v15_SHA1 = 0x0002
+TPM_SS_RSASSAPKCS1v15_DER = 0x0003
+TPM_SS_RSASSAPKCS1v15_INFO = 0x0004
+
+# Key structures
+TPM_KEY_SIGNING = 0x0010
+TPM_KEY_STORAGE = 0x0011
+TPM_KEY_IDENTITY = 0x0012
+TPM_KEY_AUTHCHANGE = 0x0013
+TPM_KEY_BIND = 0x0014
+TPM_KEY_LEGACY = 0x0015
+TPM_KEY_MIGRATE = 0x0016
+
+TPM_AUTH_NEVER = 0x00
+TPM_AUTH_ALWAYS = 0x01
+TPM_AUTH_PRIV_USE_ONLY = 0x03
+
+# NV storage
+TSS_NV_DEFINED = 0x80000000
+TPM_NV_INDEX_LOCK = 0xFFFFFFFF
+TPM_NV_INDEX0 = 0x00000000
+TPM_NV_INDEX_DIR = 0x10000001
+TPM_NV_INDEX_EKCert = 0x0000F000
+TPM_NV_INDEX_TPM_CC = 0x0000F001
+TPM_NV_INDEX_PlatformCert = 0x0000F002
+TPM_NV_INDEX_Platform_CC = 0x0000F003
+TPM_NV_INDEX_TSS_BASE = 0x00011100
+TPM_NV_INDEX_PC_BASE = 0x00011200
+TPM_NV_INDEX_SERVER_BASE = 0x00011300
+TPM_NV_INDEX_MOBILE_BASE = 0x00011400
+TPM_NV_INDEX_PERIPHERAL_BASE = 0x00011500
+TPM_NV_INDEX_GROUP_RESV_BASE = 0x00010000
+
+TPM_NV_PER_READ_STCLEAR = 0x80000000
+TPM_NV_PER_AUTHREAD = 0x00040000
+TPM_NV_PER_OWNERREAD = 0x00020000
+TPM_NV_PER_PPREAD = 0x00010000
+TPM_NV_PER_GLOBALLOCK = 0x00008000
+TPM_NV_PER_WRITE_STCLEAR = 0x00004000
+TPM_NV_PER_WRITEDEFINE = 0x00002000
+TPM_NV_PER_WRITEALL = 0x00001000
+TPM_NV_PER_AUTHWRITE = 0x00000004
+TPM_NV_PER_OWNERWRITE = 0x00000002
+TPM_NV_PER_PPWRITE = 0x00000001
+
+# Capabilities
+TPM_CAP_ORD = 0x00000001
+TPM_CAP_ALG = 0x00000002
+TPM_CAP_PID = 0x00000003
+TPM_CAP_FLAG = 0x00000004
+TPM_CAP_PROPERTY = 0x00000005
+TPM_CAP_VERSION = 0x00000006
+TPM_CAP_KEY_HANDLE = 0x00000007
+TPM_CAP_CHECK_LOADED = 0x00000008
+TPM_CAP_NV_LIST = 0x0000000D
+TPM_CAP_NV_INDEX = 0x00000011
+TPM_CAP_HANDLE = 0x00000014
+TPM_CAP_VERSION_VAL = 0x0000001A
+
+TPM_CAP_PROP_PCR = 0x00000101
+TPM_CAP_PROP_DIR = 0x00000102
+TPM_CAP_PROP_MANUFACTURER = 0x00000103
+TPM_CAP_PROP_KEYS = 0x00000104
+TPM_CAP_PROP_MIN_COUNTER = 0x00000107
+TPM_CAP_PROP_AUTHSESS = 0x0000010A
+TPM_CAP_PROP_TRANSESS = 0x0000010B
+TPM_CAP_PROP_COUNTERS = 0x0000010C
+TPM_CAP_PROP_MAX_AUTHSESS = 0x0000010D
+TPM_CAP_PROP_MAX_TRANSESS = 0x0000010E
+TPM_CAP_PROP_MAX_COUNTERS = 0x0000010F
+TPM_CAP_PROP_MAX_KEYS = 0x00000110
+TPM_CAP_PROP_OWNER = 0x00000111
+TPM_CAP_PROP_CONTEXT = 0x00000112
+TPM_CAP_PROP_MAX_CONTEXT = 0x00000113
+TPM_CAP_PROP_FAMILYROWS = 0x00000114
+TPM_CAP_PROP_TIS_TIMEOUT = 0x00000115
+TPM_CAP_PROP_STARTUP_EFFECT = 0x00000116
+TPM_CAP_PROP_DELEGATE_ROW = 0x00000117
+TPM_CAP_PROP_MAX_DAASESS = 0x00000119
+TPM_CAP_PROP_DAASESS = 0x0000011A
+TPM_CAP_PROP_CONTEXT_DIST = 0x0000011B
+TPM_CAP_PROP_DAA_INTERRUPT = 0x0000011C
+TPM_CAP_PROP_SESSIONS = 0x0000011D
+TPM_CAP_PROP_MAX_SESSIONS = 0x0000011E
+TPM_CAP_PROP_CMK_RESTRICTION = 0x0000011F
+TPM_CAP_PROP_DURATION = 0x00000120
+TPM_CAP_PROP_ACTIVE_COUNTER = 0x00000122
+TPM_CAP_PROP_MAX_NV_AVAILABLE = 0x00000123
+TPM_CAP_PROP_INPUT_BUFFER = 0x00000124
+
+# Tspi_TPM_GetCapability capability areas and property subcaps
+TSS_TPMCAP_ORD = 0x10
+TSS_TPMCAP_ALG = 0x11
+TSS_TPMCAP_FLAG = 0x12
+TSS_TPMCAP_PROPERTY = 0x13
+TSS_TPMCAP_VERSION = 0x14
+TSS_TPMCAP_VERSION_VAL = 0x15
+TSS_TPMCAP_NV_LIST = 0x16
+TSS_TPMCAP_NV_INDEX = 0x17
+TSS_TPMCAP_MFR = 0x18
+TSS_TPMCAP_SYM_MODE = 0x19
+TSS_TPMCAP_HANDLE = 0x1a
+TSS_TPMCAP_TRANS_ES = 0x1b
+TSS_TPMCAP_AUTH_ENCRYPT = 0x1c
+TSS_TPMCAP_SET_PERM_FLAGS = 0x1d
+TSS_TPMCAP_SET_VENDOR = 0x1e
+TSS_TPMCAP_DA_LOGIC = 0x1f
+
+TSS_TPMCAP_PROP_PCR = 0x10
+TSS_TPMCAP_PROP_DIR = 0x11
+TSS_TPMCAP_PROP_MANUFACTURER = 0x12
+TSS_TPMCAP_PROP_SLOTS = 0x13
+TSS_TPMCAP_PROP_KEYS = TSS_TPMCAP_PROP_SLOTS
+TSS_TPMCAP_PROP_FAMILYROWS = 0x14
+TSS_TPMCAP_PROP_DELEGATEROWS = 0x15
+TSS_TPMCAP_PROP_OWNER = 0x16
+TSS_TPMCAP_PROP_MAXKEYS = 0x18
+TSS_TPMCAP_PROP_AUTHSESSIONS = 0x19
+TSS_TPMCAP_PROP_MAXAUTHSESSIONS = 0x1a
+TSS_TPMCAP_PROP_TRANSESSIONS = 0x1b
+TSS_TPMCAP_PROP_MAXTRANSESSIONS = 0x1c
+TSS_TPMCAP_PROP_SESSIONS = 0x1d
+TSS_TPMCAP_PROP_MAXSESSIONS = 0x1e
+TSS_TPMCAP_PROP_CONTEXTS = 0x1f
+TSS_TPMCAP_PROP_MAXCONTEXTS = 0x20
+TSS_TPMCAP_PROP_DAASESSIONS = 0x21
+TSS_TPMCAP_PROP_MAXDAASESSIONS = 0x22
+TSS_TPMCAP_PROP_DAA_INTERRUPT = 0x23
+TSS_TPMCAP_PROP_COUNTERS = 0x24
+TSS_TPMCAP_PROP_MAXCOUNTERS = 0x25
+TSS_TPMCAP_PROP_ACTIVECOUNTER = 0x26
+TSS_TPMCAP_PROP_MIN_COUNTER = 0x27
+TSS_TPMCAP_PROP_TISTIMEOUTS = 0x28
+TSS_TPMCAP_PROP_STARTUPEFFECTS = 0x29
+TSS_TPMCAP_PROP_MAXCONTEXTCOUNTDIST = 0x2a
+TSS_TPMCAP_PROP_CMKRESTRICTION = 0x2b
+TSS_TPMCAP_PROP_DURATION = 0x2c
+TSS_TPMCAP_PROP_MAXNVAVAILABLE = 0x2d
+TSS_TPMCAP_PROP_INPUTBUFFERSIZE = 0x2e
+TSS_TPMCAP_PROP_REVISION = 0x2f
+TSS_TPMCAP_PROP_LOCALITIES_AVAIL = 0x32
@@ -20,6 +20,8 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import os
+
 from setuptools import setup
 
 __about__ = {}
@@ -28,6 +30,9 @@ with open('pytss/__about__.py') as fp:
     exec(fp.read(), None, __about__)
 
 
+# The backend is chosen at runtime; the libtspi extension is always built
+os.environ.pop('PYTSS_BACKEND', None)
+
 try:
     import pytss.interface
 except ImportError:
@@ -52,6 +57,12 @@ setup(
         'cffi',
     ],
     extras_require={
+        'envelope': [
+            'cryptography',
+        ],
+        'soft': [
+            'cryptography',
+        ],
         'tests': [
             'pep8',
             'pylint',
@@ -68,7 +79,8 @@ setup(
 
     package_data={
         'pytss': [
-            'interface.h'
+            'interface.h',
+            'trust_anchors.json',
         ]
     },
 
@@ -0,0 +1,93 @@
+"""
+The tests run against the software TPM unless PYTSS_BACKEND says otherwise.
+Its state lives in the test process, so every test shares one TPM.
+"""
+
+import hashlib
+import os
+import uuid
+
+import pytest
+
+os.environ.setdefault('PYTSS_BACKEND', 'soft')
+os.environ.setdefault('PYTSS_SOFT_LATENCY', '0')
+
+# How a provisioned test TPM is set up: the SRK's well known UUID, with the
+# owner and SRK authorisations both the all-zero secret
+SRK_UUID = uuid.UUID('{00000000-0000-0000-0000-000000000001}')
+WELL_KNOWN_SECRET = bytearray(20)
+
+# The TCG event type used for measurements logged by the tests
+EV_IPL = 13
+
+
+@pytest.fixture
+def context():
+    import pytss
+    context = pytss.TspiContext()
+    context.connect()
+    return context
+
+
+@pytest.fixture
+def tpm(context):
+    return context.get_tpm_object()
+
+
+@pytest.fixture
+def owner(context, tpm):
+    """The context's TPM object, with the owner authorisation set"""
+    from pytss.tspi_defines import TSS_POLICY_USAGE, TSS_SECRET_MODE_SHA1
+    policy = context.create_policy(TSS_POLICY_USAGE)
+    policy.set_secret(TSS_SECRET_MODE_SHA1, WELL_KNOWN_SECRET)
+    policy.assign(tpm)
+    return tpm
+
+
+@pytest.fixture
+def srk(context):
+    from pytss.tspi_defines import (TSS_POLICY_USAGE, TSS_PS_TYPE_SYSTEM,
+                                    TSS_SECRET_MODE_SHA1)
+    srk = context.load_key_by_uuid(TSS_PS_TYPE_SYSTEM, SRK_UUID)
+    policy = srk.get_policy_object(TSS_POLICY_USAGE)
+    policy.set_secret(TSS_SECRET_MODE_SHA1, WELL_KNOWN_SECRET)
+    return srk
+
+
+@pytest.fixture
+def aik_blob(context, srk, owner):
+    """The key blob of a new Attestation Identity Key"""
+    from pytss.tspi_defines import (TSS_KEY_SIZE_2048,
+                                    TSS_KEY_TYPE_IDENTITY,
+                                    TSS_KEY_TYPE_LEGACY)
+    ca = context.create_rsa_key(TSS_KEY_TYPE_LEGACY | TSS_KEY_SIZE_2048)
+    ca.set_modulus(bytearray([0xff] * 256))
+    aik = context.create_rsa_key(TSS_KEY_TYPE_IDENTITY | TSS_KEY_SIZE_2048)
+    owner.collate_identity_request(srk, ca, aik)
+    blob = aik.get_keyblob()
+    aik.close()
+    return blob
+
+
+@pytest.fixture
+def aik(context, srk, aik_blob):
+    return context.load_key_by_blob(srk, aik_blob)
+
+
+@pytest.fixture
+def measure():
+    """
+    Reboot the soft TPM and return a function that measures data into a
+    PCR and logs the event, as a measuring bootloader would. Its reboot
+    attribute reboots the TPM again.
+    """
+    from pytss import interface
+    if interface.BACKEND != 'soft':
+        pytest.skip("needs the soft backend")
+    soft = interface._lib.tpm
+    soft.reset()
+
+    def measure(pcr, data):
+        return soft.extend(pcr, hashlib.sha1(data).digest(), EV_IPL, data)
+    measure.reboot = soft.reset
+    return measure
@@ -0,0 +1,69 @@
+import os
+import threading
+
+import pytest
+
+from pytss import agentd
+from pytss.agentclient import AgentClient
+from pytss.attestationutils import quote_answers
+
+
+@pytest.fixture
+def agent(context, tmpdir):
+    coalescer = agentd.Coalescer(context, window=0.2)
+    path = os.path.join(str(tmpdir), 'agentd.sock')
+    server = agentd.AgentServer(path, coalescer)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield path, coalescer
+    server.shutdown()
+    server.server_close()
+    coalescer.close()
+
+
+def test_quotes_are_coalesced(agent, aik_blob):
+    path, coalescer = agent
+    tpm = coalescer.tpm
+    quotes = []
+    get_quote = tpm.get_quote
+
+    def counting_get_quote(*args):
+        quotes.append(args)
+        return get_quote(*args)
+    tpm.get_quote = counting_get_quote
+
+    nonces = [b'nonce %d' % i for i in range(6)]
+    results = {}
+    barrier = threading.Barrier(len(nonces))
+
+    def client(nonce):
+        with AgentClient(path) as agent_client:
+            barrier.wait()
+            results[nonce] = agent_client.get_quote(aik_blob, [0, 1], nonce)
+
+    threads = [threading.Thread(target=client, args=(nonce,))
+               for nonce in nonces]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(quotes) == 1
+    assert len(results) == len(nonces)
+    for nonce, (data, validation, proof) in results.items():
+        assert proof is not None
+        assert quote_answers(data, nonce, proof)
+        assert not quote_answers(data, b'other', proof)
+
+
+def test_lone_quote_has_no_proof(agent, aik_blob):
+    path, coalescer = agent
+    with AgentClient(path) as agent_client:
+        data, validation, proof = agent_client.get_quote(
+            aik_blob, [0], b'alone')
+        assert proof is None
+        assert quote_answers(data, b'alone')
+        assert len(agent_client.get_random(32)) == 32
+        assert (bytes(agent_client.read_pcr(0)) ==
+                bytes(coalescer.tpm.read_pcr(0)))
@@ -0,0 +1,63 @@
+import hashlib
+
+import pytest
+
+from pytss import merkle
+from pytss.attestationutils import pkcs1_verify
+from pytss.batchsign import BatchSigner, root_digest, verify_record
+
+
+@pytest.fixture
+def signing_key(srk):
+    from pytss import TspiKey
+    from pytss.tspi_defines import (TSS_KEY_NO_AUTHORIZATION,
+                                    TSS_KEY_SIZE_2048, TSS_KEY_TYPE_SIGNING)
+    key = TspiKey.create(srk, TSS_KEY_TYPE_SIGNING | TSS_KEY_SIZE_2048 |
+                         TSS_KEY_NO_AUTHORIZATION)
+    key.load(srk)
+    return key
+
+
+def test_pkcs1_verify(signing_key):
+    signer = BatchSigner(signing_key)
+    root = hashlib.sha256(b'root').digest()
+    signature = signer.sign_root(root)
+    modulus = signing_key.get_pubkey()
+    assert pkcs1_verify(root_digest(root), signature, modulus)
+    assert not pkcs1_verify(root_digest(b'other'), signature, modulus)
+    signature[-1] ^= 1
+    assert not pkcs1_verify(root_digest(root), signature, modulus)
+
+
+def test_verify_record(signing_key):
+    records = [b'record %d' % i for i in range(5)]
+    batch = BatchSigner(signing_key).sign(records)
+    modulus = signing_key.get_pubkey()
+    for record, proof in zip(records, batch.proofs):
+        assert verify_record(record, proof, batch.root, batch.signature,
+                             modulus)
+        assert verify_record(record, merkle.encode_proof(proof), batch.root,
+                             batch.signature, modulus)
+    assert not verify_record(records[0], batch.proofs[1], batch.root,
+                             batch.signature, modulus)
+    assert not verify_record(records[0], b'garbage', batch.root,
+                             batch.signature, modulus)
+    forged = merkle.MerkleTree([b'forged'])
+    assert not verify_record(b'forged', forged.proof(0), forged.root,
+                             batch.signature, modulus)
+
+
+def test_verify_record_pins_the_hash(signing_key):
+    records = [b'record %d' % i for i in range(3)]
+    batch = BatchSigner(signing_key, 'sha1').sign(records)
+    modulus = signing_key.get_pubkey()
+    proof = batch.proofs[0]
+    # A record may not choose the hash its proof is checked with
+    assert not verify_record(records[0], proof, batch.root, batch.signature,
+                             modulus)
+    assert not verify_record(records[0], merkle.encode_proof(proof),
+                             batch.root, batch.signature, modulus)
+    assert not verify_record(records[0], proof._replace(hash_name='sha256'),
+                             batch.root, batch.signature, modulus)
+    assert verify_record(records[0], proof, batch.root, batch.signature,
+                         modulus, hash_name='sha1')
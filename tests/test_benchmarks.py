@@ -0,0 +1,79 @@
+import io
+import os
+import subprocess
+import sys
+
+from benchmarks import harness
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def results(**medians):
+    return {'meta': {}, 'results': dict(
+        (name, harness.summarize([median] * 5))
+        for name, median in medians.items())}
+
+
+def compare(tmpdir, baseline, current):
+    paths = []
+    for name, data in (('baseline', baseline), ('current', current)):
+        path = os.path.join(str(tmpdir), name + '.json')
+        harness.save(data, path)
+        paths.append(path)
+    return subprocess.run([sys.executable, '-m', 'benchmarks', 'compare'] +
+                          paths, cwd=ROOT, capture_output=True, text=True)
+
+
+def test_compare_flags_regression(tmpdir):
+    baseline = results(seal=1e-3, quote=2e-3)
+    compared = compare(tmpdir, baseline, results(seal=1.5e-3, quote=2e-3))
+    assert compared.returncode == 1
+    statuses = dict((line.split()[0], line.split()[-1])
+                    for line in compared.stdout.splitlines()[1:])
+    assert statuses == {'seal': 'slower', 'quote': 'same'}
+
+    compared = compare(tmpdir, baseline, results(seal=0.5e-3, quote=2.1e-3))
+    assert compared.returncode == 0
+    assert 'faster' in compared.stdout
+
+
+def test_compare_statuses():
+    baseline = results(same=1.0, gone=1.0, skipped=1.0)
+    current = results(same=1.05, new=1.0)
+    current['results']['skipped'] = {'skipped': 'needs M2Crypto'}
+    rows = dict((row[0], row[4])
+                for row in harness.compare(baseline, current))
+    assert rows == {'same': 'same', 'gone': 'missing', 'new': 'new',
+                    'skipped': 'skipped'}
+
+
+def test_noise_widens_threshold():
+    baseline = results(seal=1.0)
+    current = {'meta': {}, 'results': {
+        'seal': harness.summarize([0.5, 1.25, 2.0])}}
+    assert harness.compare(baseline, current)[0][4] == 'same'
+
+
+def test_skipped_benchmark():
+    def setup():
+        raise harness.SkipBenchmark("no TPM")
+    bench = harness.Benchmark('skips', setup, 1, 1, None)
+    assert harness.run_benchmark(bench) == {'skipped': 'no TPM'}
+
+
+def test_skipped_cases_are_listed(monkeypatch):
+    def setup():
+        raise harness.SkipBenchmark("no TPM")
+    monkeypatch.setattr(harness, 'benchmarks', lambda pattern: [
+        harness.Benchmark('skips', setup, 1, 1, None)])
+    results = harness.run(out=io.StringIO())
+    assert results['meta']['skipped'] == {'skips': 'no TPM'}
+
+
+def test_baseline_lists_skipped_cases():
+    baseline = harness.load(os.path.join(ROOT, 'benchmarks', 'baselines',
+                                         'soft.json'))
+    assert baseline['meta']['skipped'] == dict(
+        (name, result['skipped'])
+        for name, result in baseline['results'].items()
+        if 'skipped' in result)
@@ -0,0 +1,79 @@
+import hashlib
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from pytss import TspiKey, tspi_exceptions
+from pytss.attestationutils import OfflineBinder, bind_offline, pkcs1_verify
+from pytss.tspi_defines import (TSS_HASH_SHA1, TSS_KEY_NO_AUTHORIZATION,
+                                TSS_KEY_SIZE_1024, TSS_KEY_TYPE_BIND,
+                                TSS_KEY_TYPE_SIGNING)
+
+# Larger than a 1024-bit key can bind directly
+LARGE = os.urandom(4096)
+
+
+def loaded_key(srk, key_type):
+    key = TspiKey.create(srk, key_type | TSS_KEY_SIZE_1024 |
+                         TSS_KEY_NO_AUTHORIZATION)
+    key.load(srk)
+    return key
+
+
+@pytest.fixture
+def bind_key(srk):
+    return loaded_key(srk, TSS_KEY_TYPE_BIND)
+
+
+@pytest.fixture
+def signing_key(srk):
+    return loaded_key(srk, TSS_KEY_TYPE_SIGNING)
+
+
+def test_bind_offline(bind_key):
+    pubkey = bind_key.get_pubkeyblob()
+    blob = bind_offline(pubkey, b'secret')
+    assert len(blob) == 128
+    assert bytes(bind_key.unbind(blob)) == b'secret'
+
+    binder = OfflineBinder(pubkey)
+    # TPM_BOUND_DATA and OAEP padding leave 81 bytes in a 1024-bit key
+    items = [b'one', b'two', b'x' * 81]
+    blobs = list(binder.bind_many(items))
+    assert [bytes(bind_key.unbind(blob)) for blob in blobs] == items
+    with pytest.raises(ValueError):
+        binder.bind(b'x' * 82)
+
+
+def test_hybrid(bind_key):
+    blob = bind_key.bind(LARGE, hybrid=True)
+    assert bytes(bind_key.unbind(blob, hybrid=True)) == LARGE
+    blob = bind_offline(bind_key.get_pubkeyblob(), LARGE, hybrid=True)
+    assert bytes(bind_key.unbind(blob, hybrid=True)) == LARGE
+
+    with pytest.raises(tspi_exceptions.TSS_E_ENC_INVALID_LENGTH):
+        bind_key.bind(LARGE)
+    with pytest.raises(InvalidTag):
+        bind_key.unbind(blob[:-1], hybrid=True)
+    with pytest.raises(ValueError):
+        bind_key.unbind(blob[:140], hybrid=True)
+
+
+def test_pkcs1_verify(context, signing_key):
+    digest = hashlib.sha1(b'message').digest()
+    sighash = context.create_hash(TSS_HASH_SHA1)
+    sighash.update(b'message')
+    signature = bytes(sighash.sign(signing_key))
+    modulus = signing_key.get_pubkey()
+    assert pkcs1_verify(digest, signature, modulus)
+
+    flipped = bytearray(signature)
+    flipped[-1] ^= 1
+    assert not pkcs1_verify(digest, flipped, modulus)
+    assert not pkcs1_verify(hashlib.sha1(b'other').digest(), signature,
+                            modulus)
+    assert not pkcs1_verify(digest, signature[1:], modulus)
+    assert not pkcs1_verify(digest, signature, modulus, exponent=3)
+    # A signature must be smaller than the modulus
+    assert not pkcs1_verify(digest, bytes(modulus), modulus)
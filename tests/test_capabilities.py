@@ -0,0 +1,130 @@
+import binascii
+import struct
+
+import pytest
+from cryptography import x509
+
+from pytss import TspiNV, capabilities, interface, tspi_exceptions
+from pytss.attestationutils import get_ekcert
+from pytss.capabilities import (TpmCapabilities, TpmVersionInfo,
+                                decode_nv_list, decode_version_info)
+from pytss.interface import tss_lib
+
+# TPM_CAP_VERSION_INFO of an Infineon TPM 1.2, firmware 3.17
+INFINEON_VERSION = binascii.unhexlify('003001020311000203494658000000')
+
+
+class CannedTPM(object):
+    """Answer get_capability from canned responses, counting queries"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.queries = []
+
+    def get_capability(self, cap, sub):
+        key = (cap, struct.unpack('=I', sub)[0] if sub else None)
+        self.queries.append(key)
+        return bytearray(self.responses[key])
+
+
+def canned():
+    prop = tss_lib.TSS_TPMCAP_PROPERTY
+    return CannedTPM({
+        (tss_lib.TSS_TPMCAP_VERSION_VAL, None): INFINEON_VERSION,
+        (prop, tss_lib.TSS_TPMCAP_PROP_MANUFACTURER):
+            struct.pack('=I', 0x49465800),
+        (prop, tss_lib.TSS_TPMCAP_PROP_PCR): struct.pack('=I', 24),
+        (prop, tss_lib.TSS_TPMCAP_PROP_INPUTBUFFERSIZE):
+            struct.pack('=I', 1024),
+        (prop, tss_lib.TSS_TPMCAP_PROP_MAXKEYS): struct.pack('=I', 10),
+        (prop, tss_lib.TSS_TPMCAP_PROP_SLOTS): struct.pack('=I', 7),
+        (prop, tss_lib.TSS_TPMCAP_PROP_OWNER): b'\x01',
+        (tss_lib.TSS_TPMCAP_NV_LIST, None):
+            binascii.unhexlify('1000f0000001100050000001'),
+    })
+
+
+def test_decode_version_info():
+    assert decode_version_info(INFINEON_VERSION) == TpmVersionInfo(
+        1, 2, 3, 17, 2, 3, b'IFX\x00', b'')
+    info = decode_version_info(INFINEON_VERSION[:-2] + b'\x00\x02\xab\xcd')
+    assert info.vendor_specific == b'\xab\xcd'
+    with pytest.raises(ValueError):
+        decode_version_info(INFINEON_VERSION[:10])
+    with pytest.raises(ValueError):
+        decode_version_info(b'\x00\x31' + INFINEON_VERSION[2:])
+
+
+def test_decode_nv_list():
+    assert decode_nv_list(binascii.unhexlify('1000f0000001100050000001')) \
+        == [0x1000f000, 0x00011000, 0x50000001]
+    assert decode_nv_list(b'') == []
+
+
+def test_properties():
+    tpm = canned()
+    caps = TpmCapabilities(tpm)
+    assert caps.version.vendor_id == b'IFX\x00'
+    assert caps.manufacturer == b'IFX\x00'
+    assert caps.pcr_count == 24
+    assert caps.input_buffer_size == 1024
+    assert caps.key_slots == 10
+    assert caps.free_key_slots() == 7
+    assert caps.get_property(tss_lib.TSS_TPMCAP_PROP_OWNER) == 1
+    assert caps.nv_indices() == [0x1000f000, 0x00011000, 0x50000001]
+    # Both the write command and the read response fit the buffer
+    assert caps.nv_chunk_size == 1024 - 67
+    assert caps.nv_chunk_size + capabilities.NV_RESPONSE_OVERHEAD <= 1024
+
+
+def test_static_values_are_cached():
+    tpm = canned()
+    caps = TpmCapabilities(tpm)
+    first = caps.snapshot()
+    queries = len(tpm.queries)
+    assert caps.snapshot() == first
+    caps.free_key_slots()
+    caps.nv_indices()
+    assert len(tpm.queries) == queries + 2
+    caps.clear()
+    caps.pcr_count
+    assert len(tpm.queries) == queries + 3
+
+
+def test_soft_tpm(tpm, srk):
+    if interface.BACKEND != 'soft':
+        pytest.skip("needs the soft backend")
+    caps = tpm.capabilities
+    assert tpm.capabilities is caps
+    assert caps.version.major == 1 and caps.version.minor == 2
+    assert caps.manufacturer == b'PYTS'
+    assert caps.pcr_count == 24
+    assert tss_lib.TPM_NV_INDEX_EKCert in caps.nv_indices()
+    assert caps.free_key_slots() <= caps.key_slots
+
+
+def test_get_ekcert_falls_back_to_128(context, owner, monkeypatch):
+    lengths = []
+    read_value = TspiNV.read_value
+
+    def counting_read_value(self, offset, length):
+        lengths.append(length)
+        return read_value(self, offset, length)
+    monkeypatch.setattr(TspiNV, 'read_value', counting_read_value)
+
+    cert = get_ekcert(context)
+    ek = x509.load_der_x509_certificate(bytes(cert))
+    modulus = bytes(owner.get_pub_endorsement_key().get_pubkey())
+    assert ek.public_key().public_numbers().n == \
+        int.from_bytes(modulus, 'big')
+    chunk = owner.capabilities.nv_chunk_size
+    assert max(lengths) == min(chunk, len(cert))
+
+    def unsupported(self):
+        raise tspi_exceptions.TSS_E_NOTIMPL()
+    monkeypatch.setattr(TpmCapabilities, 'nv_chunk_size',
+                        property(unsupported))
+    del lengths[:]
+    assert get_ekcert(context) is not None
+    assert len(cert) > 128
+    assert max(lengths) == 128
@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import threading
+
+import pytest
+
+from pytss import interface
+from pytss.counter import BatchedCounter, CounterRollback
+from pytss.scheduler import INTERACTIVE, TpmScheduler
+
+# The Tspi API cannot increment the counter, so the soft TPM stands in
+pytestmark = pytest.mark.skipif(interface.BACKEND != 'soft',
+                                reason="needs the soft backend")
+
+
+def increment():
+    interface._lib.tpm.increment_counter()
+
+
+def test_read_counter_is_cached(tpm):
+    start = tpm.read_counter()
+    increment()
+    assert tpm.read_counter() == start
+    assert tpm.read_counter(refresh=True) == start + 1
+    increment()
+    tpm.invalidate_counter()
+    assert tpm.read_counter() == start + 2
+
+
+def test_cached_read_is_not_scheduled(context, tpm):
+    scheduler = TpmScheduler(context, aging=None)
+    try:
+        tpm.read_counter(refresh=True)
+        assert scheduler.stats()['normal'].granted == 1
+        # A cached read does not wait while another thread holds the TPM
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with scheduler.slot(INTERACTIVE):
+                held.set()
+                release.wait()
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait()
+        try:
+            reader = threading.Thread(target=tpm.read_counter)
+            reader.start()
+            reader.join(5)
+            assert not reader.is_alive()
+        finally:
+            release.set()
+            holder.join()
+        assert scheduler.stats()['normal'].granted == 1
+        tpm.read_counter(refresh=True)
+        assert scheduler.stats()['normal'].granted == 2
+    finally:
+        scheduler.close()
+
+
+def test_bumps_are_batched(tpm, tmpdir):
+    path = os.path.join(str(tmpdir), 'counter')
+    counter = BatchedCounter(tpm, path, increment, every=4)
+    start = tpm.read_counter(refresh=True)
+    for i in range(3):
+        counter.bump()
+    assert counter.value == (start, 3)
+    assert tpm.read_counter(refresh=True) == start
+    counter.bump()
+    assert counter.value == (start + 1, 0)
+    assert tpm.read_counter(refresh=True) == start + 1
+
+    counter = BatchedCounter(tpm, path, increment, every=4)
+    assert counter.value == (start + 1, 0)
+
+
+def test_rollback_is_detected(tpm, tmpdir):
+    path = os.path.join(str(tmpdir), 'counter')
+    counter = BatchedCounter(tpm, path, increment)
+    counter.bump()
+    shutil.copy(path, path + '.old')
+    counter.commit()
+
+    os.rename(path + '.old', path)
+    with pytest.raises(CounterRollback):
+        BatchedCounter(tpm, path, increment)
+
+
+def test_interrupted_increment_is_completed(tpm, tmpdir):
+    path = os.path.join(str(tmpdir), 'counter')
+    counter = BatchedCounter(tpm, path, increment)
+    counter.bump()
+    hardware = counter.hardware
+    with open(path) as fp:
+        state = json.load(fp)
+    # Die after the increment but before the new state is saved
+    state['incrementing'] = True
+    with open(path, 'w') as fp:
+        json.dump(state, fp)
+    increment()
+
+    counter = BatchedCounter(tpm, path, increment)
+    assert counter.value == (hardware + 1, 0)
@@ -0,0 +1,113 @@
+import struct
+import threading
+import time
+
+from pytss import entropy
+from pytss.entropy import MAX_RANDOM_BLOCK, TpmRandomPool
+
+
+class CountingTPM(object):
+    """
+    Stand in for a TspiTPM, returning consecutive 32-bit counter values so
+    that every word handed out is distinct
+    """
+
+    def __init__(self, failures=0):
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.lengths = []
+        self.calls = []
+        self.failures = failures
+
+    def get_random(self, length):
+        with self.lock:
+            self.calls.append(time.time())
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("TPM failure")
+            self.lengths.append(length)
+            assert length % 4 == 0
+            words = range(self.counter, self.counter + length // 4)
+            self.counter += length // 4
+            return bytearray(b''.join(struct.pack('!I', w) for w in words))
+
+
+def wait_until(predicate):
+    deadline = time.time() + 10
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.005)
+
+
+def test_large_requests_are_split():
+    tpm = CountingTPM()
+    pool = TpmRandomPool(tpm, block_size=4 * MAX_RANDOM_BLOCK, capacity=64)
+    assert pool.block_size == MAX_RANDOM_BLOCK
+    wait_until(lambda: len(pool.buf) == 64)
+    assert len(pool.read(3000)) == 3000
+    pool.close()
+    assert max(tpm.lengths) == MAX_RANDOM_BLOCK
+    assert tpm.lengths[-3:] == [MAX_RANDOM_BLOCK, MAX_RANDOM_BLOCK,
+                                3000 - 64 - 2 * MAX_RANDOM_BLOCK]
+
+
+def test_refill():
+    tpm = CountingTPM()
+    pool = TpmRandomPool(tpm, block_size=64, capacity=256, low_water=128)
+    wait_until(lambda: len(pool.buf) == 256)
+    assert tpm.lengths == [64] * 4
+
+    # Reads above low water are served without a refill
+    pool.read(100)
+    time.sleep(0.05)
+    assert len(pool.buf) == 156
+    pool.read(32)
+    wait_until(lambda: len(pool.buf) == 256)
+    assert tpm.lengths[4:] == [64, 64, 4]
+    pool.close()
+    assert not pool.thread.is_alive()
+
+
+def test_backoff(monkeypatch):
+    monkeypatch.setattr(entropy, 'ERROR_DELAY', 0.02)
+    tpm = CountingTPM(failures=3)
+    pool = TpmRandomPool(tpm, block_size=64, capacity=64)
+    wait_until(lambda: len(pool.buf) == 64)
+    assert pool.errors == 3
+    assert isinstance(pool.error, RuntimeError)
+    # Each retry waits twice as long as the one before
+    gaps = [b - a for a, b in zip(tpm.calls, tpm.calls[1:])]
+    for gap, delay in zip(gaps, (0.02, 0.04, 0.08)):
+        assert gap >= delay
+    assert len(pool.read(64)) == 64
+    pool.close()
+
+
+def test_concurrent_reads():
+    tpm = CountingTPM()
+    pool = TpmRandomPool(tpm, block_size=64, capacity=256)
+    results = []
+
+    def reader(size):
+        for _ in range(50):
+            results.append(bytes(pool.read(size)))
+    threads = [threading.Thread(target=reader, args=(4 * (i + 1),))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+
+    data = b''.join(results)
+    assert len(data) == 50 * 4 * sum(range(1, 9))
+    words = [data[i:i + 4] for i in range(0, len(data), 4)]
+    # No byte was handed to two readers
+    assert len(set(words)) == len(words)
+
+
+def test_tpm(tpm):
+    pool = TpmRandomPool(tpm, block_size=32, capacity=64)
+    assert len(pool.read(16)) == 16
+    assert len(pool.read(100)) == 100
+    pool.close()
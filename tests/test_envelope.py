@@ -0,0 +1,95 @@
+import io
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from pytss import envelope, tspi_exceptions
+from pytss.envelope import EnvelopeReader, seal_stream, unseal_stream
+
+CHUNK = 64
+PAYLOAD = os.urandom(5 * CHUNK + 10)
+
+
+def seal(srk, payload, **kwargs):
+    dst = io.BytesIO()
+    assert seal_stream(srk, io.BytesIO(payload), dst, chunk_size=CHUNK,
+                       **kwargs) == len(payload)
+    return dst.getvalue()
+
+
+def unseal(srk, sealed):
+    dst = io.BytesIO()
+    assert unseal_stream(srk, io.BytesIO(sealed), dst) == \
+        len(dst.getvalue())
+    return dst.getvalue()
+
+
+def split(srk, sealed):
+    """Split an envelope into its header and chunks"""
+    header_size = EnvelopeReader(srk, io.BytesIO(sealed)).header_size
+    stride = CHUNK + envelope.TAG_SIZE
+    body = sealed[header_size:]
+    return (sealed[:header_size],
+            [body[i:i + stride] for i in range(0, len(body), stride)])
+
+
+@pytest.mark.parametrize('payload', [b'', b'single chunk', os.urandom(CHUNK),
+                                     PAYLOAD])
+def test_round_trip(srk, payload):
+    sealed = seal(srk, payload)
+    assert sealed.startswith(envelope.MAGIC)
+    assert unseal(srk, sealed) == payload
+
+
+def test_random_access(srk):
+    reader = EnvelopeReader(srk, io.BytesIO(seal(srk, PAYLOAD)))
+    assert reader.chunk_count == 6
+    for index in (4, 0, 5, 2):
+        assert reader.read_chunk(index) == \
+            PAYLOAD[index * CHUNK:(index + 1) * CHUNK]
+    with pytest.raises(IndexError):
+        reader.read_chunk(6)
+
+
+def test_tampered(srk):
+    sealed = bytearray(seal(srk, PAYLOAD))
+    sealed[-CHUNK] ^= 1
+    with pytest.raises(InvalidTag):
+        unseal(srk, bytes(sealed))
+
+
+def test_truncated(srk):
+    header, chunks = split(srk, seal(srk, PAYLOAD))
+    # Dropping whole chunks makes an earlier chunk look final
+    with pytest.raises(InvalidTag):
+        unseal(srk, header + b''.join(chunks[:-1]))
+    with pytest.raises(InvalidTag):
+        unseal(srk, header + b''.join(chunks)[:-1])
+    with pytest.raises(ValueError):
+        unseal(srk, header[:-1])
+
+
+def test_reordered(srk):
+    header, chunks = split(srk, seal(srk, PAYLOAD))
+    chunks[1], chunks[2] = chunks[2], chunks[1]
+    with pytest.raises(InvalidTag):
+        unseal(srk, header + b''.join(chunks))
+
+
+def test_appended(srk):
+    header, chunks = split(srk, seal(srk, PAYLOAD))
+    with pytest.raises(InvalidTag):
+        unseal(srk, header + b''.join(chunks + chunks[:1]))
+    # Chunks from another envelope do not carry over
+    other_header, other_chunks = split(srk, seal(srk, PAYLOAD))
+    with pytest.raises(InvalidTag):
+        unseal(srk, header + b''.join(chunks[:-1] + other_chunks[-1:]))
+
+
+def test_pcr_bound(tpm, srk):
+    sealed = seal(srk, PAYLOAD, pcrs=[16])
+    assert unseal(srk, sealed) == PAYLOAD
+    tpm.extend_pcr(16, b'change', None)
+    with pytest.raises(tspi_exceptions.TPM_E_WRONGPCRVAL):
+        unseal(srk, sealed)
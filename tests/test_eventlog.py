@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import pytss
+from pytss.eventlog import CheckpointStore, PcrEvent, PcrReplay
+from pytss.tspi_defines import TSS_PCRS_STRUCT_INFO
+
+# The dynamic PCRs start out as all ones
+INITIAL = dict((pcr, b'\xff' * 20) for pcr in range(17, 23))
+
+
+def test_iter_events(tpm, measure):
+    for i in range(7):
+        measure(10, b'event %d' % i)
+    expected = [PcrEvent(10, i, 13, hashlib.sha1(b'event %d' % i).digest(),
+                         b'event %d' % i) for i in range(7)]
+    # Partial, exact and single event batches
+    for batch in (3, 7, 1, 64):
+        assert list(tpm.iter_events(pcr=10, batch=batch)) == expected
+    assert list(tpm.iter_events(pcr=11)) == []
+
+
+def test_iter_events_start(tpm, measure):
+    for i in range(7):
+        measure(10, b'event %d' % i)
+    events = list(tpm.iter_events(pcr=10, start=4, batch=2))
+    assert [event.number for event in events] == [4, 5, 6]
+    assert events[0].data == b'event 4'
+    assert list(tpm.iter_events(pcr=10, start=7)) == []
+    assert list(tpm.iter_events(pcr=10, start=8)) == []
+
+
+def test_iter_events_all_pcrs(tpm, measure):
+    measure(10, b'kernel')
+    measure(4, b'bootloader')
+    measure(pytss.NUM_PCRS - 1, b'last')
+    events = list(tpm.iter_events(batch=1))
+    assert [(event.pcr, event.data) for event in events] == [
+        (4, b'bootloader'), (10, b'kernel'),
+        (pytss.NUM_PCRS - 1, b'last')]
+
+
+def test_replay(context, tpm, aik, measure):
+    for i in range(5):
+        measure(i % 2, b'event %d' % i)
+    measure(17, b'late launch')
+    replay = PcrReplay(INITIAL)
+    assert replay.feed(tpm.iter_events(batch=2)) == 6
+    pcrvalues = dict((pcr, tpm.read_pcr(pcr))
+                     for pcr in range(pytss.NUM_PCRS))
+    assert replay.verify(pcrvalues)
+    assert not PcrReplay().verify(pcrvalues)
+
+    pcrs = context.create_pcrs(TSS_PCRS_STRUCT_INFO)
+    pcrs.set_pcrs([0, 1, 17])
+    data, validation = tpm.get_quote(aik, pcrs, b'nonce')
+    assert replay.matches_quote(data, [0, 1, 17])
+
+    # An extension that was not logged
+    tpm.extend_pcr(1, b'hidden', None)
+    pcrvalues[1] = tpm.read_pcr(1)
+    assert replay.mismatches(pcrvalues) == [1]
+
+
+def test_catch_up(tpm, measure):
+    measure(10, b'first')
+    replay = PcrReplay()
+    assert replay.catch_up(tpm, [10]) == 1
+    measure(10, b'second')
+    measure(10, b'third')
+    assert replay.catch_up(tpm, [10]) == 2
+    assert replay.verify({10: tpm.read_pcr(10)})
+
+
+def test_gap(measure, tpm):
+    measure(10, b'first')
+    measure(10, b'second')
+    with pytest.raises(ValueError):
+        PcrReplay().feed(tpm.iter_events(pcr=10, start=1))
+
+
+class CountingSource(object):
+    """Count the events a replay asks the TPM for"""
+
+    def __init__(self, tpm):
+        self.tpm = tpm
+        self.starts = []
+
+    def iter_events(self, pcr, start):
+        self.starts.append((pcr, start))
+        return self.tpm.iter_events(pcr=pcr, start=start)
+
+
+def pcr_values(tpm, pcrs=(4, 10)):
+    return dict((pcr, tpm.read_pcr(pcr)) for pcr in pcrs)
+
+
+def test_checkpoint_resume(tpm, measure, tmpdir):
+    store = CheckpointStore(str(tmpdir))
+    source = CountingSource(tpm)
+    measure(4, b'bootloader')
+    measure(10, b'kernel')
+    assert store.verify('host', source, pcr_values(tpm))
+    assert source.starts == [(4, 0), (10, 0)]
+
+    measure(10, b'module')
+    del source.starts[:]
+    assert store.verify('host', source, pcr_values(tpm))
+    # Only the new event is replayed
+    assert source.starts == [(4, 1), (10, 1)]
+    assert store.load('host').counts == {4: 1, 10: 2}
+    assert store.load('other') is None
+
+
+def test_corrupt_checkpoint(tpm, measure, tmpdir):
+    store = CheckpointStore(str(tmpdir))
+    measure(10, b'kernel')
+    assert store.verify('host', tpm, pcr_values(tpm))
+    path = store._path('host')
+    with open(path, 'w') as fp:
+        fp.write('{"version": 1, "pcrs": {"10": ')
+    assert store.load('host') is None
+
+    source = CountingSource(tpm)
+    assert store.verify('host', source, pcr_values(tpm))
+    assert source.starts == [(4, 0), (10, 0)]
+    assert store.load('host').counts == {10: 1}
+
+
+def test_stale_checkpoint(tpm, measure, tmpdir):
+    store = CheckpointStore(str(tmpdir))
+    measure(10, b'kernel')
+    measure(10, b'module')
+    assert store.verify('host', tpm, pcr_values(tpm))
+
+    # After a reboot the checkpoint covers events that are gone
+    measure.reboot()
+    measure(10, b'other kernel')
+    source = CountingSource(tpm)
+    assert store.verify('host', source, pcr_values(tpm))
+    assert source.starts[-2:] == [(4, 0), (10, 0)]
+    assert store.load('host').counts == {10: 1}
+
+    # A log that does not match is not checkpointed
+    tpm.extend_pcr(10, b'hidden', None)
+    assert not store.verify('host', tpm, pcr_values(tpm))
+    assert store.load('host') is None
+
+
+def test_atomic_save(tpm, measure, tmpdir, monkeypatch):
+    store = CheckpointStore(str(tmpdir))
+    measure(10, b'kernel')
+    assert store.verify('host', tpm, pcr_values(tpm))
+    with open(store._path('host')) as fp:
+        saved = fp.read()
+
+    replay = store.load('host')
+    replay.extend(10, b'\x00' * 20)
+
+    def broken(*args, **kwargs):
+        raise IOError("disk full")
+    monkeypatch.setattr(json, 'dump', broken)
+    with pytest.raises(IOError):
+        store.save('host', replay)
+    # The old checkpoint is intact and no temporary file is left behind
+    assert os.listdir(str(tmpdir)) == [os.path.basename(store._path('host'))]
+    with open(store._path('host')) as fp:
+        assert fp.read() == saved
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+
+import pytest
+
+from pytss import TspiContext
+from pytss.attestationutils import pkcs1_verify
+from pytss.fleet import FleetCollector, HostTimeout
+
+HOSTS = ['alpha', 'bravo', 'charlie']
+
+
+@pytest.fixture
+def stand_ins():
+    """
+    A context factory that connects every host to the local TPM, after the
+    host's delay, or raises the host's error instead
+    """
+    delays = {}
+    errors = {}
+    created = []
+
+    def factory(host):
+        created.append(host)
+        time.sleep(delays.get(host, 0))
+        if host in errors:
+            raise errors[host]
+        context = TspiContext()
+        context.connect()
+        return context
+    factory.delays = delays
+    factory.errors = errors
+    factory.created = created
+    return factory
+
+
+def collector(aik_blob, factory, hosts=HOSTS, **kwargs):
+    return FleetCollector(dict((host, aik_blob) for host in hosts), [0, 16],
+                          context_factory=factory, **kwargs)
+
+
+def test_collect(tpm, aik, aik_blob, stand_ins):
+    fleet = collector(aik_blob, stand_ins)
+    results = dict(fleet.collect(b'nonce'))
+    assert sorted(results) == HOSTS
+    modulus = aik.get_pubkey()
+    for result in results.values():
+        assert pkcs1_verify(hashlib.sha1(result.data).digest(),
+                            result.validation, modulus)
+        assert result.pcrs == {0: tpm.read_pcr(0), 16: tpm.read_pcr(16)}
+        assert result.elapsed >= 0
+    report = fleet.latency()
+    assert (report.count, report.errors, report.timeouts) == (3, 0, 0)
+    assert report.p50 <= report.max
+
+    # Contexts are kept for the next collection
+    assert len(dict(fleet.collect(b'again'))) == 3
+    assert sorted(stand_ins.created) == HOSTS
+    fleet.close()
+
+
+def test_timeout(aik_blob, stand_ins):
+    stand_ins.delays['bravo'] = 1.0
+    fleet = collector(aik_blob, stand_ins, timeout=0.2)
+    start = time.time()
+    results = dict(fleet.collect(b'nonce'))
+    # The slow host is abandoned rather than waited for
+    assert time.time() - start < 1.0
+    assert isinstance(results.pop('bravo'), HostTimeout)
+    assert not any(isinstance(result, Exception)
+                   for result in results.values())
+    assert fleet.latency().timeouts == 1
+
+    # Its context is replaced before the next collection
+    del stand_ins.delays['bravo']
+    results = dict(fleet.collect(b'nonce', hosts=['bravo']))
+    assert not isinstance(results['bravo'], Exception)
+    assert stand_ins.created.count('bravo') == 2
+
+
+def test_error(aik_blob, stand_ins):
+    stand_ins.errors['charlie'] = RuntimeError("connection refused")
+    fleet = collector(aik_blob, stand_ins)
+    results = dict(fleet.collect(b'nonce'))
+    assert results['charlie'] is stand_ins.errors['charlie']
+    assert not isinstance(results['alpha'], Exception)
+    assert not isinstance(results['bravo'], Exception)
+    report = fleet.latency()
+    assert (report.count, report.errors) == (2, 1)
+
+
+def test_results_in_finishing_order(aik_blob, stand_ins):
+    stand_ins.delays.update(alpha=0.4, bravo=0.2)
+    fleet = collector(aik_blob, stand_ins)
+    assert [host for host, result in fleet.collect(b'nonce')] == \
+        ['charlie', 'bravo', 'alpha']
+
+
+def test_workers_bound_concurrency(aik_blob, stand_ins):
+    lock = threading.Lock()
+    active = []
+    peak = []
+    factory = stand_ins
+
+    def counting(host):
+        with lock:
+            active.append(host)
+            peak.append(len(active))
+        try:
+            return factory(host)
+        finally:
+            with lock:
+                active.remove(host)
+    stand_ins.delays.update((host, 0.05) for host in HOSTS)
+    fleet = collector(aik_blob, counting, workers=2)
+    assert len(list(fleet.collect(b'nonce'))) == 3
+    assert max(peak) == 2
@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pytss import instrumentation, interface, tspi_exceptions
+from pytss.instrumentation import LatencyHistogram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SESSION = '''
+import json
+import pytss
+from pytss import instrumentation
+
+context = pytss.TspiContext()
+context.connect()
+context.get_tpm_object().get_random(16)
+print(json.dumps(instrumentation.snapshot()))
+'''
+
+
+@pytest.fixture
+def instrumented():
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+
+
+def test_histogram():
+    histogram = LatencyHistogram(precision=5)
+    for value in range(1, 10001):
+        histogram.record(value)
+    assert histogram.count == 10000
+    assert (histogram.min, histogram.max) == (1, 10000)
+    for pct in (50, 90, 99, 100):
+        # Within 2**-5 of the true value
+        assert abs(histogram.percentile(pct) - pct * 100) <= pct * 100 / 32
+    assert len(histogram.buckets) < 300
+    summary = histogram.to_dict()
+    assert summary['mean'] == 5000.5
+    assert summary['p999'] <= 10000
+    assert LatencyHistogram().percentile(50) is None
+
+
+def test_call_counts(tpm, instrumented):
+    for i in range(3):
+        tpm.get_random(8)
+    with pytest.raises(tspi_exceptions.TPM_E_BADINDEX):
+        tpm.read_pcr(99)
+    stats = instrumentation.snapshot()
+    random = stats['Tspi_TPM_GetRandom']
+    assert random['calls'] == 3
+    assert random['errors'] == {}
+    assert random['latency_ns']['count'] == 3
+    assert 0 < random['latency_ns']['min'] <= random['latency_ns']['p50']
+    assert stats['Tspi_TPM_PcrRead']['errors'] == {'TPM_E_BADINDEX': 1}
+
+    instrumentation.reset()
+    assert instrumentation.snapshot() == {}
+
+
+def test_hook_is_removed(tpm):
+    hooks = interface._call_hooks
+    instrumentation.enable()
+    instrumentation.enable()
+    assert len(interface._call_hooks) == len(hooks) + 1
+    assert instrumentation.is_enabled()
+    instrumentation.disable()
+    assert interface._call_hooks == hooks
+    assert not instrumentation.is_enabled()
+    tpm.get_random(8)
+    assert instrumentation.snapshot() == {}
+    instrumentation.disable()
+
+
+def test_environment():
+    environ = dict(os.environ, PYTHONPATH=ROOT, PYTSS_INSTRUMENT='1')
+    environ.pop('PYTSS_RECORD', None)
+    ran = subprocess.run([sys.executable, '-c', SESSION], env=environ,
+                         cwd=ROOT, capture_output=True, text=True)
+    assert ran.returncode == 0, ran.stderr
+    stats = json.loads(ran.stdout)
+    assert stats['Tspi_TPM_GetRandom']['calls'] == 1
+    assert stats['Tspi_Context_Connect']['calls'] == 1
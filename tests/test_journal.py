@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+from pytss.journal import (EXTEND, ExtendJournal, JournalError,
+                           iter_records, verify_journal)
+
+PCR = 16
+
+
+@pytest.fixture
+def path(tmpdir):
+    return os.path.join(str(tmpdir), 'journal')
+
+
+def test_resume(tpm, path):
+    journal = ExtendJournal(tpm, PCR, path, every=4)
+    for i in range(10):
+        journal.append(b'event %d' % i)
+    journal.close()
+
+    replay = verify_journal(path, tpm.read_pcr(PCR))
+    assert replay.events == 10
+    assert replay.pending == 0
+
+    journal = ExtendJournal(tpm, PCR, path, every=4)
+    assert journal.events == 10
+    journal.append(b'event 10')
+    journal.close()
+    assert verify_journal(path, tpm.read_pcr(PCR)).events == 11
+
+
+def test_unanchored_events_are_pending(tpm, path):
+    journal = ExtendJournal(tpm, PCR, path, every=4)
+    for i in range(6):
+        journal.append(b'event %d' % i)
+    journal.fp.flush()
+    replay = verify_journal(path, tpm.read_pcr(PCR))
+    assert replay.anchored == 4
+    assert replay.pending == 2
+    journal.close()
+
+
+def test_crash_before_extend_is_repaired(tpm, path, monkeypatch):
+    journal = ExtendJournal(tpm, PCR, path, every=100)
+    journal.append(b'event')
+
+    # Die after the EXTEND record is written but before the TPM sees it
+    def crash(*args):
+        raise SystemExit
+    monkeypatch.setattr(tpm, 'extend_pcr', crash)
+    with pytest.raises(SystemExit):
+        journal.checkpoint()
+    journal.fp.close()
+    monkeypatch.undo()
+
+    replay = verify_journal(path, tpm.read_pcr(PCR))
+    assert replay.pending == 1
+
+    journal = ExtendJournal(tpm, PCR, path)
+    assert journal.pending == 0
+    journal.close()
+    replay = verify_journal(path, tpm.read_pcr(PCR))
+    assert replay.anchored == 1
+    assert replay.pending == 0
+
+
+def test_torn_record_is_dropped(tpm, path):
+    journal = ExtendJournal(tpm, PCR, path, every=100)
+    journal.append(b'event')
+    journal.close()
+    with open(path, 'ab') as fp:
+        fp.write(b'\x02\x00\x00\x01\x00partial')
+
+    journal = ExtendJournal(tpm, PCR, path)
+    assert journal.events == 1
+    journal.close()
+    assert verify_journal(path, tpm.read_pcr(PCR)).events == 1
+
+
+def test_failed_extend_is_retried(tpm, path, monkeypatch):
+    journal = ExtendJournal(tpm, PCR, path, every=100)
+    journal.append(b'event 0')
+
+    def busy(*args):
+        raise RuntimeError("busy")
+    monkeypatch.setattr(tpm, 'extend_pcr', busy)
+    with pytest.raises(RuntimeError):
+        journal.checkpoint()
+    journal.append(b'event 1')
+    with pytest.raises(RuntimeError):
+        journal.checkpoint()
+    monkeypatch.undo()
+
+    assert verify_journal(path, tpm.read_pcr(PCR)) is not None
+    journal.close()
+    with open(path, 'rb') as fp:
+        extends = [payload for offset, rtype, payload in iter_records(fp)
+                   if rtype == EXTEND]
+    # The failed extension was retried rather than journaled again
+    assert len(extends) == 2
+    replay = verify_journal(path, tpm.read_pcr(PCR))
+    assert replay.anchored == 2
+    assert replay.pending == 0
+
+
+def test_foreign_extend_is_detected(tpm, path):
+    journal = ExtendJournal(tpm, PCR, path, every=1)
+    journal.append(b'event')
+    journal.close()
+    tpm.extend_pcr(PCR, b'not in the journal', None)
+    assert verify_journal(path, tpm.read_pcr(PCR)) is None
+    with pytest.raises(JournalError):
+        ExtendJournal(tpm, PCR, path)
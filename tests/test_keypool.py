@@ -0,0 +1,252 @@
+import hashlib
+import os
+import stat
+import threading
+import time
+
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, utils
+
+from pytss import TspiKey, attestationutils, keypool
+from pytss.keypool import AikPool, KeyPregenPool
+from pytss.tspi_defines import (TSS_KEY_NO_AUTHORIZATION, TSS_KEY_SIZE_1024,
+                                TSS_KEY_TYPE_BIND, TSS_KEY_TYPE_SIGNING,
+                                TSS_PCRS_STRUCT_INFO)
+
+SIGNING = (TSS_KEY_TYPE_SIGNING, TSS_KEY_SIZE_1024)
+BIND = (TSS_KEY_TYPE_BIND, TSS_KEY_SIZE_1024)
+
+
+def wait_until(predicate):
+    deadline = time.time() + 10
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def pool_factory(srk):
+    pools = []
+
+    def factory(kinds=(SIGNING,), **kwargs):
+        pool = KeyPregenPool(srk, kinds, flags=TSS_KEY_NO_AUTHORIZATION,
+                             idle_delay=0.01, **kwargs)
+        pools.append(pool)
+        return pool
+    yield factory
+    for pool in pools:
+        pool.close()
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def loads(context, srk, blob):
+    key = context.load_key_by_blob(srk, blob)
+    return key.get_pubkey()
+
+
+def test_refill(context, srk, pool_factory):
+    pool = pool_factory((SIGNING, BIND), target=2)
+    wait_until(lambda: pool.available(*SIGNING) == 2 and
+               pool.available(*BIND) == 2)
+
+    blobs = [pool.get(*SIGNING) for _ in range(3)]
+    # The third was generated on demand
+    assert len(set(bytes(blob) for blob in blobs)) == 3
+    for blob in blobs:
+        assert loads(context, srk, blob)
+    wait_until(lambda: pool.available(*SIGNING) == 2)
+    assert pool.available(*BIND) == 2
+    with pytest.raises(KeyError):
+        pool.get(TSS_KEY_TYPE_SIGNING, 0)
+
+
+def test_busy_tpm_is_left_alone(pool_factory):
+    lock = threading.Lock()
+    with lock:
+        pool = pool_factory(target=1, lock=lock)
+        time.sleep(0.1)
+        assert pool.available(*SIGNING) == 0
+    wait_until(lambda: pool.available(*SIGNING) == 1)
+
+
+def test_persisted_blobs(context, srk, pool_factory, tmpdir):
+    directory = os.path.join(str(tmpdir), 'pool')
+    pool = pool_factory(target=2, directory=directory)
+    wait_until(lambda: pool.available(*SIGNING) == 2)
+    pool.close()
+
+    kind_dir = os.path.join(directory, '%08x-%08x' % SIGNING)
+    names = sorted(os.listdir(kind_dir))
+    assert len(names) == 2
+    assert stat.S_IMODE(os.stat(kind_dir).st_mode) == 0o700
+    for name in names:
+        assert name.endswith('.blob')
+        path = os.path.join(kind_dir, name)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    stored = set(read(os.path.join(kind_dir, name)) for name in names)
+
+    # A new pool claims the stored blobs and hands each out once
+    pool = pool_factory(target=2, directory=directory)
+    blob = bytes(pool.get(*SIGNING))
+    assert blob in stored
+    assert loads(context, srk, blob)
+    wait_until(lambda: pool.available(*SIGNING) == 2)
+    pool.close()
+    names = os.listdir(kind_dir)
+    assert len(names) == 2
+    assert blob not in [read(os.path.join(kind_dir, name)) for name in names]
+
+
+def test_close(pool_factory):
+    pool = pool_factory(target=1)
+    pool.close()
+    assert not pool.thread.is_alive()
+    # Keys can still be generated on demand
+    assert pool.get(*SIGNING)
+
+
+def test_error_is_reported(srk, pool_factory, monkeypatch):
+    create = TspiKey.create
+    failures = []
+
+    def flaky(*args, **kwargs):
+        if len(failures) < 2:
+            failures.append(RuntimeError("TPM failure"))
+            raise failures[-1]
+        return create(*args, **kwargs)
+    monkeypatch.setattr(TspiKey, 'create', flaky)
+    monkeypatch.setattr(keypool, 'MAX_ERROR_DELAY', 0.05)
+    pool = pool_factory(target=1)
+    wait_until(lambda: pool.available(*SIGNING) == 1)
+    # The refill thread backed off and carried on
+    assert pool.errors == 2
+    assert pool.error is failures[-1]
+    assert pool.get(*SIGNING)
+
+
+def test_stale_files_are_removed(pool_factory, tmpdir):
+    directory = os.path.join(str(tmpdir), 'pool')
+    kind_dir = os.path.join(directory, '%08x-%08x' % SIGNING)
+    os.makedirs(kind_dir)
+    names = ['old.tmp', 'old.blob.1234.taken', 'new.tmp']
+    for name in names:
+        open(os.path.join(kind_dir, name), 'wb').close()
+    old = time.time() - keypool.STALE_AGE - 1
+    for name in names[:2]:
+        os.utime(os.path.join(kind_dir, name), (old, old))
+
+    pool = pool_factory(target=0, low_water=0, directory=directory)
+    assert pool.available(*SIGNING) == 0
+    # A recent file may still be in use by another process
+    assert os.listdir(kind_dir) == ['new.tmp']
+
+
+def test_low_water(pool_factory):
+    pool = pool_factory(target=3, low_water=1)
+    wait_until(lambda: pool.available(*SIGNING) == 3)
+    pool.get(*SIGNING)
+    pool.get(*SIGNING)
+    time.sleep(0.1)
+    assert pool.available(*SIGNING) == 1
+    pool.get(*SIGNING)
+    wait_until(lambda: pool.available(*SIGNING) == 3)
+
+
+@pytest.fixture
+def aik_pool_factory(context, owner):
+    pools = []
+
+    def factory(**kwargs):
+        pool = AikPool(context, idle_delay=0.01, **kwargs)
+        pools.append(pool)
+        return pool
+    yield factory
+    for pool in pools:
+        pool.close()
+
+
+def test_aik_pool(context, srk, tpm, aik_pool_factory, monkeypatch):
+    prepared = []
+    prepare_aik = attestationutils.prepare_aik
+
+    def counting_prepare_aik(context):
+        prepared.append(context)
+        return prepare_aik(context)
+    monkeypatch.setattr(attestationutils, 'prepare_aik',
+                        counting_prepare_aik)
+
+    pool = aik_pool_factory(target=2)
+    wait_until(lambda: pool.available() == 2)
+    pubkey, blob = pool.get()
+    assert pool.get()[1] != blob
+    wait_until(lambda: pool.available() == 2)
+    # The SRK, policies and CA key are only set up once
+    assert len(prepared) == 1
+
+    aik = context.load_key_by_blob(srk, blob)
+    assert aik.get_pubkeyblob() == pubkey
+    pcrs = context.create_pcrs(TSS_PCRS_STRUCT_INFO)
+    pcrs.set_pcrs([0])
+    data, validation = tpm.get_quote(aik, pcrs, b'nonce')
+    modulus = int.from_bytes(bytes(aik.get_pubkey()), 'big')
+    rsa.RSAPublicNumbers(65537, modulus).public_key().verify(
+        bytes(validation), hashlib.sha1(data).digest(), padding.PKCS1v15(),
+        utils.Prehashed(hashes.SHA1()))
+
+
+def test_aik_pool_on_disk(aik_pool_factory, tmpdir):
+    directory = os.path.join(str(tmpdir), 'aiks')
+    pool = aik_pool_factory(target=2, directory=directory)
+    wait_until(lambda: pool.available() == 2)
+    pool.close()
+    stored = os.listdir(os.path.join(directory, 'aik'))
+    assert len(stored) == 2
+
+    # Stored keys are consumed by the pool that hands them out
+    pool = aik_pool_factory(target=0, low_water=0, directory=directory)
+    assert pool.available() == 2
+    claimed = [pool.get(), pool.get()]
+    assert claimed[0] != claimed[1]
+    assert os.listdir(os.path.join(directory, 'aik')) == []
+    pool = aik_pool_factory(target=0, low_water=0, directory=directory)
+    assert pool.available() == 0
+
+
+def test_aik_pools_share_a_directory(aik_pool_factory, tmpdir):
+    directory = os.path.join(str(tmpdir), 'aiks')
+    pool = aik_pool_factory(target=4, directory=directory)
+    wait_until(lambda: pool.available() == 4)
+    pool.close()
+
+    # Two pools, standing in for two processes, race for the stored keys
+    pools = [aik_pool_factory(target=0, low_water=0, directory=directory)
+             for _ in range(2)]
+    assert [p.available() for p in pools] == [4, 4]
+    claimed = []
+    start = threading.Barrier(len(pools))
+
+    def claim(pool):
+        start.wait()
+        for _ in range(2):
+            claimed.append(pool.get()[1])
+    threads = [threading.Thread(target=claim, args=(pool,))
+               for pool in pools]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed) == 4
+    assert len(set(bytes(blob) for blob in claimed)) == 4
+    assert os.listdir(os.path.join(directory, 'aik')) == []
+
+
+def test_pools_must_generate():
+    class Pool(keypool._PregenPool):
+        pass
+    with pytest.raises(TypeError):
+        Pool([SIGNING], 1, None, None, 0.01, None)
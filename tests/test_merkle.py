@@ -0,0 +1,37 @@
+import pytest
+
+from pytss import merkle
+
+
+@pytest.mark.parametrize('size', range(1, 12))
+@pytest.mark.parametrize('hash_name', ['sha256', 'sha1'])
+def test_proofs(size, hash_name):
+    items = [b'item %d' % i for i in range(size)]
+    tree = merkle.MerkleTree(items, hash_name)
+    for index, proof in enumerate(tree.proofs()):
+        assert merkle.verify_proof(items[index], proof, tree.root)
+        encoded = merkle.encode_proof(proof)
+        assert merkle.decode_proof(encoded) == proof
+        for other in range(size):
+            if other != index:
+                assert not merkle.verify_proof(items[other], proof,
+                                               tree.root)
+        assert not merkle.verify_proof(b'not an item', proof, tree.root)
+
+
+def test_wrong_root():
+    tree = merkle.MerkleTree([b'a', b'b', b'c'])
+    other = merkle.MerkleTree([b'a', b'b', b'd'])
+    assert not merkle.verify_proof(b'a', tree.proof(0), other.root)
+
+
+def test_single_leaf_root():
+    assert merkle.MerkleTree([b'a']).root == merkle.leaf_hash(b'a')
+
+
+def test_decode_rejects_garbage():
+    with pytest.raises(ValueError):
+        merkle.decode_proof(b'\xff')
+    proof = merkle.encode_proof(merkle.MerkleTree([b'a', b'b']).proof(0))
+    with pytest.raises(ValueError):
+        merkle.decode_proof(proof[:-1])
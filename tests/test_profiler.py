@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pytss import TspiKey, interface, profiler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SESSION = '''
+import json
+import uuid
+import pytss
+from pytss import profiler
+from pytss.tspi_defines import *
+
+context = pytss.TspiContext()
+context.connect()
+srk = context.load_key_by_uuid(
+    TSS_PS_TYPE_SYSTEM, uuid.UUID('{00000000-0000-0000-0000-000000000001}'))
+policy = srk.get_policy_object(TSS_POLICY_USAGE)
+policy.set_secret(TSS_SECRET_MODE_SHA1, bytearray(20))
+srk.unseal(srk.seal(b'secret'))
+print(json.dumps(list(profiler.snapshot().values())))
+print(profiler.collapsed_stacks())
+'''
+
+
+@pytest.fixture
+def profiling():
+    profiler.enable()
+    yield
+    profiler.disable()
+
+
+def test_environment():
+    environ = dict(os.environ, PYTHONPATH=ROOT, PYTSS_PROFILE='1')
+    environ.pop('PYTSS_RECORD', None)
+    ran = subprocess.run([sys.executable, '-c', SESSION], env=environ,
+                         cwd=ROOT, capture_output=True, text=True)
+    assert ran.returncode == 0, ran.stderr
+    snapshot, stacks = ran.stdout.split('\n', 1)
+    methods, = json.loads(snapshot)
+    assert methods['TspiKey.seal']['calls'] == 1
+    assert methods['TspiKey.unseal']['calls'] == 1
+    paths = [line.rsplit(' ', 1)[0] for line in stacks.split()]
+    assert 'TspiKey.seal;Tspi_Data_Seal' in paths
+    assert 'TspiKey.seal;[python]' in paths
+    assert 'TspiKey.unseal;Tspi_Data_Unseal' in paths
+
+
+def test_native_time_is_attributed(srk, profiling, monkeypatch):
+    if interface.BACKEND != 'soft':
+        pytest.skip("needs the soft backend")
+    monkeypatch.setitem(interface._lib.tpm.latency, 'Tspi_Data_Seal', 0.05)
+    srk.seal(b'secret')
+    stats = profiler.snapshot()[srk.context]['TspiKey.seal']
+    assert stats['calls'] == 1
+    assert stats['native'] >= 0.05
+    assert stats['python'] < stats['native']
+    assert stats['total'] >= stats['native'] + stats['python'] - 1e-6
+    report = profiler.report()
+    assert 'TspiKey.seal' in report.splitlines()[1]
+
+
+def test_disabled(srk, monkeypatch):
+    assert not profiler.is_enabled()
+
+    def fail(*args):
+        raise AssertionError("profiled while disabled")
+    monkeypatch.setattr(profiler.Profiler, 'run', fail)
+    assert bytes(srk.unseal(srk.seal(b'secret'))) == b'secret'
+    assert profiler.snapshot() == {}
+    assert profiler.collapsed_stacks() == ''
+    assert TspiKey.seal.__name__ == 'seal'
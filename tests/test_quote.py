@@ -0,0 +1,46 @@
+import hashlib
+
+import pytest
+
+from pytss import merkle
+from pytss.attestationutils import pkcs1_verify, quote_answers
+from pytss.tspi_defines import TSS_PCRS_STRUCT_INFO
+
+
+@pytest.fixture
+def pcrs(context):
+    pcrs = context.create_pcrs(TSS_PCRS_STRUCT_INFO)
+    pcrs.set_pcrs([0, 1])
+    return pcrs
+
+
+def test_quote_answers(tpm, aik, pcrs):
+    data, validation = tpm.get_quote(aik, pcrs, b'nonce')
+    assert quote_answers(data, b'nonce')
+    assert not quote_answers(data, b'other')
+
+
+def test_quote_multi(tpm, aik, pcrs):
+    nonces = [b'nonce %d' % i for i in range(5)]
+    data, validation, proofs = tpm.get_quote_multi(aik, pcrs, nonces)
+    assert pkcs1_verify(hashlib.sha1(data).digest(), validation,
+                        aik.get_pubkey())
+    assert len(proofs) == len(nonces)
+    for nonce, proof in zip(nonces, proofs):
+        assert quote_answers(data, nonce, proof)
+        assert quote_answers(data, nonce, merkle.encode_proof(proof))
+        assert not quote_answers(data, b'other', proof)
+        assert not quote_answers(data, nonce)
+    assert not quote_answers(data, nonces[0], proofs[1])
+    assert not quote_answers(data, nonces[0], b'garbage')
+
+
+def test_quote_answers_pins_the_hash(tpm, aik, pcrs):
+    nonces = [b'nonce %d' % i for i in range(3)]
+    tree = merkle.MerkleTree(nonces, 'sha1')
+    data, validation = tpm.get_quote(aik, pcrs, tree.root)
+    proof = tree.proofs()[0]
+    # A prover may not swap in another tree hash
+    assert not quote_answers(data, nonces[0], proof)
+    assert not quote_answers(data, nonces[0], merkle.encode_proof(proof))
+    assert quote_answers(data, nonces[0], proof, hash_name='sha1')
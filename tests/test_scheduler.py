@@ -0,0 +1,149 @@
+import gc
+import threading
+import time
+
+import pytest
+
+import pytss
+from pytss import scheduler as sched
+
+
+@pytest.fixture
+def scheduler(context):
+    scheduler = sched.TpmScheduler(context, aging=None)
+    yield scheduler
+    scheduler.close()
+
+
+def wait_for_depth(scheduler, depth):
+    deadline = time.time() + 5
+    while scheduler.depth < depth:
+        assert time.time() < deadline
+        time.sleep(0.001)
+
+
+class Holder(object):
+    """Hold the TPM from another thread until released"""
+
+    def __init__(self, scheduler):
+        self.held = threading.Event()
+        self.release = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(scheduler,))
+        self.thread.start()
+        self.held.wait()
+
+    def _run(self, scheduler):
+        with scheduler.slot(sched.BACKGROUND):
+            self.held.set()
+            self.release.wait()
+
+    def join(self):
+        self.release.set()
+        self.thread.join()
+
+
+def queue_calls(scheduler, tpm, calls, order):
+    threads = []
+
+    def call(name, priority):
+        try:
+            with scheduler.priority(priority):
+                tpm.get_random(4)
+            order.append(name)
+        except sched.Cancelled:
+            order.append(name + ' cancelled')
+
+    for depth, (name, priority) in enumerate(calls, 1):
+        thread = threading.Thread(target=call, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        wait_for_depth(scheduler, depth)
+    return threads
+
+
+def test_priority_order(context, scheduler):
+    order = []
+    holder = Holder(scheduler)
+    threads = queue_calls(scheduler, context.get_tpm_object(), [
+        ('background 1', sched.BACKGROUND),
+        ('normal', sched.NORMAL),
+        ('background 2', sched.BACKGROUND),
+        ('interactive', sched.INTERACTIVE),
+    ], order)
+    holder.join()
+    for thread in threads:
+        thread.join()
+    assert order == ['interactive', 'normal', 'background 1',
+                     'background 2']
+    stats = scheduler.stats()
+    assert stats['background'].granted == 3
+    assert stats['background'].max_queued == 2
+    assert stats['interactive'].queued == 0
+
+
+def test_cancellation(context, scheduler):
+    order = []
+    holder = Holder(scheduler)
+    threads = queue_calls(scheduler, context.get_tpm_object(), [
+        ('background', sched.BACKGROUND),
+        ('normal', sched.NORMAL),
+    ], order)
+    assert not scheduler.lock().acquire(False)
+    assert scheduler.cancel(sched.BACKGROUND) == 1
+    holder.join()
+    for thread in threads:
+        thread.join()
+    assert sorted(order) == ['background cancelled', 'normal']
+    assert scheduler.stats()['background'].cancelled == 1
+
+
+def test_aging(context, scheduler):
+    scheduler.aging = 0.05
+    order = []
+    holder = Holder(scheduler)
+    tpm = context.get_tpm_object()
+    threads = queue_calls(scheduler, tpm, [('old', sched.BACKGROUND)],
+                          order)
+    time.sleep(0.2)
+    threads += queue_calls(scheduler, tpm, [('new', sched.INTERACTIVE)],
+                           order)
+    holder.join()
+    for thread in threads:
+        thread.join()
+    assert order == ['old', 'new']
+
+
+def test_nested_calls(context, scheduler):
+    lock = scheduler.lock(sched.BACKGROUND)
+    with lock:
+        # Scheduled methods called while holding the TPM do not queue
+        context.get_tpm_object().get_random(4)
+        assert scheduler.depth == 0
+    assert lock.acquire(False)
+    lock.release()
+
+
+def test_detached_with_context():
+    context = pytss.TspiContext()
+    context.connect()
+    handle = context.context
+    sched.TpmScheduler(context)
+    assert sched.get_scheduler(handle) is not None
+    del context
+    gc.collect()
+    assert sched.get_scheduler(handle) is None
+
+
+def test_bulk_seal_is_scheduled(srk, scheduler):
+    blobs = list(srk.seal_many([b'a', b'b']))
+    assert scheduler.stats()['normal'].granted == 2
+    unsealed = srk.unseal_many(blobs)
+    assert bytes(next(unsealed)) == b'a'
+    # The TPM is not held between items
+    assert scheduler.lock().acquire(False)
+    scheduler.lock().release()
+    assert bytes(next(unsealed)) == b'b'
+    # Unsealing runs at the same priority as unseal
+    stats = scheduler.stats()
+    assert stats['interactive'].granted == 2
+    assert stats['normal'].granted == 2
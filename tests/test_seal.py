@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from pytss import TspiObject, tspi_exceptions
+from pytss.interface import tss_lib
+
+SECRETS = [b'a', b'secret' * 20, os.urandom(32)]
+
+
+def test_round_trip(srk):
+    blobs = list(srk.seal_many(iter(SECRETS)))
+    assert len(set(bytes(blob) for blob in blobs)) == len(SECRETS)
+    assert [bytes(data) for data in srk.unseal_many(blobs)] == SECRETS
+    # Each blob is also a plain sealed blob
+    assert bytes(srk.unseal(blobs[1])) == SECRETS[1]
+    assert list(srk.unseal_many([])) == []
+
+
+def test_pcr_bound(tpm, srk):
+    blobs = list(srk.seal_many(SECRETS, pcrs=[16]))
+    assert [bytes(data) for data in srk.unseal_many(blobs)] == SECRETS
+    tpm.extend_pcr(16, b'change', None)
+    with pytest.raises(tspi_exceptions.TPM_E_WRONGPCRVAL):
+        next(srk.unseal_many(blobs))
+
+
+def test_abandoned_generators_close_objects(srk, monkeypatch):
+    closed = []
+    close = TspiObject.close
+
+    def recording_close(self):
+        closed.append((type(self), self.get_handle()))
+        close(self)
+    monkeypatch.setattr(TspiObject, 'close', recording_close)
+
+    sealing = srk.seal_many(SECRETS, pcrs=[16])
+    blob = next(sealing)
+    sealing.close()
+    assert sorted(cls.__name__ for cls, handle in closed) == \
+        ['TspiObject', 'TspiPCRs']
+
+    unsealing = srk.unseal_many([blob, blob])
+    assert bytes(next(unsealing)) == SECRETS[0]
+    unsealing.close()
+    assert closed[-1][0] is TspiObject
+    assert len(closed) == 3
+
+    # The TSS objects are really gone
+    for cls, handle in closed:
+        with pytest.raises(tspi_exceptions.TSS_E_INVALID_HANDLE):
+            tss_lib.Tspi_Context_CloseObject(srk.context, handle)
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import struct
+import time
+
+import pytest
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import padding as sympadding
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, utils
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+import pytss
+from pytss import interface, softtpm, tspi_exceptions
+from pytss.interface import ffi, tss_lib
+
+pytestmark = pytest.mark.skipif(interface.BACKEND != 'soft',
+                                reason="tests the soft backend")
+
+# SHA1(SHA1(b'abc')) extended into an all-zero and an all-ones PCR
+EXTENDED_ZERO = 'ccd5bd41458de644ac34a2478b58ff819bef5acf'
+EXTENDED_ONES = 'ae35e3f58643103fd12ebc93d00d8fd413237072'
+
+TCPA_OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA1()),
+                         algorithm=hashes.SHA1(), label=b'TCPA')
+
+NV_INDEX = 0x00011000
+
+
+def sha1(*parts):
+    return hashlib.sha1(b''.join(bytes(part) for part in parts)).digest()
+
+
+def public_key(modulus):
+    return rsa.RSAPublicNumbers(
+        65537, int.from_bytes(bytes(modulus), 'big')).public_key()
+
+
+def create_key(context, srk, flags):
+    key = context.create_rsa_key(flags)
+    tss_lib.Tspi_Key_CreateKey(key.get_handle(), srk.get_handle(), 0)
+    tss_lib.Tspi_Key_LoadKey(key.get_handle(), srk.get_handle())
+    return key
+
+
+def test_reset_values():
+    tpm = softtpm.SoftTPM(owned=False)
+    assert tpm.pcrs[0] == b'\x00' * 20
+    assert tpm.pcrs[17] == b'\xff' * 20
+    assert tpm.pcrs[23] == b'\x00' * 20
+    assert tpm.extend(0, sha1(b'abc')).hex() == EXTENDED_ZERO
+    assert tpm.extend(17, sha1(b'abc')).hex() == EXTENDED_ONES
+
+
+def test_extend(tpm):
+    before = tpm.read_pcr(16)
+    after = tpm.extend_pcr(16, b'data', None)
+    assert bytes(after) == sha1(before, sha1(b'data'))
+    assert tpm.read_pcr(16) == after
+    with pytest.raises(tspi_exceptions.TPM_E_BADINDEX):
+        tpm.read_pcr(pytss.NUM_PCRS)
+
+
+def test_seal(srk, tpm):
+    assert srk.unseal(srk.seal(b'secret')) == b'secret'
+
+    blob = srk.seal(b'bound to PCR 16', [16])
+    assert srk.unseal(blob) == b'bound to PCR 16'
+    tpm.extend_pcr(16, b'change', None)
+    with pytest.raises(tspi_exceptions.TPM_E_WRONGPCRVAL):
+        srk.unseal(blob)
+
+    blob = srk.seal(b'secret')
+    blob[-1] ^= 1
+    with pytest.raises(tspi_exceptions.TPM_E_DECRYPT_ERROR):
+        srk.unseal(blob)
+
+
+def test_bind(context, srk):
+    flags = (tss_lib.TSS_KEY_TYPE_BIND | tss_lib.TSS_KEY_SIZE_2048 |
+             tss_lib.TSS_KEY_NO_AUTHORIZATION)
+    key = create_key(context, srk, flags)
+    assert key.unbind(key.bind(b'secret')) == b'secret'
+
+    # A TPM_BOUND_DATA encrypted with the TCPA flavour of OAEP
+    blob = public_key(key.get_pubkey()).encrypt(
+        b'\x01\x01\x00\x00\x02secret', TCPA_OAEP)
+    assert key.unbind(bytearray(blob)) == b'secret'
+
+    other = create_key(context, srk, flags)
+    with pytest.raises(tspi_exceptions.TPM_E_DECRYPT_ERROR):
+        other.unbind(key.bind(b'secret'))
+
+
+def test_quote(context, tpm, aik):
+    pcrs = context.create_pcrs(tss_lib.TSS_PCRS_STRUCT_INFO)
+    pcrs.set_pcrs([0, 16])
+    data, validation = tpm.get_quote(aik, pcrs, b'nonce')
+
+    # pcrSelect is padded to 32 bits, as quote_verify expects
+    composite = (struct.pack('!H4sI', 4, b'\x01\x00\x01\x00', 40) +
+                 tpm.read_pcr(0) + tpm.read_pcr(16))
+    assert bytes(data) == (b'\x01\x01\x00\x00QUOT' + sha1(composite) +
+                           sha1(b'nonce'))
+    key = public_key(aik.get_pubkey())
+    key.verify(bytes(validation), sha1(data), padding.PKCS1v15(),
+               utils.Prehashed(hashes.SHA1()))
+    validation[-1] ^= 1
+    with pytest.raises(InvalidSignature):
+        key.verify(bytes(validation), sha1(data), padding.PKCS1v15(),
+                   utils.Prehashed(hashes.SHA1()))
+
+
+def test_nv(context, owner):
+    nv = context.create_nv(0)
+    nv.set_index(NV_INDEX)
+    nv.set_attribute_uint32(tss_lib.TSS_TSPATTRIB_NV_PERMISSIONS, 0,
+                            tss_lib.TPM_NV_PER_OWNERREAD |
+                            tss_lib.TPM_NV_PER_OWNERWRITE)
+    nv.set_attribute_uint32(tss_lib.TSS_TSPATTRIB_NV_DATASIZE, 0, 16)
+    tss_lib.Tspi_NV_DefineSpace(nv.get_handle(), 0, 0)
+    try:
+        assert nv.read_value(0, 16) == b'\xff' * 16
+        tss_lib.Tspi_NV_WriteValue(nv.get_handle(), 4, 4,
+                                   ffi.new('BYTE[]', b'data'))
+        assert nv.read_value(0, 16) == b'\xff' * 4 + b'data' + b'\xff' * 8
+        with pytest.raises(tspi_exceptions.TPM_E_NOSPACE):
+            nv.read_value(8, 16)
+    finally:
+        tss_lib.Tspi_NV_ReleaseSpace(nv.get_handle())
+    with pytest.raises(tspi_exceptions.TPM_E_BADINDEX):
+        nv.read_value(0, 1)
+
+
+def test_ekcert_nv(context, owner):
+    nv = context.create_nv(0)
+    nv.set_index(tss_lib.TSS_NV_DEFINED | tss_lib.TPM_NV_INDEX_EKCert)
+    header = nv.read_value(0, 7)
+    tag, certtype, size, certtag = struct.unpack('!HBHH', bytes(header))
+    assert (tag, certtype, certtag) == (0x1001, 0, 0x1002)
+    assert nv.read_value(7, 1) == b'\x30'
+
+
+def test_ticks(tpm):
+    def read_ticks():
+        ticks = ffi.new('TPM_CURRENT_TICKS *')
+        tss_lib.Tspi_TPM_ReadCurrentTicks(tpm.get_handle(), ticks)
+        return (ticks.tag, ticks.currentTicks, ticks.tickRate,
+                bytes(ffi.buffer(ticks.tickNonce.nonce, 20)))
+
+    tag, first, rate, nonce = read_ticks()
+    assert (tag, rate) == (0x0014, 1)
+    time.sleep(0.01)
+    tag, second, rate, same_nonce = read_ticks()
+    assert second - first >= 10000
+    assert same_nonce == nonce
+
+
+def test_tickstamp(context, tpm, aik):
+    digest = context.create_hash(tss_lib.TSS_HASH_SHA1)
+    digest.update(b'blob')
+    ticks, data, signature = digest.tickstamp(aik, b'nonce')
+
+    current = ffi.new('TPM_CURRENT_TICKS *')
+    tss_lib.Tspi_TPM_ReadCurrentTicks(tpm.get_handle(), current)
+    header = struct.pack('!HQH', 0x0014, ticks.current_ticks, 1)
+    stamped = (sha1(b'blob') + header +
+               bytes(ffi.buffer(current.tickNonce.nonce, 20)))
+    assert bytes(data) == (b'\x00\x05TSTP' + sha1(b'nonce') +
+                           struct.pack('!I', 52) + stamped)
+    assert ticks.current_ticks <= current.currentTicks
+    public_key(aik.get_pubkey()).verify(
+        bytes(signature), sha1(data), padding.PKCS1v15(),
+        utils.Prehashed(hashes.SHA1()))
+
+    empty = context.create_hash(tss_lib.TSS_HASH_SHA1)
+    with pytest.raises(tspi_exceptions.TSS_E_HASH_NO_DATA):
+        empty.tickstamp(aik)
+
+
+def test_counter(tpm):
+    def read_counter():
+        value = ffi.new('UINT32 *')
+        tss_lib.Tspi_TPM_ReadCounter(tpm.get_handle(), value)
+        return value[0]
+
+    start = read_counter()
+    assert interface._lib.tpm.increment_counter() == start + 1
+    assert read_counter() == start + 1
+    # The counter survives a reset, unlike the PCRs
+    interface._lib.tpm.reset()
+    assert read_counter() == start + 1
+
+
+def test_activate_identity(owner, aik):
+    ek = public_key(owner.get_pub_endorsement_key().get_pubkey())
+    sessionkey = os.urandom(16)
+    iv = os.urandom(16)
+
+    # TPM_ASYM_CA_CONTENTS: the session key and the AIK's digest
+    asym = ek.encrypt(
+        struct.pack('!IHH', tss_lib.TPM_ALG_AES128,
+                    tss_lib.TPM_ES_SYM_CBC_PKCS5PAD, 16) +
+        sessionkey + sha1(aik.get_pubkeyblob()), TCPA_OAEP)
+    padder = sympadding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(sessionkey), modes.CBC(iv)).encryptor()
+    credential = encryptor.update(padder.update(b'credential') +
+                                  padder.finalize()) + encryptor.finalize()
+    # TPM_SYM_CA_ATTESTATION with the IV leading the credential
+    sym = struct.pack('!IIHHIIII', len(iv) + len(credential),
+                      tss_lib.TPM_ALG_AES128, tss_lib.TPM_ES_SYM_CBC_PKCS5PAD,
+                      tss_lib.TPM_SS_NONE, 12, 128, len(iv), 0) + \
+        iv + credential
+    assert owner.activate_identity(aik, asym, sym) == b'credential'
+
+    # Contents meant for another key are refused
+    other = ek.encrypt(
+        struct.pack('!IHH', tss_lib.TPM_ALG_AES128,
+                    tss_lib.TPM_ES_SYM_CBC_PKCS5PAD, 16) +
+        sessionkey + sha1(b'another key'), TCPA_OAEP)
+    with pytest.raises(tspi_exceptions.TPM_E_BAD_PARAMETER):
+        owner.activate_identity(aik, other, sym)
+
+
+def test_unimplemented(tpm):
+    with pytest.raises(tspi_exceptions.TSS_E_NOTIMPL):
+        tss_lib.Tspi_TPM_SelfTestFull(tpm.get_handle())
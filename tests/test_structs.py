@@ -0,0 +1,85 @@
+import binascii
+import hashlib
+
+import pytest
+
+from pytss import structs
+from pytss.structs import (TpmKey12, TpmPubKey, TpmQuoteInfo,
+                           TpmStoredData12, pcr_composite)
+from pytss.tspi_defines import TSS_PCRS_STRUCT_INFO
+
+# TPM_QUOTE_INFO with version 1.1.0.0, compositeHash 0x11... and
+# externalData 0x22...
+QUOTE_INFO = binascii.unhexlify('0101000051554f54' + '11' * 20 + '22' * 20)
+
+
+def test_abstract():
+    with pytest.raises(TypeError):
+        structs.TpmStruct(b'')
+
+    class Sizeless(structs.TpmStruct):
+        pass
+    with pytest.raises(TypeError):
+        Sizeless(b'')
+
+
+def test_pcr_composite():
+    composite = pcr_composite({0: b'\x00' * 20})
+    assert composite == binascii.unhexlify('0002010000000014') + \
+        b'\x00' * 20
+    assert hashlib.sha1(composite).hexdigest() == \
+        '4a5aee5198f6c95871b2e8d932e75376605fd1a5'
+
+    # PCRs from 16 up need the 32-bit pcrSelect
+    composite = pcr_composite({17: b'\xff' * 20, 0: b'\x00' * 20})
+    assert composite[:10] == binascii.unhexlify('00040100020000000028')
+    assert hashlib.sha1(composite).hexdigest() == \
+        'b1b7773bb53ab12b1eab5d3b9bc983a078fd6d8f'
+
+
+def test_quote_info():
+    info = TpmQuoteInfo(b'junk' + QUOTE_INFO + b'more', 4)
+    assert info.version.tobytes() == b'\x01\x01\x00\x00'
+    assert info.fixed.tobytes() == b'QUOT'
+    assert info.composite_hash.tobytes() == b'\x11' * 20
+    assert info.external_data.tobytes() == b'\x22' * 20
+    assert info.tobytes() == QUOTE_INFO
+    with pytest.raises(ValueError):
+        TpmQuoteInfo(QUOTE_INFO[:-1]).external_data
+
+
+def test_quote(context, tpm, aik):
+    pcrs = context.create_pcrs(TSS_PCRS_STRUCT_INFO)
+    pcrs.set_pcrs([0, 16])
+    data, validation = tpm.get_quote(aik, pcrs, b'nonce')
+    info = TpmQuoteInfo(data)
+    assert info.tobytes() == bytes(data)
+    composite = pcr_composite({0: tpm.read_pcr(0), 16: tpm.read_pcr(16)})
+    assert info.composite_hash.tobytes() == \
+        hashlib.sha1(composite).digest()
+    assert info.external_data.tobytes() == hashlib.sha1(b'nonce').digest()
+
+
+def test_key_blobs(aik, aik_blob):
+    key = TpmKey12(aik_blob)
+    assert key.is_key12
+    assert key.size == len(aik_blob)
+    assert key.tobytes() == bytes(aik_blob)
+    assert key.modulus.tobytes() == bytes(aik.get_pubkey())
+    assert key.algorithm_parms.rsa_parms.key_length == 2048
+    assert key.algorithm_parms.rsa_parms.exponent == 65537
+
+    pubkey = aik.get_pubkeyblob()
+    parsed = TpmPubKey(pubkey)
+    assert parsed.size == len(pubkey)
+    assert parsed.modulus.tobytes() == bytes(aik.get_pubkey())
+
+
+def test_stored_data(srk):
+    blob = srk.seal(b'secret')
+    stored = TpmStoredData12(blob)
+    assert stored.tag == structs.TPM_TAG_STORED_DATA12
+    assert stored.size == len(blob)
+    assert stored.tobytes() == bytes(blob)
+    with pytest.raises(ValueError):
+        TpmStoredData12(blob[:-1]).tobytes()
@@ -0,0 +1,46 @@
+from pytss import merkle
+from pytss.timestamp import TickStamper, TickStampService, verify_timestamp
+
+
+def test_verify_timestamp(aik):
+    records = [b'record %d' % i for i in range(5)]
+    stamps = TickStamper(aik).stamp(records, b'nonce')
+    modulus = aik.get_pubkey()
+    ticks = None
+    for record, stamp in zip(records, stamps):
+        stamped = verify_timestamp(record, stamp, modulus, nonce=b'nonce')
+        assert stamped is not None
+        ticks = ticks or stamped
+        assert stamped.current_ticks == ticks.current_ticks
+        encoded = stamp._replace(proof=merkle.encode_proof(stamp.proof))
+        assert verify_timestamp(record, encoded, modulus,
+                                nonce=b'nonce') is not None
+
+    stamp = stamps[0]
+    assert verify_timestamp(records[1], stamp, modulus, nonce=b'nonce') is None
+    assert verify_timestamp(records[0], stamp, modulus) is None
+    assert verify_timestamp(records[0], stamp._replace(proof=b'garbage'),
+                            modulus, nonce=b'nonce') is None
+    signature = bytearray(stamp.signature)
+    signature[-1] ^= 1
+    assert verify_timestamp(records[0], stamp._replace(signature=signature),
+                            modulus, nonce=b'nonce') is None
+
+
+def test_verify_timestamp_pins_the_hash(aik):
+    records = [b'record %d' % i for i in range(3)]
+    stamp = TickStamper(aik, 'sha1').stamp(records)[0]
+    modulus = aik.get_pubkey()
+    assert verify_timestamp(records[0], stamp, modulus) is None
+    assert verify_timestamp(records[0], stamp, modulus,
+                            hash_name='sha1') is not None
+
+
+def test_service(aik):
+    service = TickStampService(TickStamper(aik), interval=0.05)
+    pending = [service.submit(b'record %d' % i) for i in range(3)]
+    service.close()
+    modulus = aik.get_pubkey()
+    for i, waiting in enumerate(pending):
+        assert verify_timestamp(b'record %d' % i, waiting.result(1),
+                                modulus) is not None
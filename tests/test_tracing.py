@@ -0,0 +1,96 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pytss import tracing
+from pytss.interface import ffi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SESSION = '''
+import uuid
+import pytss
+from pytss.tspi_defines import *
+
+context = pytss.TspiContext()
+context.connect()
+tpm = context.get_tpm_object()
+srk = context.load_key_by_uuid(
+    TSS_PS_TYPE_SYSTEM, uuid.UUID('{00000000-0000-0000-0000-000000000001}'))
+policy = srk.get_policy_object(TSS_POLICY_USAGE)
+policy.set_secret(TSS_SECRET_MODE_SHA1, bytearray(20))
+print(bytes(tpm.get_random(16)).hex())
+print(bytes(tpm.extend_pcr(16, b'event', None)).hex())
+print(bytes(tpm.read_pcr(16)).hex())
+print(bytes(srk.unseal(srk.seal(b'secret'))))
+'''
+
+# The same calls with get_random moved later
+DIVERGING = SESSION.replace(
+    "print(bytes(tpm.get_random(16)).hex())\n", "").replace(
+    "print(bytes(srk.unseal", "print(bytes(tpm.get_random(16)).hex())\n"
+    "print(bytes(srk.unseal")
+
+
+def run(session, **env):
+    environ = dict(os.environ, PYTHONPATH=ROOT)
+    environ.pop('PYTSS_RECORD', None)
+    environ.update(env)
+    return subprocess.run([sys.executable, '-c', session], env=environ,
+                          cwd=ROOT, capture_output=True, text=True)
+
+
+@pytest.fixture
+def trace(tmpdir):
+    path = os.path.join(str(tmpdir), 'session.trace')
+    recorded = run(SESSION, PYTSS_BACKEND='soft', PYTSS_RECORD=path)
+    assert recorded.returncode == 0, recorded.stderr
+    return path, recorded.stdout
+
+
+def test_replay(trace):
+    path, output = trace
+    replayed = run(SESSION, PYTSS_BACKEND='replay', PYTSS_REPLAY=path)
+    assert replayed.returncode == 0, replayed.stderr
+    assert replayed.stdout == output
+    assert output.splitlines()[-1] == "b'secret'"
+
+
+def test_divergence_raises(trace):
+    path, output = trace
+    replayed = run(DIVERGING, PYTSS_BACKEND='replay', PYTSS_REPLAY=path)
+    assert replayed.returncode != 0
+    assert 'ReplayError' in replayed.stderr
+    assert replayed.stdout == ''
+
+
+def test_trace_format():
+    calls = [
+        tracing.TraceCall('Tspi_TPM_GetRandom', 0, 1234,
+                          (1, 16, b'0123456789abcdef')),
+        tracing.TraceCall('Tspi_TPM_Quote', 0x3001, 5,
+                          (tracing.UNTOUCHED, None, (1, (2, 3), b'data'),
+                           [(4,), (5,)])),
+    ]
+    dst = io.BytesIO()
+    writer = tracing.TraceWriter(dst)
+    for call in calls:
+        writer.write(call)
+    writer.write(calls[0])
+    dst.seek(0)
+    assert list(tracing.read_trace(dst)) == calls + calls[:1]
+
+    with pytest.raises(ValueError):
+        list(tracing.read_trace(io.BytesIO(dst.getvalue()[:-1])))
+    with pytest.raises(ValueError):
+        list(tracing.read_trace(io.BytesIO(b'not a trace')))
+
+
+def test_replay_past_the_end():
+    replay = tracing.ReplayTspi(ffi, [])
+    assert replay.Tspi_Context_FreeMemory(1, ffi.NULL) == 0
+    with pytest.raises(tracing.ReplayError):
+        replay.Tspi_TPM_GetRandom(1, 16, ffi.new('BYTE **'))